@@ -4,12 +4,53 @@ import ChatSidebar from "./components/ChatSidebar.jsx";
 import ChatWindow from "./components/ChatWindow.jsx";
 import { apiFetch } from "./utils/api.js";
 
+const POLL_WAIT_SECONDS = 25; // 长轮询每次最多等待的秒数（服务端上限 30）
+const POLL_MAX_ERRORS = 3; // 轮询连续出错这么多次后放弃
+const SEND_MAX_ATTEMPTS = 3; // 提交遇到网络错误或 5xx 时的最多尝试次数
+
+// 提交一轮对话；网络错误或 5xx 时用同一个 request_id 重发，服务端已收到的话返回原来那一轮，不会重复排队
+async function submitTurn(chatId, text, requestId) {
+  for (let attempt = 1; ; attempt++) {
+    try {
+      const res = await apiFetch("chat/send", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ session_id: chatId, question: text, request_id: requestId }),
+      });
+      if (res.status < 500 || attempt >= SEND_MAX_ATTEMPTS) return res;
+    } catch (e) {
+      if (attempt >= SEND_MAX_ATTEMPTS) throw e;
+    }
+    await new Promise((resolve) => setTimeout(resolve, 1000 * attempt));
+  }
+}
+
+// 发送后服务端只返回 message_id，回答由后台任务生成，这里长轮询直到完成或失败
+async function waitForReply(messageId) {
+  let errors = 0;
+  for (;;) {
+    try {
+      const res = await apiFetch(`chat/message/${messageId}?wait=${POLL_WAIT_SECONDS}`);
+      if (!res.ok) throw new Error(res.status);
+      const data = await res.json();
+      if (data.status === "done" || data.status === "failed") return data;
+      errors = 0;
+    } catch (e) {
+      errors += 1;
+      if (errors >= POLL_MAX_ERRORS) throw e;
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+    }
+  }
+}
+
 export default function App() {
   const [chats, setChats] = useState([]);
   const [currentIdx, setCurrentIdx] = useState(null);
   const [loadingList, setLoadingList] = useState(true);
   const [loadingMap, setLoadingMap] = useState({});
   const activeSessionId = useRef(null);
+  // 每个会话上一轮没拿到结果的提交 {text, requestId}：用户重发同一问题时沿用原 request_id
+  const unconfirmedTurns = useRef({});
 
   useEffect(() => {
     apiFetch("chat/list")
@@ -80,6 +121,11 @@ export default function App() {
 
     setLoadingMap((m) => ({ ...m, [chatId]: true }));
 
+    // request_id 每轮只生成一次，是服务端的幂等键
+    const unconfirmed = unconfirmedTurns.current[chatId];
+    const requestId = unconfirmed && unconfirmed.text === text ? unconfirmed.requestId : uuidv4();
+    unconfirmedTurns.current[chatId] = { text, requestId };
+
     setChats((prev) => {
       const newChats = [...prev];
       newChats[idx].messages = [
@@ -91,13 +137,11 @@ export default function App() {
     });
 
     try {
-      const res = await apiFetch("chat/send", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ session_id: chatId, question: text }),
-      });
+      const res = await submitTurn(chatId, text, requestId);
 
       if (res.status === 429) {
+        // 被拒绝的提交服务端没有记录，下次发送是新的一轮
+        delete unconfirmedTurns.current[chatId];
         const err = await res.json();
         alert(err.error);
         setChats((prev) => {
@@ -110,7 +154,9 @@ export default function App() {
       } else if (!res.ok) {
         throw new Error(res.status);
       } else {
-        const data = await res.json();
+        const submitted = await res.json();
+        const data = await waitForReply(submitted.message_id);
+        delete unconfirmedTurns.current[chatId];
         setChats((prev) => {
           const newChats = [...prev];
           const targetIdx = newChats.findIndex((c) => c.id === chatId);
@@ -1,11 +1,56 @@
+import json
 import sqlite3
+import sys
+import threading
 import time
-from flask import Flask, request, jsonify, g
-from graph2.graph_2 import graph  # 你的工作流graph对象
-from flask_cors import CORS
+import uuid
+from contextlib import contextmanager
+from utils.startup import all_ready, startup_phase, startup_report, warm_up
+with startup_phase("import flask"):
+    from flask import Flask, request, jsonify, g, Response
+    from flask_cors import CORS
+with startup_phase("import graph2"):
+    # 只构建工作流；Milvus 连接和 bge 模型延迟到预热或第一次使用时
+    from graph2.graph_2 import workflow  # 你的工作流
+from graph2.budget import budget_inputs, track_llm_calls
+from graph2.chat_history import HISTORY_MAX_TURNS, summarize_history
+from graph2.checkpointer import checkpoint_thread_id, delete_checkpoints, sqlite_checkpointer
+from llm_models.embeddings_model import bge_model
+from utils.env_utils import CHAT_WORKERS, EMBEDDING_BACKEND
+from utils.log_utils import log
+from utils.memory_report import process_memory
+from utils.tracing import LLMTraceHandler, metrics, start_trace
 app = Flask(__name__)
 CORS(app)
 DB_PATH = 'chat_sessions.db'
+_folding_chats = set()
+_folding_lock = threading.Lock()
+# 带检查点的工作流：每个节点完成后落盘，中断的请求重试时从断点继续
+with startup_phase("compile graph"):
+    checkpointer = sqlite_checkpointer()
+    graph = workflow.compile(checkpointer=checkpointer)
+
+WARM_UP_RETRY_SECONDS = 10  # 预热失败（如 Milvus 连不上）后重试的间隔
+_warm_up_started = False
+_warm_up_lock = threading.Lock()
+
+# 对话任务队列：chat_runs 表就是持久化的队列，每个进程起 CHAT_WORKERS 个线程认领执行
+CHAT_QUEUE_MAX_PENDING = 200  # 排队中的任务超过这个数时拒绝新提交（429）
+CHAT_QUEUE_POLL_SECONDS = 1.0  # 空闲时查一次队列的间隔（其他进程提交的任务靠它发现）
+CHAT_RUN_LEASE_SECONDS = 300  # running 超过这么久没有续约视为进程已退出，任务可被重新认领
+CHAT_RUN_HEARTBEAT_SECONDS = 30  # 执行中的任务每隔这么久续约一次
+CHAT_RUN_MAX_SECONDS = 900  # 一次执行超过这么久（如 LLM 调用卡死）不再续约，租约到期后由其他线程接手
+CHAT_RUN_MAX_ATTEMPTS = 2
+CHAT_RUN_RETRY_BACKOFF_SECONDS = 10  # 执行出错后等这么久再重试，之后每次翻倍；给 Milvus / LLM 的短暂故障留出恢复时间
+CHAT_POLL_MAX_WAIT = 30  # 轮询接口 wait 参数的上限（秒）
+CHAT_FAILED_MESSAGE = "很抱歉，处理这个问题时出错了，请稍后重试。"
+_chat_workers = []
+_chat_workers_lock = threading.Lock()
+_chat_queue_cond = threading.Condition()  # 有新任务时唤醒工作线程
+_chat_done_cond = threading.Condition()  # 有任务完成时唤醒长轮询
+
+metrics.histogram("rag_chat_queue_seconds", "对话任务从提交到被工作线程认领的等待时间")
+metrics.counter("rag_chat_rejected_total", "队列已满被拒绝的对话提交数")
 
 def get_db():
     db = getattr(g, '_database', None)
@@ -40,6 +85,62 @@ def init_db():
             FOREIGN KEY(chat_id) REFERENCES chats(id)
         )
         ''')
+        # 每个会话的滚动摘要，summarized_upto 为已折叠进摘要的最后一条消息 id
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS chat_summaries (
+            chat_id TEXT PRIMARY KEY,
+            summary TEXT,
+            summarized_upto INTEGER,
+            updated_at INTEGER,
+            FOREIGN KEY(chat_id) REFERENCES chats(id)
+        )
+        ''')
+        # 每一轮对话的执行记录，同时是持久化的任务队列：(chat_id, request_id) 为客户端的幂等键（没传时用检查点 thread_id），
+        # placeholder_id（助手占位消息 id）唯一标识一轮；
+        # status 为 queued / running / interrupted / done / failed，未完成的轮次重新执行时从检查点继续
+        chat_runs_ddl = '''
+        CREATE TABLE IF NOT EXISTS chat_runs (
+            chat_id TEXT,
+            request_id TEXT,
+            question TEXT,
+            user_message_id INTEGER,
+            placeholder_id INTEGER,
+            status TEXT,
+            created_at INTEGER,
+            updated_at INTEGER,
+            attempts INTEGER DEFAULT 0,
+            trace TEXT,
+            error TEXT,
+            not_before INTEGER,
+            lease_owner TEXT,
+            PRIMARY KEY (chat_id, request_id),
+            FOREIGN KEY(chat_id) REFERENCES chats(id)
+        )
+        '''
+        # 旧库的主键只有 request_id（不同会话复用同一个 request_id 会冲突），按新表结构重建并复制已有的列
+        c.execute('PRAGMA table_info(chat_runs)')
+        primary_key = [row["name"] for row in c.fetchall() if row["pk"]]
+        if primary_key == ["request_id"]:
+            c.execute('ALTER TABLE chat_runs RENAME TO chat_runs_old')
+            c.execute('DROP INDEX IF EXISTS idx_chat_runs_status')
+            c.execute('DROP INDEX IF EXISTS idx_chat_runs_placeholder')
+            c.execute(chat_runs_ddl)
+            c.execute('PRAGMA table_info(chat_runs)')
+            new_columns = [row["name"] for row in c.fetchall()]
+            c.execute('PRAGMA table_info(chat_runs_old)')
+            old_columns = {row["name"] for row in c.fetchall()}
+            shared = ", ".join(col for col in new_columns if col in old_columns)
+            c.execute(f'INSERT INTO chat_runs ({shared}) SELECT {shared} FROM chat_runs_old')
+            c.execute('DROP TABLE chat_runs_old')
+        c.execute(chat_runs_ddl)
+        # 旧库补列：出错后最早可以重试的时间、当前持有租约的执行者
+        c.execute('PRAGMA table_info(chat_runs)')
+        columns = {row["name"] for row in c.fetchall()}
+        for column, ddl in (("not_before", "INTEGER"), ("lease_owner", "TEXT")):
+            if column not in columns:
+                c.execute(f'ALTER TABLE chat_runs ADD COLUMN {column} {ddl}')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_chat_runs_status ON chat_runs (status, created_at)')
+        c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_chat_runs_placeholder ON chat_runs (placeholder_id)')
         db.commit()
 
 def load_chat_history(chat_id):
@@ -49,6 +150,61 @@ def load_chat_history(chat_id):
     rows = c.fetchall()
     return [{"type": row["type"], "content": row["content"]} for row in rows]
 
+def load_prompt_history(chat_id, before_id=None):
+    """
+    工作流用的历史：会话摘要 + 尚未折叠进摘要的消息（正常情况下只有最近几轮）。
+    before_id 指定时只取这条消息之前的（即这一轮提问之前的历史）。
+    完整历史仍由 load_chat_history 提供给前端展示
+    """
+    db = get_db()
+    c = db.cursor()
+    c.execute('SELECT summary, summarized_upto FROM chat_summaries WHERE chat_id = ?', (chat_id,))
+    row = c.fetchone()
+    summary, upto = (row["summary"], row["summarized_upto"]) if row else (None, 0)
+    c.execute(
+        "SELECT type, content FROM messages WHERE chat_id = ? AND id > ? AND id < ? AND content != '...' ORDER BY id ASC",
+        (chat_id, upto, before_id if before_id is not None else sys.maxsize)
+    )
+    rows = c.fetchall()
+    return summary, [{"type": row["type"], "content": row["content"]} for row in rows]
+
+def fold_chat_history(chat_id):
+    """
+    把超出最近 HISTORY_MAX_TURNS 轮的消息增量合并进摘要并持久化，下一轮不必重新总结。
+    在后台线程里执行，使用独立的数据库连接；同一会话同时只有一个线程在折叠
+    """
+    with _folding_lock:
+        if chat_id in _folding_chats:
+            return
+        _folding_chats.add(chat_id)
+    db = sqlite3.connect(DB_PATH)
+    db.row_factory = sqlite3.Row
+    try:
+        c = db.cursor()
+        c.execute('SELECT summary, summarized_upto FROM chat_summaries WHERE chat_id = ?', (chat_id,))
+        row = c.fetchone()
+        summary, upto = (row["summary"], row["summarized_upto"]) if row else (None, 0)
+        c.execute(
+            "SELECT id, type, content FROM messages WHERE chat_id = ? AND id > ? AND content != '...' ORDER BY id ASC",
+            (chat_id, upto)
+        )
+        rows = c.fetchall()
+        evicted = rows[:-HISTORY_MAX_TURNS * 2]
+        if not evicted:
+            return
+        summary = summarize_history(summary, [{"type": r["type"], "content": r["content"]} for r in evicted])
+        c.execute(
+            'INSERT OR REPLACE INTO chat_summaries (chat_id, summary, summarized_upto, updated_at) VALUES (?, ?, ?, ?)',
+            (chat_id, summary, evicted[-1]["id"], int(time.time()))
+        )
+        db.commit()
+    except Exception as e:
+        log.warning(f"会话 {chat_id} 摘要更新失败，下轮重试: {e!r}")
+    finally:
+        db.close()
+        with _folding_lock:
+            _folding_chats.discard(chat_id)
+
 def save_chat_message(chat_id, msg_type, content):
     db = get_db()
     c = db.cursor()
@@ -58,6 +214,230 @@ def save_chat_message(chat_id, msg_type, content):
         (chat_id, msg_type, content, now)
     )
     db.commit()
+    return c.lastrowid
+
+def find_resumable_run(chat_id, request_id):
+    """
+    按客户端的幂等键 (chat_id, request_id) 找出这次提交对应的已有轮次（浏览器断线后重发）。
+    没带 request_id 的提交一律视为新的一轮：同一问题连发两次、或“继续”这类短追问都是正常的新提问
+    """
+    if not request_id:
+        return None
+    c = get_db().cursor()
+    c.execute('SELECT * FROM chat_runs WHERE chat_id = ? AND request_id = ?', (chat_id, request_id))
+    return c.fetchone()
+
+def create_chat_run(chat_id, question, request_id=None):
+    """保存用户消息和“助手正在思考”占位消息，把这一轮加入队列"""
+    user_message_id = save_chat_message(chat_id, "user", question)
+    placeholder_id = save_chat_message(chat_id, "assistant", "...")
+    db = get_db()
+    now = int(time.time())
+    try:
+        db.execute(
+            'INSERT INTO chat_runs (chat_id, request_id, question, user_message_id, placeholder_id, status, attempts, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (chat_id, request_id or checkpoint_thread_id(chat_id, placeholder_id), question,
+             user_message_id, placeholder_id, "queued", 0, now, now)
+        )
+        db.commit()
+    except sqlite3.IntegrityError:
+        # 同一个 request_id 的并发重发，另一个请求先插入了：撤掉这次的两条消息，返回已有的那一轮
+        db.rollback()
+        existing = find_resumable_run(chat_id, request_id)
+        if existing is None:
+            raise
+        db.execute('DELETE FROM messages WHERE id IN (?, ?)', (user_message_id, placeholder_id))
+        db.commit()
+        return existing
+    with _chat_queue_cond:
+        _chat_queue_cond.notify()
+    return load_chat_run(placeholder_id)
+
+def load_chat_run(placeholder_id):
+    c = get_db().cursor()
+    c.execute('SELECT * FROM chat_runs WHERE placeholder_id = ?', (placeholder_id,))
+    return c.fetchone()
+
+def count_pending_runs():
+    c = get_db().cursor()
+    c.execute("SELECT COUNT(*) FROM chat_runs WHERE status IN ('queued', 'interrupted')")
+    return c.fetchone()[0]
+
+def claim_next_run():
+    """
+    认领最早的待执行任务：排队中的、上次执行出错且已过退避时间的、以及 running 但租约已过期（所在进程已退出）的。
+    BEGIN IMMEDIATE 保证多个进程/线程不会认领到同一个任务；每次认领生成新的 lease_owner，
+    之前的执行者即使还活着，也无法再续约或写回结果
+    """
+    db = get_db()
+    c = db.cursor()
+    now = int(time.time())
+    c.execute('BEGIN IMMEDIATE')
+    c.execute(
+        "SELECT * FROM chat_runs WHERE status = 'queued' OR (status = 'interrupted' AND COALESCE(not_before, 0) <= ?) "
+        "OR (status = 'running' AND updated_at < ?) "
+        "ORDER BY created_at ASC, placeholder_id ASC LIMIT 1",
+        (now, now - CHAT_RUN_LEASE_SECONDS)
+    )
+    run = c.fetchone()
+    if run is None:
+        db.commit()
+        return None
+    c.execute("UPDATE chat_runs SET status = 'running', attempts = attempts + 1, lease_owner = ?, updated_at = ? "
+              "WHERE placeholder_id = ?",
+              (uuid.uuid4().hex, now, run["placeholder_id"]))
+    db.commit()
+    if run["status"] == "queued":
+        metrics.observe("rag_chat_queue_seconds", max(0, time.time() - run["created_at"]))
+    return load_chat_run(run["placeholder_id"])
+
+def _renew_lease(run, stop):
+    """续约线程：定期刷新 updated_at，租约被其他执行者接手或超过 CHAT_RUN_MAX_SECONDS 时停止"""
+    thread_id = checkpoint_thread_id(run["chat_id"], run["placeholder_id"])
+    started = time.time()
+    db = sqlite3.connect(DB_PATH)
+    try:
+        while not stop.wait(CHAT_RUN_HEARTBEAT_SECONDS):
+            if time.time() - started > CHAT_RUN_MAX_SECONDS:
+                log.error(f"{thread_id} 执行超过 {CHAT_RUN_MAX_SECONDS}s，停止续约")
+                return
+            try:
+                renewed = db.execute(
+                    "UPDATE chat_runs SET updated_at = ? WHERE placeholder_id = ? AND lease_owner = ? AND status = 'running'",
+                    (int(time.time()), run["placeholder_id"], run["lease_owner"])
+                ).rowcount
+                db.commit()
+            except sqlite3.Error as e:
+                log.warning(f"{thread_id} 续约失败，下次重试: {e!r}")
+                continue
+            if not renewed:
+                log.warning(f"{thread_id} 租约已被其他执行者接手，停止续约")
+                return
+    finally:
+        db.close()
+
+@contextmanager
+def hold_lease(run):
+    """执行期间在后台续约，避免耗时长的任务被当成进程已退出而重复执行"""
+    stop = threading.Event()
+    renewer = threading.Thread(target=_renew_lease, args=(run, stop), name="chat-lease", daemon=True)
+    renewer.start()
+    try:
+        yield
+    finally:
+        stop.set()
+
+def finish_chat_run(run, status, reply, trace=None, error=None):
+    """
+    写回占位消息，更新任务状态，唤醒在等这条消息的长轮询。
+    只有仍持有租约时才写入；租约已被接手（本次执行超时）时返回 False，结果以接手的执行为准
+    """
+    db = get_db()
+    owned = db.execute(
+        'UPDATE chat_runs SET status = ?, trace = ?, error = ?, updated_at = ? WHERE placeholder_id = ? AND lease_owner = ?',
+        (status, json.dumps(trace, ensure_ascii=False) if trace else None, error,
+         int(time.time()), run["placeholder_id"], run["lease_owner"])
+    ).rowcount
+    if not owned:
+        db.rollback()
+        log.warning(f"会话 {run['chat_id']} 消息 {run['placeholder_id']} 的租约已被接手，丢弃本次结果")
+        return False
+    db.execute('UPDATE messages SET content = ? WHERE id = ?', (reply, run["placeholder_id"]))
+    db.commit()
+    with _chat_done_cond:
+        _chat_done_cond.notify_all()
+    return True
+
+def execute_chat_run(run):
+    """
+    执行（或继续）一轮对话，返回 (回答, trace)。
+    有检查点时从最后完成的节点继续，按这次执行重新计算预算；否则从头执行
+    """
+    thread_id = checkpoint_thread_id(run["chat_id"], run["placeholder_id"])
+    config = {"configurable": {"thread_id": thread_id}, "recursion_limit": 50}
+    snapshot = graph.get_state(config)
+    # 检查点里的 deadline 是原请求的，继续执行时用新的预算（不用 update_state 改状态：那会重跑条件边里的 LLM 评分）
+    resume_budget = budget_inputs() if snapshot.values else None
+    # 记录每个节点和每次 LLM 调用的耗时；超出时长或 LLM 调用预算时返回目前最好的回答
+    with start_trace("chat") as trace, track_llm_calls(resume_budget) as llm_calls:
+        config["callbacks"] = [LLMTraceHandler(trace), llm_calls]
+        if not snapshot.values:
+            history_summary, chat_history = load_prompt_history(run["chat_id"], before_id=run["user_message_id"])
+            inputs = {"question": run["question"], "chat_history": chat_history,
+                      "history_summary": history_summary, **budget_inputs()}
+            for _ in graph.stream(inputs, config):
+                pass
+        elif snapshot.next:
+            log.info(f"{thread_id} 从检查点继续，下一个节点: {snapshot.next}")
+            for _ in graph.stream(None, config):
+                pass
+        final_state = graph.get_state(config).values
+    return final_state.get("generation", ""), trace.to_dict()
+
+def process_chat_run(run):
+    """工作线程执行一个任务：成功后删除检查点；出错时保留检查点，未超过次数则放回队列"""
+    thread_id = checkpoint_thread_id(run["chat_id"], run["placeholder_id"])
+    try:
+        with hold_lease(run):
+            reply, trace = execute_chat_run(run)
+    except Exception as e:
+        if run["attempts"] < CHAT_RUN_MAX_ATTEMPTS:
+            backoff = CHAT_RUN_RETRY_BACKOFF_SECONDS * 2 ** (run["attempts"] - 1)
+            log.warning(f"{thread_id} 第 {run['attempts']} 次执行失败，{backoff}s 后从检查点重试: {e!r}")
+            now = int(time.time())
+            db = get_db()
+            db.execute("UPDATE chat_runs SET status = 'interrupted', error = ?, not_before = ?, updated_at = ? "
+                       "WHERE placeholder_id = ? AND lease_owner = ?",
+                       (repr(e), now + backoff, now, run["placeholder_id"], run["lease_owner"]))
+            db.commit()
+        else:
+            log.error(f"{thread_id} 执行 {run['attempts']} 次均失败: {e!r}")
+            if finish_chat_run(run, "failed", CHAT_FAILED_MESSAGE, error=repr(e)):
+                delete_checkpoints(checkpointer, thread_id=thread_id)
+        return
+    # 回答已经落到消息表，检查点不再需要；租约已被接手时检查点归接手的执行使用，不删除
+    if not finish_chat_run(run, "done", reply, trace=trace):
+        return
+    delete_checkpoints(checkpointer, thread_id=thread_id)
+    # 超出窗口的旧消息在后台折叠进摘要
+    threading.Thread(target=fold_chat_history, args=(run["chat_id"],), daemon=True).start()
+
+def chat_worker():
+    while True:
+        try:
+            with app.app_context():
+                run = claim_next_run()
+                if run is not None:
+                    process_chat_run(run)
+                    continue
+        except Exception as e:
+            log.exception(f"对话任务工作线程出错: {e!r}")
+        with _chat_queue_cond:
+            _chat_queue_cond.wait(timeout=CHAT_QUEUE_POLL_SECONDS)
+
+def ensure_chat_workers():
+    """在本进程第一次处理请求时启动工作线程（gunicorn 每个 worker 进程各有一组）"""
+    if len(_chat_workers) >= CHAT_WORKERS:
+        return
+    with _chat_workers_lock:
+        if not _chat_workers:
+            init_db()  # gunicorn 不会执行 __main__，建表放在这里保证队列表存在
+        while len(_chat_workers) < CHAT_WORKERS:
+            worker = threading.Thread(target=chat_worker, name=f"chat-worker-{len(_chat_workers)}", daemon=True)
+            worker.start()
+            _chat_workers.append(worker)
+
+def chat_run_status(run, with_trace=False):
+    result = {"message_id": run["placeholder_id"], "request_id": run["request_id"], "status": run["status"]}
+    if run["status"] in ("done", "failed"):
+        c = get_db().cursor()
+        c.execute('SELECT content FROM messages WHERE id = ?', (run["placeholder_id"],))
+        row = c.fetchone()
+        result["reply"] = row["content"] if row else ""
+        if with_trace and run["trace"]:
+            result["trace"] = json.loads(run["trace"])
+    return result
 
 def ensure_chat_exists(chat_id):
     db = get_db()
@@ -110,50 +490,109 @@ def api_chat_detail(chat_id):
         "chat_history": chat_history
     })
 
+def _warm_up_until_ready():
+    while not warm_up():
+        log.warning(f"部分资源未就绪，{WARM_UP_RETRY_SECONDS}s 后重试: {startup_report()['resources']}")
+        time.sleep(WARM_UP_RETRY_SECONDS)
+    log.info(f"预热完成: {startup_report()}")
+
+def ensure_warm_up():
+    """在后台线程预热模型和 Milvus 连接，不阻塞服务启动；就绪前 /readyz 返回 503"""
+    global _warm_up_started
+    if _warm_up_started:
+        return
+    with _warm_up_lock:
+        if not _warm_up_started:
+            threading.Thread(target=_warm_up_until_ready, name="warm-up", daemon=True).start()
+            _warm_up_started = True
+
+def preload_for_fork():
+    """
+    gunicorn 主进程 fork worker 之前调用（gunicorn.conf.py）：建表、加载 embedding 模型权重，
+    各 worker 写时复制共享这部分内存。只加载不推理，也不连 Milvus——线程池和网络连接不能跨 fork 继承
+    """
+    init_db()
+    if EMBEDDING_BACKEND == 'torch':
+        bge_model.get()
+    else:
+        # onnxruntime 创建 session 时就会起线程池，fork 后的子进程里不可用，只能各 worker 自己加载
+        log.info(f"embedding 后端 {EMBEDDING_BACKEND} 不在主进程预加载")
+
+def reset_after_fork():
+    """worker fork 之后调用：检查点的 SQLite 连接不能和主进程共用，重新打开"""
+    global checkpointer, graph
+    checkpointer = sqlite_checkpointer()
+    graph = workflow.compile(checkpointer=checkpointer)
+
+@app.before_request
+def start_chat_workers():
+    ensure_warm_up()
+    ensure_chat_workers()
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """存活探针：进程能处理请求即可，不检查依赖"""
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """就绪探针：embedding 模型、Milvus 等资源都已初始化才返回 200，附带启动耗时分解"""
+    report = startup_report()
+    report["chat_workers"] = len(_chat_workers)
+    report["memory"] = process_memory()
+    report["status"] = "ready" if all_ready() else "warming_up"
+    return jsonify(report), 200 if all_ready() else 503
+
 @app.route("/api/chat/send", methods=["POST"])
 def api_chat_send():
+    """
+    提交一轮对话，立即返回 message_id（助手占位消息的 id），由工作线程执行工作流；
+    客户端用 /api/chat/message/<message_id> 轮询结果
+    """
     data = request.json
     session_id = data.get("session_id", "default")
     question = data.get("question")
     if not question:
         return jsonify({"error": "question is required"}), 400
 
-    ensure_chat_exists(session_id)
-    chat_history = load_chat_history(session_id)
-
-    # 保存用户消息
-    save_chat_message(session_id, "user", question)
-
-    # 保存“助手正在思考”占位消息
-    db = get_db()
-    c = db.cursor()
-    now = int(time.time())
-    c.execute(
-        'INSERT INTO messages (chat_id, type, content, created_at) VALUES (?, ?, ?, ?)',
-        (session_id, "assistant", "...", now)
-    )
-    placeholder_id = c.lastrowid
-    db.commit()
+    request_id = data.get("request_id")  # 可选的幂等键，客户端重试时带上同一个值
 
-    # 执行工作流
-    inputs = {"question": question, "chat_history": chat_history}
-    final_state = None
-    for output in graph.stream(inputs, {"recursion_limit": 50}):
-        final_state = list(output.values())[-1]
+    ensure_chat_exists(session_id)
+    run = find_resumable_run(session_id, request_id)
+    if run is not None:
+        # 重复提交：已完成的直接返回结果，未完成的继续等原来那一轮
+        log.info(f"会话 {session_id} 的请求是重复提交，对应消息 {run['placeholder_id']}")
+        if run["status"] == "interrupted":
+            with _chat_queue_cond:
+                _chat_queue_cond.notify()
+        return jsonify(chat_run_status(run, with_trace=bool(data.get("trace"))))
 
-    # 替换助手占位消息为真实回复
-    if "generation" in final_state:
-        c.execute(
-            'UPDATE messages SET content = ? WHERE id = ?',
-            (final_state["generation"], placeholder_id)
-        )
-        db.commit()
+    if count_pending_runs() >= CHAT_QUEUE_MAX_PENDING:
+        metrics.inc("rag_chat_rejected_total")
+        return jsonify({"error": "too many pending requests"}), 429, {"Retry-After": "5"}
+    run = create_chat_run(session_id, question, request_id)
+    return jsonify(chat_run_status(run)), 202
 
-    new_history = load_chat_history(session_id)
-    return jsonify({
-        "reply": final_state.get("generation", ""),
-        "chat_history": new_history
-    })
+@app.route("/api/chat/message/<int:message_id>", methods=["GET"])
+def api_chat_message(message_id):
+    """
+    查询一轮对话的状态和结果。wait=N 时最多阻塞 N 秒等它完成（长轮询）；trace=1 时附带执行 trace
+    """
+    wait = min(request.args.get("wait", 0, type=float), CHAT_POLL_MAX_WAIT)
+    with_trace = request.args.get("trace") in ("1", "true")
+    deadline = time.time() + wait
+    while True:
+        c = get_db().cursor()
+        c.execute('SELECT * FROM chat_runs WHERE placeholder_id = ?', (message_id,))
+        run = c.fetchone()
+        if run is None:
+            return jsonify({"error": "message not found"}), 404
+        remaining = deadline - time.time()
+        if run["status"] in ("done", "failed") or remaining <= 0:
+            return jsonify(chat_run_status(run, with_trace=with_trace))
+        # 其他进程完成的任务收不到通知，最多等一个轮询间隔再查一次
+        with _chat_done_cond:
+            _chat_done_cond.wait(timeout=min(remaining, CHAT_QUEUE_POLL_SECONDS))
 
 @app.route("/api/chat/<chat_id>", methods=["DELETE"])
 def api_chat_delete(chat_id):
@@ -163,10 +602,23 @@ def api_chat_delete(chat_id):
     db = get_db()
     c = db.cursor()
     c.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+    c.execute("DELETE FROM chat_summaries WHERE chat_id = ?", (chat_id,))
+    c.execute("DELETE FROM chat_runs WHERE chat_id = ?", (chat_id,))
     c.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
     db.commit()
+    delete_checkpoints(checkpointer, chat_id=chat_id)
     return jsonify({"status": "success", "deleted_chat_id": chat_id})
 
+@app.route("/api/metrics", methods=["GET"])
+def api_metrics():
+    """
+    Prometheus 文本格式的指标：请求/节点/LLM 调用耗时直方图、token 数、循环计数。
+    gunicorn 多 worker 时每个 worker 各自统计，抓取到的是处理该请求的 worker 的数据
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     init_db()
+    ensure_warm_up()
+    ensure_chat_workers()
     app.run(host="0.0.0.0", port=8001)
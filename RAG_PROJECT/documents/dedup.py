@@ -0,0 +1,229 @@
+import itertools
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import xxhash
+from langchain_core.documents import Document
+
+# 论文签名和 chunk 指纹落盘的位置，下一次入库时加载，跨运行去重；重建 collection 时用 clear_dedup_index 清空
+DEDUP_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "dedup_index.db")
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+|[\u4e00-\u9fff]')
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+
+
+def shingles(text: str, size: int = 3) -> List[str]:
+    """英文按单词、中文按单字切 token，再取连续 size 个 token 作为 shingle"""
+    tokens = _TOKEN_RE.findall(text.lower())
+    if len(tokens) <= size:
+        return [' '.join(tokens)] if tokens else []
+    return [' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+
+
+class MinHashLSH:
+    """论文级近重复检测：MinHash 签名 + LSH 分桶，估计 Jaccard 相似度"""
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, threshold: float = 0.8, seed: int = 1):
+        assert num_perm % bands == 0, "num_perm 必须能被 bands 整除"
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self.buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+        self.signatures: Dict[str, np.ndarray] = {}
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        grams = set(shingles(text))
+        if not grams:
+            return None
+        hashes = np.fromiter((xxhash.xxh32_intdigest(g.encode()) for g in grams), dtype=np.uint64, count=len(grams))
+        # (a * h + b) mod p，uint64 溢出回绕不影响作为哈希使用
+        perm = (np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME & _MAX_HASH
+        return perm.min(axis=0)
+
+    def _band_keys(self, sig: np.ndarray) -> Iterator[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, sig[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def query(self, sig: np.ndarray) -> Optional[str]:
+        """返回已收录的相似文本 key，没有则返回 None"""
+        checked = set()
+        for band, key in self._band_keys(sig):
+            for candidate in self.buckets[band].get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if np.mean(self.signatures[candidate] == sig) >= self.threshold:
+                    return candidate
+        return None
+
+    def insert(self, key: str, sig: np.ndarray):
+        self.signatures[key] = sig
+        for band, band_key in self._band_keys(sig):
+            self.buckets[band].setdefault(band_key, []).append(key)
+
+
+class SimHashIndex:
+    """chunk 级近重复检测：64 位 SimHash，海明距离 <= max_distance 视为重复"""
+
+    def __init__(self, max_distance: int = 3):
+        # 按鸽巢原理把指纹切成 max_distance+1 段，距离在阈值内的两个指纹至少有一段完全相同
+        self.max_distance = max_distance
+        self.parts = max_distance + 1
+        self.part_bits = 64 // self.parts
+        self.tables: List[Dict[int, List[int]]] = [{} for _ in range(self.parts)]
+
+    @staticmethod
+    def fingerprint(text: str) -> Optional[int]:
+        grams = shingles(text)
+        if not grams:
+            return None
+        hashes = np.fromiter((xxhash.xxh64_intdigest(g.encode()) for g in grams), dtype=np.uint64, count=len(grams))
+        bits = (hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)
+        # 每一位上 1 多于 0 则该位取 1
+        votes = bits.sum(axis=0) * 2 > len(grams)
+        return sum(1 << bit for bit in np.flatnonzero(votes).tolist())
+
+    def _part_keys(self, fp: int) -> Iterator[Tuple[int, int]]:
+        mask = (1 << self.part_bits) - 1
+        for i in range(self.parts):
+            yield i, fp >> (i * self.part_bits) & mask
+
+    def contains(self, fp: int) -> bool:
+        for i, key in self._part_keys(fp):
+            for other in self.tables[i].get(key, ()):
+                if bin(fp ^ other).count('1') <= self.max_distance:
+                    return True
+        return False
+
+    def add(self, fp: int):
+        for i, key in self._part_keys(fp):
+            self.tables[i].setdefault(key, []).append(fp)
+
+
+def _to_sqlite_int(fp: int) -> int:
+    """SQLite INTEGER 是有符号 64 位，无符号指纹按补码存"""
+    return fp - (1 << 64) if fp >= 1 << 63 else fp
+
+
+class DedupStore:
+    """已收录论文的 MinHash 签名和 chunk 的 SimHash 指纹，SQLite 持久化"""
+
+    def __init__(self, db_path: str = DEDUP_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db = sqlite3.connect(db_path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''
+        CREATE TABLE IF NOT EXISTS papers (
+            key TEXT PRIMARY KEY,
+            signature BLOB,
+            created_at INTEGER
+        )
+        ''')
+        self.db.execute('CREATE TABLE IF NOT EXISTS chunks (fingerprint INTEGER PRIMARY KEY)')
+        self.db.commit()
+
+    def papers(self) -> Iterator[Tuple[str, np.ndarray]]:
+        for key, blob in self.db.execute('SELECT key, signature FROM papers ORDER BY created_at'):
+            yield key, np.frombuffer(blob, dtype=np.uint64)
+
+    def chunks(self) -> Iterator[int]:
+        for (fp,) in self.db.execute('SELECT fingerprint FROM chunks'):
+            yield fp & ((1 << 64) - 1)
+
+    def add_paper(self, key: str, sig: np.ndarray):
+        self.db.execute('INSERT OR REPLACE INTO papers (key, signature, created_at) VALUES (?, ?, ?)',
+                        (key, sig.astype(np.uint64).tobytes(), int(time.time())))
+        self.db.commit()
+
+    def add_chunk(self, fp: int):
+        self.db.execute('INSERT OR IGNORE INTO chunks (fingerprint) VALUES (?)', (_to_sqlite_int(fp),))
+        self.db.commit()
+
+    def clear(self):
+        self.db.execute('DELETE FROM papers')
+        self.db.execute('DELETE FROM chunks')
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def clear_dedup_index(db_path: str = DEDUP_DB):
+    """collection 重建（旧向量被删除）时调用，否则重新入库的论文会被当成重复跳过"""
+    if os.path.exists(db_path):
+        store = DedupStore(db_path)
+        store.clear()
+        store.close()
+
+
+class NearDuplicateFilter:
+    """
+    入库前的去重：重复论文整篇跳过，重复 chunk（模板段落、同一论文的另一个版本）不再向量化和写入。
+    db_path 不为 None 时，收录的签名和指纹写入 SQLite，构造时加载之前运行收录的，不同批次下载的重复论文也能识别
+    """
+
+    def __init__(self, paper_threshold: float = 0.8, chunk_max_distance: int = 3, head_chars: int = 8000,
+                 db_path: Optional[str] = DEDUP_DB):
+        self.papers = MinHashLSH(threshold=paper_threshold)
+        self.chunks = SimHashIndex(max_distance=chunk_max_distance)
+        self.head_chars = head_chars
+        self.skipped_papers = 0
+        self.skipped_chunks = 0
+        self.store = DedupStore(db_path) if db_path is not None else None
+        if self.store is not None:
+            for key, sig in self.store.papers():
+                # num_perm 改过的旧签名无法比较，忽略
+                if len(sig) == self.papers.num_perm:
+                    self.papers.insert(key, sig)
+            for fp in self.store.chunks():
+                self.chunks.add(fp)
+
+    def split_head(self, elements: Iterable[Document]) -> Tuple[str, Iterator[Document]]:
+        """读取开头约 head_chars 字符（标题、摘要、引言）作为论文指纹来源，返回的迭代器仍包含这些元素"""
+        elements = iter(elements)
+        head: List[Document] = []
+        size = 0
+        for element in elements:
+            head.append(element)
+            size += len(element.page_content)
+            if size >= self.head_chars:
+                break
+        head_text = "\n".join(element.page_content for element in head)
+        return head_text, itertools.chain(head, elements)
+
+    def is_duplicate_paper(self, key: str, head_text: str) -> Optional[str]:
+        """是重复论文则返回先收录的那篇的 key，否则登记并返回 None"""
+        sig = self.papers.signature(head_text)
+        if sig is None:
+            return None
+        original = self.papers.query(sig)
+        if original is not None:
+            self.skipped_papers += 1
+            return original
+        self.papers.insert(key, sig)
+        if self.store is not None:
+            self.store.add_paper(key, sig)
+        return None
+
+    def is_duplicate_chunk(self, text: str) -> bool:
+        fp = self.chunks.fingerprint(text)
+        if fp is None:
+            return False
+        if self.chunks.contains(fp):
+            self.skipped_chunks += 1
+            return True
+        self.chunks.add(fp)
+        if self.store is not None:
+            self.store.add_chunk(fp)
+        return False
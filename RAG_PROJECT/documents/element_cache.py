@@ -0,0 +1,94 @@
+import io
+import os
+from typing import Iterable, Iterator, Optional
+
+import orjson
+import xxhash
+import zstandard
+from langchain_core.documents import Document
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "pdf_elements")
+CACHE_VERSION = 1
+# 每个元素只缓存切片阶段用得到的字段，文件级的 source/filename 等读取时按当前路径重建
+ELEMENT_FIELDS = ("category", "parent_id", "element_id", "page_number")
+
+
+class ElementCache:
+    """
+    UnstructuredPDFLoader 解析结果的磁盘缓存，按 PDF 内容哈希（xxh3-128）存放。
+    格式是 zstd 压缩的 JSON Lines，每行 [text, category, parent_id, element_id, page_number]，
+    读写都是流式的，调整切片参数后重跑只需解压，不再重新解析 PDF。
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, level: int = 3):
+        self.cache_dir = cache_dir
+        self.level = level
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def file_hash(pdf_path: str) -> str:
+        h = xxhash.xxh3_128()
+        with open(pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.v{CACHE_VERSION}.jsonl.zst")
+
+    @staticmethod
+    def _file_metadata(pdf_path: str) -> dict:
+        return {
+            "source": pdf_path,
+            "filename": os.path.basename(pdf_path),
+            "file_directory": os.path.dirname(pdf_path),
+            "filetype": "application/pdf",
+        }
+
+    def load(self, pdf_path: str, digest: Optional[str] = None) -> Optional[Iterator[Document]]:
+        """命中时返回元素的迭代器，未命中返回 None"""
+        path = self.path_for(digest or self.file_hash(pdf_path))
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._read(path, self._file_metadata(pdf_path))
+
+    @staticmethod
+    def _read(path: str, file_meta: dict) -> Iterator[Document]:
+        with open(path, "rb") as f:
+            reader = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f))
+            for line in reader:
+                text, *values = orjson.loads(line)
+                meta = dict(file_meta)
+                meta.update((k, v) for k, v in zip(ELEMENT_FIELDS, values) if v is not None)
+                yield Document(page_content=text, metadata=meta)
+
+    def store(self, pdf_path: str, elements: Iterable[Document], digest: Optional[str] = None) -> Iterator[Document]:
+        """边产出元素边写缓存；元素全部消费完才原子落盘，中途放弃（如近重复跳过）不留下残缺文件"""
+        path = self.path_for(digest or self.file_hash(pdf_path))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        completed = False
+        try:
+            with open(tmp_path, "wb") as f, \
+                    zstandard.ZstdCompressor(level=self.level).stream_writer(f, closefd=False) as writer:
+                for element in elements:
+                    meta = element.metadata
+                    row = [element.page_content] + [meta.get(k) for k in ELEMENT_FIELDS]
+                    writer.write(orjson.dumps(row) + b"\n")
+                    yield element
+            os.replace(tmp_path, path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_or_parse(self, pdf_path: str, parse) -> Iterator[Document]:
+        """有缓存读缓存，否则调用 parse(pdf_path) 解析并写入缓存"""
+        digest = self.file_hash(pdf_path)
+        cached = self.load(pdf_path, digest)
+        if cached is not None:
+            return cached
+        return self.store(pdf_path, parse(pdf_path), digest)
@@ -0,0 +1,130 @@
+"""
+解析流水线基准测试：用固定随机种子生成一批 PDF，跑 PDFPageChunkParser 的完整流程并记录分阶段耗时。
+结果写到 logs/ingest_benchmark.json，和 logs/ingest_benchmark_baseline.json 对比吞吐，下降超过容忍度时以非 0 退出。
+
+    python -m documents.ingest_benchmark                   # 跑基准并和基线对比
+    python -m documents.ingest_benchmark --update-baseline # 把本次结果保存为新基线
+"""
+import json
+import os
+import random
+import sys
+import textwrap
+import time
+from typing import List
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+
+from documents.pdf_parser import PDFPageChunkParser
+from utils.log_utils import log, log_dir
+from utils.profiler import StageProfiler
+
+SEED = 20240601
+NUM_PDFS = 8
+PAGES_PER_PDF = 12
+SECTIONS_PER_PAGE = 2
+PDF_DIR = os.path.join(log_dir, "ingest_benchmark_pdfs")
+RESULT_FILE = os.path.join(log_dir, "ingest_benchmark.json")
+BASELINE_FILE = os.path.join(log_dir, "ingest_benchmark_baseline.json")
+TOLERANCE = 0.2  # 吞吐下降超过 20% 视为回退
+
+_VOCAB = (
+    "model attention transformer layer token embedding retrieval generation training loss gradient "
+    "dataset benchmark neural network graph node edge policy reward agent language vision encoder "
+    "decoder query key value head residual normalization dropout optimizer learning rate batch "
+    "inference latency throughput memory parameter scaling evaluation accuracy precision recall "
+    "corpus document passage index vector similarity sparse dense hybrid ranking fusion"
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_VOCAB) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+
+def generate_pdfs(pdf_dir: str = PDF_DIR, seed: int = SEED) -> List[str]:
+    """生成固定内容的论文样式 PDF（每页若干个 标题+段落 章节），同一种子每次生成的文本完全一致"""
+    os.makedirs(pdf_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(NUM_PDFS):
+        path = os.path.join(pdf_dir, f"bench_{i:02d}.pdf")
+        with PdfPages(path) as pdf:
+            section_no = 0
+            for _ in range(PAGES_PER_PDF):
+                fig = plt.figure(figsize=(8.27, 11.69))
+                y = 0.95
+                for _ in range(SECTIONS_PER_PAGE):
+                    section_no += 1
+                    fig.text(0.08, y, f"{section_no} {rng.choice(_VOCAB).title()} {rng.choice(_VOCAB).title()}",
+                             fontsize=14, weight="bold")
+                    y -= 0.03
+                    for _ in range(rng.randint(2, 4)):
+                        paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+                        for line in textwrap.wrap(paragraph, 95):
+                            fig.text(0.08, y, line, fontsize=9)
+                            y -= 0.015
+                        y -= 0.01
+                pdf.savefig(fig)
+                plt.close(fig)
+        paths.append(path)
+    return paths
+
+
+def run_benchmark(pdf_paths: List[str]) -> dict:
+    profiler = StageProfiler("ingest_benchmark")
+    parser = PDFPageChunkParser(profiler=profiler)
+    start = time.perf_counter()
+    chunks = 0
+    for path in pdf_paths:
+        for _ in parser.iter_pdf_documents(path):
+            chunks += 1
+    elapsed = time.perf_counter() - start
+    profiler.close()
+    log.info("\n" + profiler.summary())
+
+    result = profiler.to_dict()
+    result["pdfs"] = len(pdf_paths)
+    result["chunks"] = chunks
+    result["pdfs_per_sec"] = round(len(pdf_paths) / elapsed, 3)
+    result["chunks_per_sec"] = round(chunks / elapsed, 3)
+    return result
+
+
+def find_regressions(result: dict, baseline: dict, tolerance: float = TOLERANCE) -> List[str]:
+    """对比整体和各阶段的 items/s，返回回退项的描述"""
+    pairs = [("total pdfs/s", result["pdfs_per_sec"], baseline.get("pdfs_per_sec"))]
+    for stage, stats in result["stages"].items():
+        base = baseline.get("stages", {}).get(stage, {})
+        pairs.append((f"{stage} items/s", stats.get("items_per_sec"), base.get("items_per_sec")))
+    regressions = []
+    for name, current, base in pairs:
+        if current and base and current < base * (1 - tolerance):
+            regressions.append(f"{name}: {base} -> {current} ({(current / base - 1) * 100:.1f}%)")
+    return regressions
+
+
+if __name__ == '__main__':
+    paths = generate_pdfs()
+    bench = run_benchmark(paths)
+    with open(RESULT_FILE, "w", encoding="utf-8") as f:
+        json.dump(bench, f, ensure_ascii=False, indent=2)
+    log.info(f"基准结果已写入 {RESULT_FILE}: {bench['pdfs_per_sec']} pdfs/s, {bench['chunks_per_sec']} chunks/s")
+
+    if "--update-baseline" in sys.argv or not os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(bench, f, ensure_ascii=False, indent=2)
+        log.info(f"已保存基线 {BASELINE_FILE}")
+        sys.exit(0)
+
+    with open(BASELINE_FILE, encoding="utf-8") as f:
+        baseline_result = json.load(f)
+    found = find_regressions(bench, baseline_result)
+    if found:
+        log.error("吞吐回退：\n" + "\n".join(found))
+        sys.exit(1)
+    log.info("吞吐未出现回退")
@@ -2,11 +2,13 @@ import time
 from typing import List
 
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_milvus import Milvus, BM25BuiltInFunction
 from pymilvus import IndexType, MilvusClient, Function, Collection
 from pymilvus.client.types import MetricType, DataType, FunctionType
 from sympy import limit
 
+from documents.dedup import clear_dedup_index
 from documents.pdf_parser import PDFPageChunkParser
 from llm_models.embeddings_model import bge_embedding
 from utils.env_utils import MILVUS_URI, COLLECTION_NAME
@@ -19,8 +21,9 @@ class MilvusVectorSave:
         """自定义collection的索引"""
         self.vector_store_saved: Milvus = None
 
-    def create_collection(self):
-        client = MilvusClient(uri=MILVUS_URI)
+    @staticmethod
+    def build_schema(client: MilvusClient):
+        """collection的表结构，行写入和bulk import共用"""
         schema = client.create_schema()
         schema.add_field(field_name='id', datatype=DataType.INT64, is_primary=True, auto_id=True)
         schema.add_field(field_name='text', datatype=DataType.VARCHAR, max_length=30000, enable_analyzer=True,
@@ -42,6 +45,11 @@ class MilvusVectorSave:
             function_type=FunctionType.BM25,  # Set to `BM25`
         )
         schema.add_function(bm25_function)
+        return schema
+
+    @staticmethod
+    def build_index_params(client: MilvusClient):
+        """collection的索引定义"""
         index_params = client.prepare_index_params()
 
         index_params.add_index(
@@ -63,12 +71,20 @@ class MilvusVectorSave:
             metric_type=MetricType.IP,
             params={"M": 16, "efConstruction": 64}  # M :邻接节点数, efConstruction: 搜索范围
         )
+        return index_params
+
+    def create_collection(self, with_index: bool = True):
+        """重建collection；bulk import 时 with_index=False，导入完成后再统一建索引"""
+        client = MilvusClient(uri=MILVUS_URI)
+        schema = self.build_schema(client)
+        index_params = self.build_index_params(client) if with_index else None
 
         if COLLECTION_NAME in client.list_collections():
             # 先释放， 再删除索引，再删除collection
             client.release_collection(collection_name=COLLECTION_NAME)
-            client.drop_index(collection_name=COLLECTION_NAME, index_name='sparse_inverted_index')
-            client.drop_index(collection_name=COLLECTION_NAME, index_name='dense_inverted_index')
+            # bulk import 中断时collection可能还没有索引，按实际存在的索引删除
+            for index_name in client.list_indexes(collection_name=COLLECTION_NAME):
+                client.drop_index(collection_name=COLLECTION_NAME, index_name=index_name)
             client.drop_collection(collection_name=COLLECTION_NAME)
 
         client.create_collection(
@@ -76,11 +92,19 @@ class MilvusVectorSave:
             schema=schema,
             index_params=index_params
         )
+        # 新 collection 是空的，之前入库登记的论文签名和 chunk 指纹不再对应已有向量，不清空会把重新入库的论文当成重复跳过
+        clear_dedup_index()
+
+    def ensure_collection(self):
+        """collection 不存在时才创建（增量入库用，不会删除已有数据）"""
+        client = MilvusClient(uri=MILVUS_URI)
+        if COLLECTION_NAME not in client.list_collections():
+            self.create_collection()
 
-    def create_connection(self):
+    def create_connection(self, embedding_function: Embeddings = bge_embedding):
         """创建一个Connection： milvus + langchain。pip install  langchain-milvus"""
         self.vector_store_saved = Milvus(
-            embedding_function=bge_embedding,
+            embedding_function=embedding_function,
             collection_name=COLLECTION_NAME,
             builtin_function=BM25BuiltInFunction(),
             vector_field=['dense', 'sparse'],
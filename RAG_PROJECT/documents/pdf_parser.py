@@ -1,19 +1,43 @@
-from typing import List, Dict
+from typing import List, Iterable, Iterator, Optional
 import logging
 from langchain.schema import Document
 from langchain_community.document_loaders import UnstructuredPDFLoader
 from langchain_experimental.text_splitter import SemanticChunker
 from langchain_huggingface import HuggingFaceEmbeddings
 
+from documents.dedup import NearDuplicateFilter
+from documents.element_cache import ElementCache
+from utils.profiler import StageProfiler
+
 log = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 
+class _Section:
+    """一个尚未结束的标题章节，文本片段先放在列表里，结束时再拼接"""
+
+    __slots__ = ("element_id", "doc", "parts")
+
+    def __init__(self, element_id: str, doc: Document, parts: List[str]):
+        self.element_id = element_id
+        self.doc = doc
+        self.parts = parts
+
+    def to_document(self) -> Document:
+        self.doc.page_content = "\n".join(self.parts)
+        if self.doc.metadata.get('category') != "Title":
+            self.doc.metadata['category'] = "content"
+        return self.doc
+
+
 class PDFPageChunkParser:
 
     def __init__(self,
                  embed_model_name: str = "intfloat/e5-large",
-                 chunk_size_thresh: int = 5000):
+                 chunk_size_thresh: int = 5000,
+                 dedup: Optional[NearDuplicateFilter] = None,
+                 profiler: Optional[StageProfiler] = None,
+                 element_cache: Optional[ElementCache] = None):
         # 嵌入模型
         self.embedding_model = HuggingFaceEmbeddings(
             model_name=embed_model_name,
@@ -26,35 +50,73 @@ class PDFPageChunkParser:
             breakpoint_threshold_type="percentile"
         )
         self.chunk_size_thresh = chunk_size_thresh
+        # 近重复过滤器，为 None 时不去重
+        self.dedup = dedup
+        # 分阶段性能记录，为 None 时不记录
+        self.profiler = profiler
+        # 解析结果缓存，调切片参数时不必重新跑 Unstructured
+        self.element_cache = element_cache
 
     def parse_pdf_to_documents(self, pdf_path: str) -> List[Document]:
-        # 加载 PDF 文档元素
-        docs = self.load_pdf(pdf_path)
-        log.info(f"[PDF] 加载元素数量: {len(docs)}")
-
-        # 合并结构化段落
-        merged = self.merge_structured_content(docs)
-        log.info(f"[PDF] 合并后文档数: {len(merged)}")
-
-        # 语义切片
-        chunks = self.chunk_documents(merged)
+        chunks = list(self.iter_pdf_documents(pdf_path))
         log.info(f"[PDF] 语义切片后 count: {len(chunks)}")
         return chunks
 
-    def load_pdf(self, pdf_path: str) -> List[Document]:
+    def iter_pdf_documents(self, pdf_path: str) -> Iterator[Document]:
+        """流式解析：元素边读边合并，章节一结束就切片并产出，单个 worker 内存不随 PDF 页数增长"""
+        profiler = self.profiler
+        elements = self.iter_pdf_elements(pdf_path)
+        if profiler is not None:
+            elements = profiler.iterate("unstructured_load", elements, pdf_path)
+        if self.dedup is not None:
+            head_text, elements = self.dedup.split_head(elements)
+            original = self.dedup.is_duplicate_paper(pdf_path, head_text)
+            if original is not None:
+                log.info(f"[PDF] {pdf_path} 与 {original} 近重复，跳过")
+                return
+
+        sections = self.iter_structured_content(elements)
+        if profiler is not None:
+            sections = profiler.iterate("merge_structured", sections, pdf_path)
+        for section in sections:
+            if profiler is not None:
+                with profiler.stage("semantic_chunk", pdf_path) as frame:
+                    chunks = self.chunk_documents([section])
+                    frame.items = len(chunks)
+            else:
+                chunks = self.chunk_documents([section])
+            for chunk in chunks:
+                if self.dedup is not None and self.dedup.is_duplicate_chunk(chunk.page_content):
+                    continue
+                yield chunk
+
+    def iter_pdf_elements(self, pdf_path: str) -> Iterator[Document]:
+        if self.element_cache is not None:
+            return self.element_cache.get_or_parse(pdf_path, self._lazy_load)
+        return self._lazy_load(pdf_path)
+
+    @staticmethod
+    def _lazy_load(pdf_path: str) -> Iterator[Document]:
         loader = UnstructuredPDFLoader(
             file_path=pdf_path,
             mode="elements",
             strategy="fast"  # 建议使用 hi_res 获取更多结构信息
         )
-        return list(loader.lazy_load())
+        return loader.lazy_load()
+
+    def load_pdf(self, pdf_path: str) -> List[Document]:
+        return list(self.iter_pdf_elements(pdf_path))
 
-    from typing import List, Dict
-    from langchain_core.documents import Document
+    def merge_structured_content(self, docs: Iterable[Document]) -> List[Document]:
+        return list(self.iter_structured_content(docs))
 
-    def merge_structured_content(self, docs: List[Document]) -> List[Document]:
-        merged_data: List[Document] = []
-        parent_dict: Dict[str, Document] = {}
+    def iter_structured_content(self, docs: Iterable[Document]) -> Iterator[Document]:
+        """
+        把标题和其下的段落合并成章节。
+        只保留当前打开的标题链（open_sections，按嵌套顺序），新标题出现时比它层级深或同级的章节都已结束，
+        立即拼接文本产出；章节文本用列表缓冲，最后一次 join，避免反复 += 拼接长字符串。
+        """
+        open_sections: List[_Section] = []
 
         for doc in docs:
             meta = doc.metadata
@@ -71,51 +133,58 @@ class PDFPageChunkParser:
 
             # 1. 顶级正文（没有 parent 的 NarrativeText）
             if cat == "NarrativeText" and not pid:
-                meta['category_depth'] = 1
-                meta['title'] = text[:30]  # 生成一个默认标题
-                merged_data.append(doc)
+                yield self._top_level(doc, text)
                 continue
 
-            # 2. 标题节点
+            # 2. 标题节点：关闭不再包含它的章节，再打开新章节
             if cat == "Title":
                 meta['title'] = text  # 自身的标题
-                if pid and pid in parent_dict:
-                    parent = parent_dict[pid]
-                    depth = parent.metadata.get('category_depth', 1) + 1
-                    doc.page_content = parent.page_content + "\n" + text
+                parent = self._find_open(open_sections, pid)
+                while open_sections and open_sections[-1] is not parent:
+                    yield open_sections.pop().to_document()
+                if parent is not None:
+                    meta['category_depth'] = parent.doc.metadata.get('category_depth', 1) + 1
+                    parts = parent.parts + [text]
                 else:
-                    depth = 1
-                meta['category_depth'] = depth
-                parent_dict[eid] = doc
+                    meta['category_depth'] = 1
+                    parts = [text]
+                open_sections.append(_Section(eid, doc, parts))
                 continue
 
             # 3. 子段落合并到父标题
             if cat in ("NarrativeText", "ListItem", "UncategorizedText") and pid:
-                if pid in parent_dict:
-                    parent = parent_dict[pid]
-                    parent.page_content += "\n" + text
-                    parent.metadata['category'] = "content"  # 合并后归为内容块
+                parent = self._find_open(open_sections, pid)
+                if parent is not None:
+                    parent.parts.append(text)
+                    parent.doc.metadata['category'] = "content"  # 合并后归为内容块
                 else:
-                    # 父标题不存在时，降级为顶级正文
-                    meta['category_depth'] = 1
-                    meta['title'] = text[:30]
-                    merged_data.append(doc)
+                    # 父标题不存在（或已结束）时，降级为顶级正文
+                    yield self._top_level(doc, text)
                 continue
 
             # 4. 其它孤立块也作为顶级正文
             if cat in ("ListItem", "UncategorizedText") and not pid:
-                meta['category_depth'] = 1
-                meta['title'] = text[:30]
-                merged_data.append(doc)
-
-        # 最后将合并好的标题段落加入
-        merged_data.extend(parent_dict.values())
-
-        for doc in merged_data:
-            if doc.metadata.get('category') != "Title":
-                doc.metadata['category'] = "content"
-
-        return merged_data
+                yield self._top_level(doc, text)
+
+        # 文档结束，剩余打开的章节全部产出
+        while open_sections:
+            yield open_sections.pop().to_document()
+
+    @staticmethod
+    def _find_open(open_sections: List["_Section"], pid: str) -> Optional["_Section"]:
+        if not pid:
+            return None
+        for section in reversed(open_sections):
+            if section.element_id == pid:
+                return section
+        return None
+
+    @staticmethod
+    def _top_level(doc: Document, text: str) -> Document:
+        doc.metadata['category_depth'] = 1
+        doc.metadata['title'] = text[:30]  # 生成一个默认标题
+        doc.metadata['category'] = "content"
+        return doc
 
     def chunk_documents(self, docs: List[Document]) -> List[Document]:
         result = []
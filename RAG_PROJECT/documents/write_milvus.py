@@ -1,10 +1,22 @@
 import multiprocessing
 import os
 from multiprocessing import Queue
+from typing import Iterable, List, Tuple
 
+from documents.dedup import NearDuplicateFilter
+from documents.element_cache import ElementCache
 from documents.pdf_parser import PDFPageChunkParser
 from documents.milvus_db import MilvusVectorSave
-from utils.log_utils import log
+from llm_models.embeddings_model import bge_embedding
+from utils.log_utils import log, log_dir
+from utils.profiler import StageProfiler
+
+
+def _report_profile(profiler: StageProfiler):
+    """打印分阶段汇总，并写出机器可读的 JSON（logs/ingest_profile_<name>.json）"""
+    profiler.close()
+    log.info("\n" + profiler.summary())
+    profiler.dump_json(os.path.join(log_dir, f"ingest_profile_{profiler.name}.json"))
 
 
 def pdf_parser_process(pdf_dir: str, output_queue: Queue, batch_size: int = 20):
@@ -21,33 +33,56 @@ def pdf_parser_process(pdf_dir: str, output_queue: Queue, batch_size: int = 20):
         output_queue.put(None)
         return
 
-    parser = PDFPageChunkParser()
+    parse_pdf_files(pdf_files, output_queue, batch_size)
+
+
+def pdf_path_parser_process(path_queue: Queue, output_queue: Queue, batch_size: int = 20):
+    """进程1（流水线模式）：从 path_queue 逐个接收刚下载完的 PDF 路径（None 结束），解析完一篇就立即入队"""
+    log.info("PDF 解析进程启动，等待下载完成的文件...")
+    parse_pdf_files(iter(path_queue.get, None), output_queue, batch_size, flush_each_file=True)
+
+
+def parse_pdf_files(pdf_files: Iterable[str], output_queue: Queue, batch_size: int = 20,
+                    flush_each_file: bool = False):
+    """逐个解析 PDF 并分批放入队列；flush_each_file 时每篇解析完都把不足一批的文档也送出，尽快可检索"""
+    dedup = NearDuplicateFilter()
+    profiler = StageProfiler("parser")
+    element_cache = ElementCache()
+    parser = PDFPageChunkParser(dedup=dedup, profiler=profiler, element_cache=element_cache)
     doc_batch = []
+    file_count = 0
     for file_path in pdf_files:
+        file_count += 1
         try:
-            docs = parser.parse_pdf_to_documents(file_path)
-            if docs:
-                doc_batch.extend(docs)
-
-            if len(doc_batch) >= batch_size:
-                output_queue.put(doc_batch.copy())
-                doc_batch.clear()
+            # 边解析边入队，不等整篇 PDF 解析完
+            for doc in parser.iter_pdf_documents(file_path):
+                doc_batch.append(doc)
+                if len(doc_batch) >= batch_size:
+                    output_queue.put(doc_batch)
+                    doc_batch = []
         except Exception as e:
             log.error(f"解析失败 {file_path}: {e}")
             log.exception(e)
+        if flush_each_file and doc_batch:
+            output_queue.put(doc_batch)
+            doc_batch = []
 
     if doc_batch:
         output_queue.put(doc_batch)
 
     output_queue.put(None)
-    log.info(f"解析完成，共处理 {len(pdf_files)} 个 PDF 文件")
+    log.info(f"解析完成，共处理 {file_count} 个 PDF 文件，"
+             f"跳过近重复论文 {dedup.skipped_papers} 篇、近重复 chunk {dedup.skipped_chunks} 个，"
+             f"解析缓存命中 {element_cache.hits} / 未命中 {element_cache.misses}")
+    _report_profile(profiler)
 
 failed_docs = []  # 存储未能成功存入的文档
 def milvus_writer_process(input_queue: Queue):
     """进程2：读取队列并写入 Milvus"""
     log.info("Milvus 写入进程启动...")
+    profiler = StageProfiler("writer")
     mv = MilvusVectorSave()
-    mv.create_connection()
+    mv.create_connection(profiler.wrap_embeddings(bge_embedding, "bge_embedding"))
     total = 0
     failed = 0
     while True:
@@ -56,7 +91,9 @@ def milvus_writer_process(input_queue: Queue):
             if docs is None:
                 break
             try:
-                mv.add_documents(docs)
+                # bge_embedding 是嵌套阶段，milvus_insert 只统计写入本身的时间
+                with profiler.stage("milvus_insert", items=len(docs)):
+                    mv.add_documents(docs)
                 total += len(docs)
                 log.info(f"已写入 {total} 个文档")
             except Exception as e:
@@ -68,6 +105,30 @@ def milvus_writer_process(input_queue: Queue):
             log.error("读取队列异常")
             log.exception(e)
     log.info(f"Milvus 写入完成，文档总数: {total}，失败文档数: {failed}")
+    _report_profile(profiler)
+
+
+def milvus_bulk_writer_process(input_queue: Queue):
+    """进程2（bulk 模式）：读取队列写成列式文件，全部解析完后一次性 bulk import 并建索引"""
+    from documents.bulk_import import MilvusBulkImporter
+
+    log.info("Milvus bulk import 写入进程启动...")
+    profiler = StageProfiler("bulk_writer")
+    importer = MilvusBulkImporter()
+    while True:
+        docs = input_queue.get()
+        if docs is None:
+            break
+        try:
+            with profiler.stage("bulk_embed_and_write", items=len(docs)):
+                importer.add_documents(docs)
+            log.info(f"已缓冲 {importer.row_count} 个文档")
+        except Exception as e:
+            log.error(f"向量化/写文件异常，丢弃本批 {len(docs)} 个文档: {e}")
+            log.exception(e)
+    with profiler.stage("bulk_import_and_index", items=importer.row_count):
+        importer.commit_and_import()
+    _report_profile(profiler)
 
 
     # 处理未能成功存入的文档
@@ -82,18 +143,36 @@ def handle_failed_docs(failed_docs):
             log.exception(e)
 
 
+def start_ingest_pipeline(queue_maxsize: int = 20) -> Tuple[Queue, List[multiprocessing.Process]]:
+    """
+    启动 解析进程 + Milvus 写入进程，返回 (PDF 路径队列, 进程列表)。
+    往路径队列放入 PDF 路径即开始入库，放入 None 表示结束；collection 不存在时才创建，已有数据保留
+    """
+    MilvusVectorSave().ensure_collection()
+    path_queue = Queue()
+    docs_queue = Queue(maxsize=queue_maxsize)
+    procs = [
+        multiprocessing.Process(target=pdf_path_parser_process, args=(path_queue, docs_queue)),
+        multiprocessing.Process(target=milvus_writer_process, args=(docs_queue,)),
+    ]
+    for proc in procs:
+        proc.start()
+    return path_queue, procs
+
 
 if __name__ == '__main__':
     pdf_dir = "../papers"  # 你的 PDF 文件目录
     queue_maxsize = 20
+    ingest_mode = "row"  # row: 分批 add_documents；bulk: 列式文件 + bulk import，适合百万级 chunk
 
     mv = MilvusVectorSave()
-    mv.create_collection()
+    mv.create_collection(with_index=(ingest_mode != "bulk"))
 
     docs_queue = Queue(maxsize=queue_maxsize)
 
     parser_proc = multiprocessing.Process(target=pdf_parser_process, args=(pdf_dir, docs_queue))
-    writer_proc = multiprocessing.Process(target=milvus_writer_process, args=(docs_queue,))
+    writer_target = milvus_bulk_writer_process if ingest_mode == "bulk" else milvus_writer_process
+    writer_proc = multiprocessing.Process(target=writer_target, args=(docs_queue,))
 
     parser_proc.start()
     writer_proc.start()
@@ -7,16 +7,19 @@ import os
 import asyncio
 import aiohttp
 import hashlib
-from typing import List, Dict
-import requests
+from contextlib import asynccontextmanager
+from typing import List, Dict, Optional, Tuple, Any, Callable, Awaitable
 import feedparser
 from tqdm.asyncio import tqdm
-from urllib.parse import urlencode
-import time
-import random
+from urllib.parse import urlsplit
 import ssl
+import time
 import certifi
 
+from paper_manifest import PaperManifest, file_sha256, STATUS_PENDING, STATUS_DOWNLOADED, STATUS_FAILED, \
+    STATUS_INVALID
+from host_rate_limiter import HostController, HostRateLimiter, backoff_delay, parse_retry_after
+
 # =====================================
 # 配置区
 # =====================================
@@ -36,14 +39,47 @@ EMAIL = 'q1293132751@163.com'  # Unpaywall & OpenAlex required
 CORE_API_KEY = ''
 MAX_PAPERS = 2000
 BATCH_SIZE = 100
+CROSSREF_SELECT = 'DOI'  # 只取用得到的字段，响应体小很多
+CROSSREF_CURSOR_TTL = 4 * 60  # Crossref 的 cursor 5 分钟不用即失效，超过该秒数的进度从头翻页
 SAVE_DIR = 'papers'
-CONCURRENCY = 20  # 提高并发下载数
+CONCURRENCY = 64  # 下载的全局连接上限；每个 host 的并发和速率由 HostRateLimiter 自适应调整
 TIMEOUT = 60
 USER_AGENT = (
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
     '(KHTML, like Gecko) Chrome/115.0 Safari/537.36'
 )
-SEEN_IDS_FILE = os.path.join(SAVE_DIR, 'downloaded_ids.txt')
+SEEN_IDS_FILE = os.path.join(SAVE_DIR, 'downloaded_ids.txt')  # 旧版下载记录，首次运行时导入清单
+MANIFEST_FILE = os.path.join(SAVE_DIR, 'manifest.db')
+REHARVEST = False  # 清单里已有论文时，重跑是否重新检索元数据；False 则直接下载待下载的论文
+OA_NEGATIVE_TTL = 7 * 24 * 3600  # “没有 OA 版本”的查询结果缓存多久
+MAX_DOWNLOAD_ATTEMPTS = 3  # 每次运行里一篇论文的最多失败次数（被限流不算）
+MAX_THROTTLED_ATTEMPTS = 10  # 每次运行里一篇论文最多被限流的次数，超过后留待下次运行，不标记失败
+MAX_TOTAL_ATTEMPTS = 12  # 跨运行累计尝试超过这么多次的失败论文不再重试
+FAILED_RETRY_COOLDOWN = 6 * 3600  # 失败的论文至少隔这么久（秒）才在下次运行中重试
+PIPELINE_MODE = False  # True: 检索、下载、入库流水线并行；False: 先全部检索，再全部下载（入库需另跑 write_milvus）
+PIPELINE_INGEST = True  # 流水线模式下是否把下载完的 PDF 直接送去解析入库
+DOWNLOAD_QUEUE_SIZE = 200
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # 流式写盘的块大小
+DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=TIMEOUT, sock_read=TIMEOUT)  # 大文件不设总超时
+PARTIAL_SUFFIX = '.part'
+PDF_MAGIC = b'%PDF'
+MIN_PDF_SIZE = 1024
+META_CONCURRENCY = 32  # 元数据检索（arXiv/Crossref/OA）的全局并发
+DEFAULT_HOST_CONCURRENCY = 8
+HOST_CONCURRENCY = {
+    'export.arxiv.org': 1,
+    'api.crossref.org': 8,
+    'core.ac.uk': 4,
+}
+HOST_MIN_INTERVAL = {
+    'export.arxiv.org': 3.0,  # arXiv API 要求两次请求至少间隔 3 秒
+}
+OA_RESOLVE_MODE = 'race'  # race: 各 OA 源并发查询；sequential: 按优先级依次查询
+OA_RESOLVER_PRIORITY = ['Unpaywall', 'EuropePMC', 'CORE', 'OpenAlex']
+OA_PRIORITY_GRACE = 2.0  # 低优先级源先拿到结果后，最多再等高优先级源的秒数
+OA_STATS_MIN_CALLS = 20  # 至少调用这么多次后才根据统计降级
+OA_MIN_SUCCESS_RATE = 0.05  # 命中率低于此值的源降级
+OA_SLOW_LATENCY = 15.0  # 延迟 EWMA 超过此秒数的源降级
 
 # 全局请求头
 HEADERS = {
@@ -52,6 +88,8 @@ HEADERS = {
 }
 # SSL context
 SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
+# 检索到一篇论文时的回调
+OnPaper = Callable[[Dict], Awaitable[None]]
 
 # =====================================
 # 工具函数
@@ -59,31 +97,67 @@ SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
 def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
-def load_seen_ids() -> set[str]:
-    if not os.path.exists(SEEN_IDS_FILE): return set()
-    with open(SEEN_IDS_FILE) as f: return set(line.strip() for line in f)
-
-def save_seen_id(pid: str) -> None:
-    with open(SEEN_IDS_FILE, 'a') as f: f.write(pid + '\n')
-
 def md5(text: str) -> str:
     return hashlib.md5(text.encode()).hexdigest()
 
 # =====================================
-# 来源1：arXiv
-# 使用 requests 无代理环境避免 ProxyError
-SESSION_NON_PROXY = requests.Session()
-SESSION_NON_PROXY.trust_env = False
+# 元数据请求的并发控制
+# =====================================
+class HostLimiter:
+    """
+    元数据请求的并发闸门：全局并发上限 + 每个 host 的并发上限，
+    部分 host（arXiv）还要求两次请求之间的最小间隔
+    """
+
+    def __init__(self, total: int = META_CONCURRENCY):
+        self._total = asyncio.Semaphore(total)
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._last_request: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        host = urlsplit(url).hostname or ''
+        sem = self._hosts.get(host)
+        if sem is None:
+            sem = self._hosts[host] = asyncio.Semaphore(HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY))
+        # 先拿 host 的名额再拿全局名额，排队等慢 host 时不占用全局并发
+        async with sem:
+            interval = HOST_MIN_INTERVAL.get(host)
+            if interval:
+                loop = asyncio.get_running_loop()
+                wait = self._last_request.get(host, 0) + interval - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self._last_request[host] = loop.time()
+            async with self._total:
+                yield
 
-def fetch_arxiv() -> List[Dict]:
+
+async def http_get(session: aiohttp.ClientSession, limiter: HostLimiter, url: str,
+                   params: Optional[Dict] = None, headers: Optional[Dict] = None,
+                   as_json: bool = True) -> Tuple[int, Any]:
+    """受 limiter 约束的 GET，返回 (状态码, JSON 或文本)；非 200 时内容为 None"""
+    async with limiter.slot(url):
+        async with session.get(url, params=params, headers=headers, timeout=aiohttp.ClientTimeout(total=TIMEOUT)) as r:
+            if r.status != 200:
+                return r.status, None
+            if as_json:
+                return r.status, await r.json(content_type=None)
+            return r.status, await r.text()
+
+# =====================================
+# 来源1：arXiv
+# =====================================
+async def fetch_arxiv(session: aiohttp.ClientSession, limiter: HostLimiter,
+                      on_paper: Optional[OnPaper] = None) -> List[Dict]:
     print("[arXiv] 开始检索...")
     papers = {}
     per_kw = MAX_PAPERS // len(KEYWORDS) + 1
-    for kw in KEYWORDS:
-        if len(papers) >= MAX_PAPERS: break
-        print(f"[arXiv] 关键词={kw}, 已收集={len(papers)}")
+
+    async def process_kw(kw):
+        # arXiv 的 host 限制为串行且有最小间隔，这里并发的是各关键词的翻页和解析
         for start in range(0, per_kw, BATCH_SIZE):
-            if len(papers) >= MAX_PAPERS: break
+            if len(papers) >= MAX_PAPERS: return
             params = {
                 'search_query': f'all:"{kw}" AND {DATE_RANGE}',
                 'start': start,
@@ -91,200 +165,566 @@ def fetch_arxiv() -> List[Dict]:
                 'sortBy': 'submittedDate',
                 'sortOrder': 'descending'
             }
-            resp = SESSION_NON_PROXY.get(ARXIV_API, params=params, headers=HEADERS, timeout=TIMEOUT)
-            resp.raise_for_status()
-            feed = feedparser.parse(resp.text)
-            if not feed.entries: break
+            try:
+                status, text = await http_get(session, limiter, ARXIV_API, params=params, as_json=False)
+            except Exception as e:
+                print(f"[arXiv] {kw} start={start} 异常: {e}")
+                return
+            if status != 200:
+                print(f"[arXiv] {kw} start={start} HTTP {status}")
+                return
+            feed = feedparser.parse(text)
+            if not feed.entries: return
             for e in feed.entries:
                 pid = e.id.split('/')[-1]
                 if pid in papers: continue
                 url = next((l.href for l in e.links if l.type=='application/pdf'), f'https://arxiv.org/pdf/{pid}.pdf')
-                papers[pid] = {'id': pid, 'doi': None, 'pdf_url': url}
-                if len(papers) >= MAX_PAPERS: break
+                # arXiv 论文若已正式发表会带 DOI，用于和 Crossref 结果去重
+                doi = e.get('arxiv_doi')
+                papers[pid] = {'id': pid, 'doi': doi.lower() if doi else None, 'arxiv_id': pid, 'pdf_url': url}
+                if on_paper: await on_paper(papers[pid])
+                if len(papers) >= MAX_PAPERS: return
+        print(f"[arXiv] 关键词={kw} 完成, 已收集={len(papers)}")
+
+    await asyncio.gather(*(process_kw(kw) for kw in KEYWORDS))
     print(f"[arXiv] 完成检索, 收集={len(papers)} 篇")
     return list(papers.values())
 
 # =====================================
 # 多源OA检索函数
 # =====================================
-def fetch_oa_pdf(doi: str) -> str:
+async def oa_unpaywall(session: aiohttp.ClientSession, limiter: HostLimiter, doi: str) -> Optional[str]:
+    status, data = await http_get(session, limiter, f"{UNPAYWALL_API}{doi}", params={'email': EMAIL},
+                                  headers=HEADERS)
+    if status != 200:
+        print(f"[Unpaywall] DOI={doi} HTTP {status}")
+        return None
+    oa = data.get('best_oa_location') or {}
+    return oa.get('url_for_pdf') or oa.get('url')
+
+async def oa_europepmc(session: aiohttp.ClientSession, limiter: HostLimiter, doi: str) -> Optional[str]:
+    params = {'query': f'EXT_ID:{doi} AND OPEN_ACCESS:Y', 'format': 'json'}
+    status, data = await http_get(session, limiter, EUROPEPMC_API, params=params, headers=HEADERS)
+    if status != 200:
+        print(f"[EuropePMC] DOI={doi} HTTP {status}")
+        return None
+    results = data.get('resultList', {}).get('result', [])
+    return results[0].get('pdfUrl') if results else None
+
+async def oa_core(session: aiohttp.ClientSession, limiter: HostLimiter, doi: str) -> Optional[str]:
+    params = {'q': doi, 'cursor': '*', 'pageSize': 1}
+    headers_core = {'Authorization': CORE_API_KEY}
+    status, data = await http_get(session, limiter, CORE_API, params=params, headers=headers_core)
+    if status != 200:
+        print(f"[CORE] DOI={doi} HTTP {status}")
+        return None
+    ids = data.get('data', [])
+    if not ids:
+        return None
+    return f"https://core.ac.uk:443/api-v2/articles/get/{ids[0]}?metadata=false&download=true&apiKey={CORE_API_KEY}"
+
+async def oa_openalex(session: aiohttp.ClientSession, limiter: HostLimiter, doi: str) -> Optional[str]:
+    params = {'filter': f'doi:{doi}', 'mailto': EMAIL}
+    status, data = await http_get(session, limiter, OPENALEX_API, params=params, headers=HEADERS)
+    if status != 200:
+        print(f"[OpenAlex] DOI={doi} HTTP {status}")
+        return None
+    results = data.get('results', [])
+    if not results:
+        return None
+    oa_locs = results[0].get('open_access', {}).get('oa_locations', [])
+    return next((loc['url_for_pdf'] for loc in oa_locs if loc.get('url_for_pdf')), None)
+
+OA_RESOLVER_FUNCS = {
+    'Unpaywall': oa_unpaywall,
+    'EuropePMC': oa_europepmc,
+    'CORE': oa_core,
+    'OpenAlex': oa_openalex,
+}
+
+
+class ResolverStats:
+    """各 OA 源的调用次数、命中率和延迟（EWMA），用来把又慢又不命中的源自动降到优先级末尾"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def _entry(self, name: str, latency: float) -> Dict[str, float]:
+        return self.stats.setdefault(name, {'calls': 0, 'hits': 0, 'errors': 0, 'lost': 0, 'latency': latency})
+
+    def record(self, name: str, latency: float, hit: bool, error: bool = False):
+        s = self._entry(name, latency)
+        s['calls'] += 1
+        s['hits'] += int(hit)
+        s['errors'] += int(error)
+        s['latency'] = (1 - self.alpha) * s['latency'] + self.alpha * latency
+
+    def record_lost(self, name: str, elapsed: float):
+        """
+        race 模式下优先级更高、但宽限期内没返回而被放弃的源：记一次未命中，
+        真实延迟至少是 elapsed，只用它把延迟估计往上推。一直跑输的慢源靠这个样本累积到降级条件
+        """
+        s = self._entry(name, elapsed)
+        s['calls'] += 1
+        s['lost'] += 1
+        s['latency'] = (1 - self.alpha) * s['latency'] + self.alpha * max(elapsed, s['latency'])
+
+    def is_degraded(self, name: str) -> bool:
+        s = self.stats.get(name)
+        if not s or s['calls'] < OA_STATS_MIN_CALLS:
+            return False
+        return s['hits'] / s['calls'] < OA_MIN_SUCCESS_RATE or s['latency'] > OA_SLOW_LATENCY
+
+    def ordered(self, names: List[str]) -> List[str]:
+        """保持配置的优先级，但被判定为降级的源排到最后"""
+        return sorted(names, key=self.is_degraded)
+
+    def report(self) -> str:
+        lines = []
+        for name, s in self.stats.items():
+            lines.append(f"[OA统计] {name}: 调用={s['calls']} 命中率={s['hits'] / s['calls']:.1%} 异常={s['errors']} "
+                         f"跑输={s['lost']} 延迟EWMA={s['latency']:.2f}s{' (已降级)' if self.is_degraded(name) else ''}")
+        return "\n".join(lines)
+
+
+RESOLVER_STATS = ResolverStats()
+
+def enabled_oa_resolvers() -> List[str]:
+    names = [n for n in OA_RESOLVER_PRIORITY if n in OA_RESOLVER_FUNCS]
+    # CORE: 需要 CORE_API_KEY，若未设置则跳过
+    if not CORE_API_KEY or CORE_API_KEY == 'YOUR_CORE_API_KEY':
+        names = [n for n in names if n != 'CORE']
+    return RESOLVER_STATS.ordered(names)
+
+async def run_oa_resolver(name: str, session: aiohttp.ClientSession, limiter: HostLimiter, doi: str) -> Optional[str]:
+    """调用单个 OA 源并记录统计；被取消的调用由 fetch_oa_pdf 决定是否计入"""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        pdf = await OA_RESOLVER_FUNCS[name](session, limiter, doi)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"[{name}] DOI={doi} 异常: {e}")
+        RESOLVER_STATS.record(name, loop.time() - start, hit=False, error=True)
+        return None
+    RESOLVER_STATS.record(name, loop.time() - start, hit=bool(pdf))
+    if pdf:
+        print(f"[{name}] DOI={doi} => {pdf}")
+    return pdf
+
+async def fetch_oa_pdf(session: aiohttp.ClientSession, limiter: HostLimiter, doi: str) -> Optional[str]:
     """
-    多源获取 OA PDF 链接：依次尝试 Unpaywall, Europe PMC, CORE, OpenAlex
-    返回 PDF 直链或 None
+    多源获取 OA PDF 链接，返回 PDF 直链或 None。
+    sequential：按优先级依次尝试；race：所有源同时查询，按优先级取第一个有效结果并取消其余请求，
+    低优先级源先返回时最多再等高优先级源 OA_PRIORITY_GRACE 秒
     """
-    # Unpaywall
-    try:
-        url = f"{UNPAYWALL_API}{doi}?email={EMAIL}"
-        resp = requests.get(url, headers=HEADERS, timeout=TIMEOUT)
-        if resp.status_code == 200:
-            data = resp.json()
-            oa = data.get('best_oa_location') or {}
-            pdf = oa.get('url_for_pdf') or oa.get('url')
+    names = enabled_oa_resolvers()
+    if OA_RESOLVE_MODE == 'sequential':
+        for name in names:
+            pdf = await run_oa_resolver(name, session, limiter, doi)
             if pdf:
-                print(f"[Unpaywall] DOI={doi} => {pdf}")
                 return pdf
-        else:
-            print(f"[Unpaywall] DOI={doi} HTTP {resp.status_code}")
-    except Exception as e:
-        print(f"[Unpaywall] DOI={doi} 异常: {e}")
-    # Europe PMC
-    try:
-        params = {'query': f'EXT_ID:{doi} AND OPEN_ACCESS:Y', 'format': 'json'}
-        resp = requests.get(EUROPEPMC_API, params=params, headers=HEADERS, timeout=TIMEOUT)
-        if resp.status_code == 200:
-            data = resp.json()
-            results = data.get('resultList', {}).get('result', [])
-            if results:
-                pdf = results[0].get('pdfUrl')
-                if pdf:
-                    print(f"[EuropePMC] DOI={doi} => {pdf}")
-                    return pdf
-        else:
-            print(f"[EuropePMC] DOI={doi} HTTP {resp.status_code}")
-    except Exception as e:
-        print(f"[EuropePMC] DOI={doi} 异常: {e}")
-        # CORE: 需要 CORE_API_KEY，若未设置则跳过
-    if CORE_API_KEY and CORE_API_KEY != 'YOUR_CORE_API_KEY':
-        try:
-            params = {'q': doi, 'cursor': '*', 'pageSize': 1}
-            headers_core = {'Authorization': CORE_API_KEY}
-            resp = requests.get(CORE_API, params=params, headers=headers_core, timeout=TIMEOUT)
-            if resp.status_code == 200:
-                data = resp.json()
-                ids = data.get('data', [])
-                if ids:
-                    core_id = ids[0]
-                    pdf = f"https://core.ac.uk:443/api-v2/articles/get/{core_id}?metadata=false&download=true&apiKey={CORE_API_KEY}"
-                    print(f"[CORE] DOI={doi} => {pdf}")
-                    return pdf
-            else:
-                print(f"[CORE] DOI={doi} HTTP {resp.status_code}")
-        except Exception as e:
-            print(f"[CORE] DOI={doi} 异常: {e}")
-    else:
-        print(f"[CORE] 跳过 CORE，未配置 CORE_API_KEY")
-    # OpenAlex
+        return None
+
+    tasks = {name: asyncio.create_task(run_oa_resolver(name, session, limiter, doi)) for name in names}
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    deadline = None
+    winner = 0  # 采用的结果的优先级序号；异常或外部取消时不记跑输
     try:
-        params = {'filter': f'doi:{doi}', 'mailto': EMAIL}
-        resp = requests.get(OPENALEX_API, params=params, headers=HEADERS, timeout=TIMEOUT)
-        if resp.status_code == 200:
-            data = resp.json()
-            results = data.get('results', [])
-            if results:
-                oa_locs = results[0].get('open_access', {}).get('oa_locations', [])
-                for loc in oa_locs:
-                    pdf = loc.get('url_for_pdf')
-                    if pdf:
-                        print(f"[OpenAlex] DOI={doi} => {pdf}")
-                        return pdf
-        else:
-            print(f"[OpenAlex] DOI={doi} HTTP {resp.status_code}")
-    except Exception as e:
-        print(f"[OpenAlex] DOI={doi} 异常: {e}")
-    return None
+        pending = set(tasks.values())
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            _, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            hit = next(((rank, tasks[name].result()) for rank, name in enumerate(names)
+                        if tasks[name].done() and tasks[name].result()), None)
+            if hit is None:
+                continue
+            rank, pdf = hit
+            # 优先级更高的源都已结束，或者宽限期已过，直接采用
+            higher_running = any(not tasks[name].done() for name in names[:rank])
+            if not higher_running or (deadline is not None and loop.time() >= deadline):
+                winner = rank
+                return pdf
+            if deadline is None:
+                deadline = loop.time() + OA_PRIORITY_GRACE
+        return None
+    finally:
+        # 没等到的高优先级源记一次跑输；优先级更低的源只是不再需要，不计入
+        for name in names[:winner]:
+            if not tasks[name].done():
+                RESOLVER_STATS.record_lost(name, loop.time() - start)
+        for t in tasks.values():
+            t.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
 
 # =====================================
 # 来源2：Crossref + 多源OA
 # =====================================
-def fetch_crossref_multisource() -> List[Dict]:
+async def fetch_crossref_multisource(session: aiohttp.ClientSession, limiter: HostLimiter,
+                                     manifest: Optional[PaperManifest] = None,
+                                     on_paper: Optional[OnPaper] = None) -> List[Dict]:
     """
-    并发检索 Crossref + 多源 OA，提高元数据获取速度
+    并发检索 Crossref + 多源 OA：各关键词并发，关键词内用 cursor 深翻页，
+    当前页的 OA 查询和下一页的请求同时进行，由 limiter 控制并发。
+    传入 manifest 时，清单中已有的论文和查询过的 DOI 不再重复查询，论文和翻页进度逐页写入清单，
+    中断后重跑从上次的 cursor 继续；
+    传入 on_paper 时，每解析到一篇论文立即回调（流水线模式下直接进入下载队列）
     """
     print("[Crossref] 并发检索开始...")
     papers = {}
+    pending = set()  # 正在查询 OA 的 pid，避免不同关键词重复查询同一 DOI
     per_kw = MAX_PAPERS // len(KEYWORDS) + 1
-    # 内部函数处理单个关键词
-    def process_kw(kw):
-        local = {}
-        for offset in range(0, per_kw, BATCH_SIZE):
+
+    async def resolve(pid, doi):
+        if len(papers) >= MAX_PAPERS:
+            return
+        found, pdf_url = manifest.get_oa_lookup(doi, OA_NEGATIVE_TTL) if manifest else (False, None)
+        if not found:
+            pdf_url = await fetch_oa_pdf(session, limiter, doi)
+            if manifest:
+                manifest.save_oa_lookup(doi, pdf_url)
+        if pdf_url and len(papers) < MAX_PAPERS:
+            papers[pid] = {'id': pid, 'doi': doi, 'pdf_url': pdf_url}
+            if manifest:
+                manifest.add_paper(papers[pid])
+            if on_paper: await on_paper(papers[pid])
+
+    def resolve_page(items):
+        lookups = []
+        for it in items:
+            doi = it.get('DOI')
+            if not doi:
+                continue
+            pid = md5(doi)
+            if pid in papers or pid in pending or (manifest and manifest.has_paper(pid)):
+                continue
+            pending.add(pid)
+            lookups.append(resolve(pid, doi))
+        return asyncio.gather(*lookups)
+
+    async def process_kw(kw) -> bool:
+        """返回该关键词是否检索完成（出错中断返回 False）"""
+        saved = manifest.get_harvest_cursor('crossref', kw, CROSSREF_CURSOR_TTL) if manifest else None
+        cursor, fetched, done = saved or ('*', 0, False)
+        if done:
+            print(f"[Crossref] {kw} 上次已检索完成，跳过")
+            return True
+        if saved:
+            print(f"[Crossref] {kw} 从上次的进度继续，已获取 {fetched} 条")
+        # 上一页的 (OA 查询, 下一页 cursor, 累计条数)；OA 查询完成后才保存进度，中断重跑不会漏掉这一页
+        previous = None
+        done = True
+        while fetched < per_kw and len(papers) < MAX_PAPERS:
             params = {
                 'query.title': kw,
                 'filter': 'from-pub-date:2018-01-01',
                 'rows': BATCH_SIZE,
-                'offset': offset
+                'cursor': cursor,
+                'select': CROSSREF_SELECT,
+                'mailto': EMAIL,
             }
             try:
-                resp = SESSION_NON_PROXY.get(CROSSREF_API, params=params, headers=HEADERS, timeout=TIMEOUT)
-                data = resp.json()
-                items = data.get('message', {}).get('items', [])
-                if not items:
-                    break
-                for it in items:
-                    doi = it.get('DOI')
-                    if not doi:
-                        continue
-                    pid = md5(doi)
-                    if pid in papers or pid in local:
-                        continue
-                    pdf_url = fetch_oa_pdf(doi)
-                    if pdf_url:
-                        local[pid] = {'id': pid, 'doi': doi, 'pdf_url': pdf_url}
-            except Exception as e:
-                print(f"[Crossref] {kw} offset={offset} 异常: {e}")
-        print(f"[Crossref] {kw} 完成, 本地收集={len(local)} 篇")
-        return local
-    # 并发执行
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    with ThreadPoolExecutor(max_workers=min(10, len(KEYWORDS))) as executor:
-        future_to_kw = {executor.submit(process_kw, kw): kw for kw in KEYWORDS}
-        for future in as_completed(future_to_kw):
-            kw = future_to_kw[future]
-            try:
-                result = future.result()
-                papers.update(result)
-                print(f"[Crossref] {kw} 合并后总数={len(papers)}")
-                if len(papers) >= MAX_PAPERS:
-                    break
+                status, data = await http_get(session, limiter, CROSSREF_API, params=params, headers=HEADERS)
             except Exception as e:
-                print(f"[Crossref] {kw} 处理异常: {e}")
+                print(f"[Crossref] {kw} 已获取 {fetched} 条, 异常: {e}")
+                done = False
+                break
+            if status == 400 and cursor != '*' and previous is None:
+                # 保存的 cursor 已失效，从头翻页（已查过的 DOI 会命中清单，不会重复查 OA）
+                print(f"[Crossref] {kw} cursor 已失效，从头检索")
+                cursor, fetched = '*', 0
+                continue
+            if status != 200:
+                print(f"[Crossref] {kw} 已获取 {fetched} 条, HTTP {status}")
+                done = False
+                break
+            message = data.get('message', {})
+            items = message.get('items', [])
+            lookups = resolve_page(items)
+            fetched += len(items)
+            if previous:
+                await previous[0]
+                if manifest:
+                    manifest.save_harvest_cursor('crossref', kw, previous[1], previous[2], False)
+            cursor = message.get('next-cursor')
+            previous = (lookups, cursor, fetched)
+            print(f"[Crossref] {kw} 已获取 {fetched} 条, 总收集={len(papers)} 篇")
+            if len(items) < BATCH_SIZE or not cursor:
+                break
+        if previous:
+            await previous[0]
+            if manifest:
+                manifest.save_harvest_cursor('crossref', kw, previous[1], previous[2], done)
+        return done
+
+    finished = await asyncio.gather(*(process_kw(kw) for kw in KEYWORDS))
+    if manifest and all(finished):
+        manifest.clear_harvest_cursors('crossref')
     print(f"[Crossref] 并发检索完成, 总收集={len(papers)} 篇")
+    print(RESOLVER_STATS.report())
     return list(papers.values())
 
 # =====================================
 # 异步下载函数
 # =====================================
-async def download_one(session: aiohttp.ClientSession, paper: Dict, seen: set[str]) -> None:
+class NotPdfError(Exception):
+    """响应内容不是 PDF（多为落地页/登录页），重试也没有意义"""
+
+
+class ThrottledError(Exception):
+    """服务器返回 429/503，host 已按 Retry-After 暂停"""
+
+    def __init__(self, status: int, retry_after: Optional[float]):
+        super().__init__(f"HTTP {status}, Retry-After={retry_after}")
+        self.retry_after = retry_after
+
+
+def _part_size(part: str) -> Optional[int]:
+    return os.path.getsize(part) if os.path.exists(part) else None
+
+def _part_is_pdf(part: str) -> bool:
+    with open(part, 'rb') as f:
+        return f.read(len(PDF_MAGIC)) == PDF_MAGIC
+
+async def stream_to_part(session: aiohttp.ClientSession, rate_limiter: HostRateLimiter, url: str, part: str) -> bool:
+    """
+    把 url 流式写入 part 文件，已有部分内容时用 Range 请求续传。
+    返回 True 表示文件已完整下载；网络中断等可续传的失败返回 False 并保留 part 文件。
+    请求受该 host 的 HostController 约束，响应结果（成功/限流/错误）反馈给它调整并发和速率
+    """
+    controller = rate_limiter.for_url(url)
+    async with controller.slot():
+        try:
+            return await _stream_to_part(session, controller, url, part)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            controller.on_error()
+            raise
+
+async def _stream_to_part(session: aiohttp.ClientSession, controller: HostController, url: str, part: str) -> bool:
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if offset and (offset < len(PDF_MAGIC) or not _part_is_pdf(part)):
+        os.remove(part)
+        offset = 0
+    headers = {'Range': f'bytes={offset}-'} if offset else None
+    start = time.monotonic()
+    async with session.get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT, allow_redirects=True) as r:
+        if r.status in (429, 503):
+            retry_after = parse_retry_after(r.headers.get('Retry-After'))
+            controller.on_throttle(retry_after)
+            raise ThrottledError(r.status, retry_after)
+        if r.status >= 500:
+            controller.on_error()
+        elif r.status in (200, 206, 416):
+            controller.on_success(time.monotonic() - start)
+        if r.status == 416 and offset:
+            # 已有内容覆盖了整个文件
+            return offset > MIN_PDF_SIZE and _part_is_pdf(part)
+        if r.status == 206 and offset:
+            mode = 'ab'
+        elif r.status == 200:
+            # 服务器不支持 Range（或本来就是从头下载），从头写
+            offset, mode = 0, 'wb'
+        else:
+            print(f"[失败] HTTP {r.status} URL={url}")
+            return False
+        expected = offset + r.content_length if r.content_length is not None else None
+
+        written = offset
+        head = b'' if offset == 0 else PDF_MAGIC
+        with open(part, mode) as f:
+            async for chunk in r.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                if len(head) < len(PDF_MAGIC):
+                    head += chunk[:len(PDF_MAGIC) - len(head)]
+                    if len(head) >= len(PDF_MAGIC) and head != PDF_MAGIC:
+                        raise NotPdfError(f"响应不是 PDF，开头为 {head!r}")
+                f.write(chunk)
+                written += len(chunk)
+
+    if expected is not None and written < expected:
+        print(f"[中断] 已下载 {written}/{expected} 字节，稍后续传")
+        return False
+    if written <= MIN_PDF_SIZE or head != PDF_MAGIC:
+        raise NotPdfError(f"文件过小或不是 PDF: {written} 字节")
+    return True
+
+async def download_one(session: aiohttp.ClientSession, paper: Dict, manifest: PaperManifest,
+                       rate_limiter: HostRateLimiter) -> Optional[str]:
+    """
+    流式下载到 papers/<pid>.pdf.part，完成后原子 rename；重试时从已下载的位置续传，每次尝试记入清单。
+    失败后按指数退避重试，最多 MAX_DOWNLOAD_ATTEMPTS 次；被限流（429/503）不算失败：host 已按 Retry-After 暂停，
+    下一次请求在 slot() 里等到期再发。本轮被限流太多次时保留 .part 和待下载状态，留给下次运行续传。
+    返回本次新下载的 PDF 路径，已下载过、失败或留待下次返回 None
+    """
     pid, url = paper['id'], paper['pdf_url']
-    if pid in seen: return
+    if manifest.status_of(pid) == STATUS_DOWNLOADED: return None
     out = os.path.join(SAVE_DIR, f"{pid}.pdf")
-    for attempt in range(1, 4):
-        print(f"[下载] {pid} 尝试({attempt}/3) URL={url}")
+    part = out + PARTIAL_SUFFIX
+    failures = throttles = 0
+    while True:
+        print(f"[下载] {pid} 尝试(失败 {failures}/{MAX_DOWNLOAD_ATTEMPTS}, 限流 {throttles}) URL={url}")
         try:
-            async with session.get(url, timeout=TIMEOUT, allow_redirects=True) as r:
-                if r.status == 200:
-                    data = await r.read()
-                    if data.startswith(b'%PDF') and len(data) > 1024:
-                        with open(out, 'wb') as f:
-                            f.write(data)
-                        save_seen_id(pid)
-                        print(f"[成功] {pid}")
-                        return
-                print(f"[失败] {pid} HTTP {r.status}")
+            if await stream_to_part(session, rate_limiter, url, part):
+                os.replace(part, out)
+                sha256 = await asyncio.to_thread(file_sha256, out)
+                manifest.record_attempt(pid, 'ok', os.path.getsize(out))
+                manifest.mark_downloaded(pid, out, sha256)
+                print(f"[成功] {pid}")
+                return out
+            manifest.record_attempt(pid, 'incomplete', _part_size(part))
+        except NotPdfError as e:
+            print(f"[非PDF] {pid}: {e}")
+            if os.path.exists(part):
+                os.remove(part)
+            manifest.record_attempt(pid, 'not_pdf', error=str(e))
+            manifest.set_status(pid, STATUS_INVALID)
+            return None
+        except ThrottledError as e:
+            throttles += 1
+            print(f"[限流] {pid}: {e}")
+            manifest.record_attempt(pid, 'throttled', _part_size(part), error=str(e), counted=False)
+            if throttles >= MAX_THROTTLED_ATTEMPTS:
+                print(f"[限流] {pid} 本轮被限流 {throttles} 次，保留待下载，下次运行续传")
+                return None
+            continue
         except Exception as e:
             print(f"[异常] {pid}: {e}")
-        await asyncio.sleep(random.uniform(5, 10))
+            manifest.record_attempt(pid, 'error', _part_size(part), error=repr(e))
+        failures += 1
+        if failures >= MAX_DOWNLOAD_ATTEMPTS:
+            break
+        await asyncio.sleep(backoff_delay(failures))
+    manifest.set_status(pid, STATUS_FAILED)
     print(f"[下载失败] {pid}")
+    return None
 
-async def bulk_download(papers: List[Dict]) -> None:
+async def bulk_download(papers: List[Dict], manifest: PaperManifest) -> None:
     ensure_dir(SAVE_DIR)
-    seen = load_seen_ids()
+    rate_limiter = HostRateLimiter()
     connector = aiohttp.TCPConnector(limit=CONCURRENCY, ssl=SSL_CONTEXT)
     async with aiohttp.ClientSession(connector=connector, trust_env=True, headers=HEADERS) as session:
-        tasks = [download_one(session, p, seen) for p in papers]
+        tasks = [download_one(session, p, manifest, rate_limiter) for p in papers]
         for _ in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
             await _
+    print(rate_limiter.report())
 
 # =====================================
 # 主程序
 # =====================================
+async def harvest(manifest: Optional[PaperManifest] = None,
+                  on_paper: Optional[OnPaper] = None) -> Tuple[List[Dict], List[Dict]]:
+    """arXiv 与 Crossref+OA 两路元数据检索并发进行"""
+    limiter = HostLimiter()
+    connector = aiohttp.TCPConnector(limit=META_CONCURRENCY, ssl=SSL_CONTEXT)
+    # 元数据接口不走系统代理，避免 ProxyError
+    async with aiohttp.ClientSession(connector=connector, trust_env=False,
+                                     headers={'User-Agent': USER_AGENT}) as session:
+        arxiv_papers, crossref_papers = await asyncio.gather(
+            fetch_arxiv(session, limiter, on_paper),
+            fetch_crossref_multisource(session, limiter, manifest, on_paper),
+        )
+    return arxiv_papers, crossref_papers
+
+def requeue_failed(manifest: PaperManifest):
+    requeued = manifest.requeue_failed(MAX_TOTAL_ATTEMPTS, FAILED_RETRY_COOLDOWN)
+    if requeued:
+        print(f"上次下载失败的 {requeued} 篇论文重新加入待下载")
+
 async def main():
     ensure_dir(SAVE_DIR)
-    arxiv_papers = fetch_arxiv()
-    crossref_papers = fetch_crossref_multisource()
-    all_papers = {p['id']: p for p in (arxiv_papers + crossref_papers)}
-    print(f"总计去重后: {len(all_papers)} 篇")
-    await bulk_download(list(all_papers.values()))
-    print(f"下载完成，已保存: {len(load_seen_ids())} 篇")
+    manifest = PaperManifest(MANIFEST_FILE)
+    if manifest.count() == 0 and manifest.import_seen_ids(SEEN_IDS_FILE, SAVE_DIR):
+        print(f"已从 {SEEN_IDS_FILE} 导入旧的下载记录")
+    requeue_failed(manifest)
+
+    if REHARVEST or manifest.count(STATUS_PENDING) == 0:
+        arxiv_papers, crossref_papers = await harvest(manifest)
+        for p in arxiv_papers + crossref_papers:
+            manifest.add_paper(p)
+        # 同一篇论文在 arXiv 和 Crossref 下 id 不同，按 DOI 再去重一次（保留 arXiv 版本）；
+        # Crossref 论文检索时已逐页写入清单，去重在清单里做，覆盖上次中断前写入的论文
+        duplicates = manifest.mark_doi_duplicates()
+        if duplicates:
+            print(f"按 DOI 去重: {duplicates} 篇 Crossref 论文已有 arXiv 版本")
+    else:
+        print("清单中已有待下载论文，跳过元数据检索")
+
+    pending = manifest.pending_papers()
+    print(f"待下载: {len(pending)} 篇")
+    await bulk_download(pending, manifest)
+    print(f"下载完成，已保存: {manifest.count(STATUS_DOWNLOADED)} 篇，"
+          f"失败: {manifest.count(STATUS_FAILED)} 篇，非PDF: {manifest.count(STATUS_INVALID)} 篇")
+    manifest.close()
+
+async def pipeline(ingest: bool = PIPELINE_INGEST):
+    """
+    流水线模式：检索到的论文立即进入下载队列，下载完成的 PDF 立即交给解析/入库进程，
+    总耗时接近最慢的一个阶段，而不是三个阶段之和
+    """
+    ensure_dir(SAVE_DIR)
+    manifest = PaperManifest(MANIFEST_FILE)
+    if manifest.count() == 0 and manifest.import_seen_ids(SEEN_IDS_FILE, SAVE_DIR):
+        print(f"已从 {SEEN_IDS_FILE} 导入旧的下载记录")
+    requeue_failed(manifest)
+
+    path_queue, ingest_procs = None, []
+    if ingest:
+        from documents.write_milvus import start_ingest_pipeline
+        path_queue, ingest_procs = start_ingest_pipeline()
+
+    download_queue: asyncio.Queue = asyncio.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+    queued_ids, queued_dois = set(), set()
+    stats = {'queued': 0, 'downloaded': 0}
+
+    async def enqueue(paper: Dict):
+        # 两个来源谁先到用谁，同一 DOI 只下载一次
+        doi = (paper.get('doi') or '').lower()
+        if paper['id'] in queued_ids or (doi and doi in queued_dois):
+            return
+        queued_ids.add(paper['id'])
+        if doi:
+            queued_dois.add(doi)
+        manifest.add_paper(paper)
+        if manifest.status_of(paper['id']) != STATUS_PENDING:
+            return
+        stats['queued'] += 1
+        await download_queue.put(paper)
+
+    async def download_worker(session: aiohttp.ClientSession):
+        while True:
+            paper = await download_queue.get()
+            if paper is None:
+                return
+            path = await download_one(session, paper, manifest, rate_limiter)
+            if path:
+                stats['downloaded'] += 1
+                print(f"[流水线] 已下载 {stats['downloaded']}/{stats['queued']}")
+                if path_queue is not None:
+                    path_queue.put(os.path.abspath(path))
+
+    rate_limiter = HostRateLimiter()
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY, ssl=SSL_CONTEXT)
+    async with aiohttp.ClientSession(connector=connector, trust_env=True, headers=HEADERS) as session:
+        workers = [asyncio.create_task(download_worker(session)) for _ in range(CONCURRENCY)]
+        # 上次没下载完的先入队，再边检索边入队
+        for paper in manifest.pending_papers():
+            await enqueue(paper)
+        await harvest(manifest, on_paper=enqueue)
+        manifest.mark_doi_duplicates()
+        for _ in workers:
+            await download_queue.put(None)
+        await asyncio.gather(*workers)
+    print(rate_limiter.report())
+
+    if path_queue is not None:
+        path_queue.put(None)
+        for proc in ingest_procs:
+            await asyncio.to_thread(proc.join)
+    print(f"流水线完成，已保存: {manifest.count(STATUS_DOWNLOADED)} 篇，"
+          f"失败: {manifest.count(STATUS_FAILED)} 篇，非PDF: {manifest.count(STATUS_INVALID)} 篇")
+    manifest.close()
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    asyncio.run(pipeline() if PIPELINE_MODE else main())
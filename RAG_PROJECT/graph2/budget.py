@@ -0,0 +1,92 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from utils.log_utils import log
+from utils.tracing import metrics
+
+REQUEST_DEADLINE_SECONDS = 90  # 单个请求的总时长上限
+MAX_LLM_CALLS = 20  # 单个请求的 LLM 调用次数上限
+RESERVE_LLM_CALLS = 1  # 给最后一次生成回答预留的调用次数
+RESERVE_SECONDS = 15  # 给最后一次生成回答预留的时间
+
+metrics.counter("rag_budget_exhausted_total", "请求预算用尽、提前结束循环的次数")
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    """
+    放进 graph.stream 的 callbacks，统计本次请求已发起的 LLM 调用（条件边里的评分调用也算）。
+    开始时先计数；结束时发现是网关 single-flight 合并的调用（共享别的请求在途的结果、没有实际发出）则退还，
+    单独记在 coalesced 里，只有真正发出的调用消耗预算
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._count()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._count()
+
+    def on_llm_end(self, response, **kwargs):
+        # llm_gateway._shared_result 给合并的调用标记 llm_output["coalesced"]
+        if (response.llm_output or {}).get("coalesced"):
+            with self._lock:
+                self.calls -= 1
+                self.coalesced += 1
+
+
+_counter: ContextVar[Optional[LLMCallCounter]] = ContextVar("rag_llm_call_counter", default=None)
+_budget_override: ContextVar[Optional[dict]] = ContextVar("rag_budget_override", default=None)
+
+
+def budget_inputs(deadline_seconds: float = REQUEST_DEADLINE_SECONDS, max_llm_calls: int = MAX_LLM_CALLS) -> dict:
+    """请求的预算，作为 GraphState 的 deadline / max_llm_calls 传入"""
+    return {"deadline": time.time() + deadline_seconds, "max_llm_calls": max_llm_calls}
+
+
+@contextmanager
+def track_llm_calls(budget: Optional[dict] = None) -> Iterator[LLMCallCounter]:
+    """
+    统计本次执行的 LLM 调用。budget（budget_inputs() 的返回值）指定时覆盖状态里的预算：
+    从检查点继续时状态里是原请求的截止时间，早已过期，而调用计数又从 0 开始，两者都按这次执行重新算
+    """
+    counter = LLMCallCounter()
+    token = _counter.set(counter)
+    override_token = _budget_override.set(budget)
+    try:
+        yield counter
+    finally:
+        _budget_override.reset(override_token)
+        _counter.reset(token)
+
+
+def budget_exhausted(state) -> Optional[str]:
+    """
+    预算是否已用尽（已扣除给最后一次生成预留的部分），返回原因 deadline / llm_calls，未用尽返回 None。
+    状态里没有预算字段（如命令行 run_chat）时不限制
+    """
+    reason = None
+    budget = _budget_override.get() or state
+    deadline = budget.get("deadline")
+    max_llm_calls = budget.get("max_llm_calls")
+    counter = _counter.get()
+    if deadline and time.time() > deadline - RESERVE_SECONDS:
+        reason = "deadline"
+    elif max_llm_calls and counter is not None and counter.calls >= max_llm_calls - RESERVE_LLM_CALLS:
+        reason = "llm_calls"
+    if reason:
+        log.info(f"---请求预算已用尽({reason})，停止循环---")
+        metrics.inc("rag_budget_exhausted_total", reason=reason)
+    return reason
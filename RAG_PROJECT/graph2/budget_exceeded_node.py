@@ -0,0 +1,23 @@
+# budget_exceeded_node.py
+from graph2.graph_state2 import GraphState
+from utils.log_utils import log
+
+
+def budget_exceeded(state: GraphState):
+    """
+    请求预算用尽时的结束节点：已经有生成结果就返回目前最好的一次，否则返回提示信息
+
+    Args:
+        state (GraphState): 当前图状态
+
+    Returns:
+        GraphState: 更新后的状态，包含最终回答
+    """
+    log.info("---请求预算用尽，返回目前的结果---")
+    generation = state.get("generation")
+    if not generation:
+        generation = (
+            "很抱歉，这个问题在限定时间内没有找到足够可靠的答案。"
+            "您可以尝试把问题描述得更具体一些，或者稍后再试。"
+        )
+    return {"generation": generation}
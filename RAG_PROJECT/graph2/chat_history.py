@@ -0,0 +1,94 @@
+from typing import List, Optional
+
+from langchain_core.messages import BaseMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from llm_models.all_llm import llm
+from utils.log_utils import log
+from utils.tracing import chain_config
+
+HISTORY_MAX_TURNS = 3  # 原文保留最近几轮（一问一答为一轮），更早的折叠进摘要
+HISTORY_TOKEN_BUDGET = 1500  # 拼进 prompt 的历史（摘要 + 最近几轮）的 token 上限
+HISTORY_MESSAGE_MAX_TOKENS = 400  # 单条消息的上限，过长的回答截断
+SUMMARY_MAX_TOKENS = 400
+
+_ROLE_NAMES = {"user": "user", "human": "user", "assistant": "assistant", "ai": "assistant"}
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """用 tiktoken 的 cl100k_base 估算 token 数；编码表加载失败（如离线）时按字符数估算"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            log.warning(f"tiktoken 不可用，按字符数估算 token: {e!r}")
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 2 + 1
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens]) + "…"
+    return text[:max_tokens * 2] + "…"
+
+
+def _role_and_content(msg) -> tuple:
+    """历史里既有 SQLite 读出的 {type, content}，也有节点追加的 HumanMessage/AIMessage"""
+    if isinstance(msg, BaseMessage):
+        return _ROLE_NAMES.get(msg.type, msg.type), msg.content
+    return _ROLE_NAMES.get(msg["type"], msg["type"]), msg["content"]
+
+
+def format_history(chat_history: List, summary: Optional[str] = None,
+                   max_turns: int = HISTORY_MAX_TURNS, budget: int = HISTORY_TOKEN_BUDGET) -> str:
+    """
+    拼进 prompt 的对话历史：摘要 + 最近 max_turns 轮原文，从最新的消息往前取，总量不超过 budget 个 token
+    """
+    lines = []
+    used = 0
+    if summary:
+        summary_line = f"（更早对话的摘要）{truncate_tokens(summary, SUMMARY_MAX_TOKENS)}"
+        used = count_tokens(summary_line)
+    for msg in reversed(chat_history[-max_turns * 2:]):
+        role, content = _role_and_content(msg)
+        line = f"{role}: {truncate_tokens(str(content), HISTORY_MESSAGE_MAX_TOKENS)}"
+        cost = count_tokens(line)
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    lines.reverse()
+    if summary:
+        lines.insert(0, summary_line)
+    return "\n".join(lines)
+
+
+def history_for_prompt(state) -> str:
+    return format_history(state.get("chat_history", []), state.get("history_summary"))
+
+
+summary_prompt = ChatPromptTemplate.from_messages([
+    ("system", "你负责维护一段对话的滚动摘要。把新的对话内容合并进已有摘要，保留用户的目标、偏好、"
+               "已确认的事实和尚未解决的问题，去掉寒暄和重复内容。摘要使用中文，不超过 300 字，直接输出摘要正文。"),
+    ("human", "已有摘要：\n{summary}\n\n新的对话：\n{messages}"),
+])
+
+summary_chain = (summary_prompt | llm | StrOutputParser()).with_config(**chain_config("history_summarizer"))
+
+
+def summarize_history(summary: Optional[str], messages: List) -> str:
+    """把移出窗口的消息增量合并进摘要；只处理新移出的消息，不重新总结整段对话"""
+    formatted = "\n".join(
+        f"{role}: {truncate_tokens(str(content), HISTORY_MESSAGE_MAX_TOKENS)}"
+        for role, content in map(_role_and_content, messages)
+    )
+    new_summary = summary_chain.invoke({"summary": summary or "无", "messages": formatted})
+    return truncate_tokens(new_summary.strip(), SUMMARY_MAX_TOKENS)
@@ -0,0 +1,33 @@
+"""
+工作流检查点：每跑完一个节点就把 GraphState 写进 SQLite。
+一轮对话对应一个 thread（会话 id + 助手占位消息 id），请求中断后重试可以从最后完成的节点继续，
+已经付过钱的 LLM 调用不会再跑一遍；这一轮的回答写回消息表后检查点即可删除。
+"""
+import sqlite3
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+CHECKPOINT_DB_PATH = 'chat_checkpoints.db'  # 和聊天记录分开存，写检查点不和消息表抢锁
+
+
+def sqlite_checkpointer(path: str = CHECKPOINT_DB_PATH) -> SqliteSaver:
+    """多个请求线程共用一个连接，SqliteSaver 内部用锁串行化读写"""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    return SqliteSaver(conn)
+
+
+def checkpoint_thread_id(chat_id: str, message_id: int) -> str:
+    return f"{chat_id}:{message_id}"
+
+
+def delete_checkpoints(checkpointer: SqliteSaver, thread_id: str = None, chat_id: str = None):
+    """删除一轮对话（thread_id）或整个会话（chat_id 下所有轮次）的检查点"""
+    if thread_id is not None:
+        where, args = 'thread_id = ?', (thread_id,)
+    else:
+        prefix = f"{chat_id}:"
+        where, args = 'substr(thread_id, 1, ?) = ?', (len(prefix), prefix)
+    with checkpointer.cursor() as cur:
+        cur.execute(f'DELETE FROM writes WHERE {where}', args)
+        cur.execute(f'DELETE FROM checkpoints WHERE {where}', args)
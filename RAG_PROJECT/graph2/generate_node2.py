@@ -2,7 +2,9 @@ from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
 
+from graph2.chat_history import history_for_prompt
 from llm_models.all_llm import llm
+from utils.tracing import chain_config
 
 
 def generate(state):
@@ -54,13 +56,13 @@ def generate(state):
         else:
             return "\n\n" + docs.page_content
 
-    formatted_history = "\n".join(["{msg['type']}: {msg['content']}" for msg in chat_history])
+    formatted_history = history_for_prompt(state)  # 摘要 + 最近几轮，控制在 token 预算内
     # 构建RAG处理链
     rag_chain = (
             prompt |  # 第一步：使用提示模板
             llm |  # 第二步：调用语言模型
             StrOutputParser()  # 第三步：解析模型输出为字符串
-    )
+    ).with_config(**chain_config("generate"))
 
     # RAG生成过程
     generation = rag_chain.invoke({"context": format_docs(documents), "question": question, "chat_history": formatted_history})
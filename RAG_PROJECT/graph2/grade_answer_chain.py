@@ -2,6 +2,7 @@ from langchain_core.prompts import ChatPromptTemplate
 from pydantic import Field, BaseModel
 
 from llm_models.all_llm import llm
+from utils.tracing import chain_config
 
 
 # 数据模型 - 回答质量评分
@@ -57,4 +58,4 @@ answer_prompt = ChatPromptTemplate.from_messages(
 answer_grader_chain = (
         answer_prompt  # 使用回答评估提示模板
         | structured_llm_grader  # 调用结构化评分的LLM
-)
+).with_config(**chain_config("answer_grader"))
@@ -2,6 +2,23 @@ from graph2.grader_chain import retrieval_grader_chain
 from utils.log_utils import log
 
 
+def filter_relevant_documents(question, documents):
+    """逐个评估文档相关性，只保留相关文档（推测式检索也复用这个函数）"""
+    filtered_docs = []  # 初始化相关文档列表
+    for d in documents:  # 遍历所有文档
+        score = retrieval_grader_chain.invoke(  # 调用评分器评估文档相关性
+            {"question": question, "document": d.page_content}
+        )
+        grade = score.binary_score  # 获取二元评分结果
+        if grade == "yes":  # 如果文档相关
+            log.info("---GRADE: 打印相关标识---")  # 打印相关标识
+            filtered_docs.append(d)  # 添加到相关文档列表
+        else:  # 如果文档不相关
+            log.info("---GRADE: 打印不相关标识,并丢掉doc---")  # 打印不相关标识
+            continue  # 跳过当前文档
+    return filtered_docs
+
+
 def grade_documents(state):
     """
     评估检索到的文档与问题的相关性
@@ -16,17 +33,12 @@ def grade_documents(state):
     question = state["question"]  # 获取用户问题
     documents = state["documents"]  # 获取待评估文档
 
+    # 路由阶段已经推测式地评估过同一问题的文档，直接使用
+    speculative = state.get("speculative")
+    if speculative and speculative["question"] == question and speculative.get("relevant") is not None:
+        log.info("---使用推测式检索阶段的文档评估结果---")
+        return {"documents": speculative["relevant"], "question": question, "speculative": None}
+
     # 文档评分与过滤
-    filtered_docs = []  # 初始化相关文档列表
-    for d in documents:  # 遍历所有文档
-        score = retrieval_grader_chain.invoke(  # 调用评分器评估文档相关性
-            {"question": question, "document": d.page_content}
-        )
-        grade = score.binary_score  # 获取二元评分结果
-        if grade == "yes":  # 如果文档相关
-            log.info("---GRADE: 打印相关标识---")  # 打印相关标识
-            filtered_docs.append(d)  # 添加到相关文档列表
-        else:  # 如果文档不相关
-            log.info("---GRADE: 打印不相关标识,并丢掉doc---")  # 打印不相关标识
-            continue  # 跳过当前文档
-    return {"documents": filtered_docs, "question": question}  # 返回仅含相关文档的状态
\ No newline at end of file
+    filtered_docs = filter_relevant_documents(question, documents)
+    return {"documents": filtered_docs, "question": question, "speculative": None}  # 返回仅含相关文档的状态
@@ -2,6 +2,7 @@ from langchain_core.prompts import ChatPromptTemplate
 from pydantic import Field, BaseModel
 
 from llm_models.all_llm import llm
+from utils.tracing import chain_config
 
 
 # 数据模型 - 生成内容幻觉评分
@@ -56,4 +57,4 @@ hallucination_prompt = ChatPromptTemplate.from_messages(
 hallucination_grader_chain = (
         hallucination_prompt  # 使用幻觉检测提示模板
         | structured_llm_grader  # 调用结构化评分的LLM
-)
+).with_config(**chain_config("hallucination_grader"))
@@ -2,6 +2,7 @@ from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 
 from llm_models.all_llm import llm
+from utils.tracing import chain_config
 
 
 # 数据模型 - 文档相关性评分
@@ -51,4 +52,4 @@ grade_prompt = ChatPromptTemplate.from_messages(
 )
 
 # 构建检索评分器工作流
-retrieval_grader_chain = grade_prompt | structured_llm_grader  # 组合提示模板和LLM评分器
+retrieval_grader_chain = (grade_prompt | structured_llm_grader).with_config(**chain_config("retrieval_grader"))  # 组合提示模板和LLM评分器
@@ -5,6 +5,8 @@ from langgraph.constants import START, END
 from langgraph.graph import StateGraph
 
 from draw_png import draw_graph
+from graph2.budget import budget_exhausted
+from graph2.budget_exceeded_node import budget_exceeded
 from graph2.failed_node import failed
 # from draw_png import draw_graph
 from graph2.generate_node2 import generate
@@ -13,21 +15,26 @@ from graph2.grade_documents_node import grade_documents
 from graph2.grade_hallucinations_chain import hallucination_grader_chain
 from graph2.graph_state2 import GraphState
 from graph2.llm_direct_node import llm_direct
-from graph2.query_route_chain import question_router_chain
 from graph2.retriever_node import retrieve
+from graph2.route_node import route_question, select_route
 from graph2.transform_query_node import transform_query
 from graph2.web_search_node import web_search
 from utils.log_utils import log
+from utils.tracing import traced
 
 
+@traced("grade_generation", kind="edge")
 def grade_generation_v_documents_and_question(state):
     """
     评估生成结果是否基于文档并正确回答问题
     Args:
         state (dict): 当前图状态，包含问题、文档和生成结果
     Returns:
-        str: 下一节点的名称（useful/not useful/not supported）
+        str: 下一节点的名称（useful/not useful/not supported/budget exhausted）
     """
+    if budget_exhausted(state):
+        # 预算用尽就不再评分和重试，直接返回这次生成的回答
+        return "budget exhausted"
     log.info("---检查生成内容是否存在幻觉---")  # 阶段标识
     question = state["question"]  # 获取用户问题
     documents = state["documents"]  # 获取参考文档
@@ -70,6 +77,7 @@ def grade_generation_v_documents_and_question(state):
             return "not supported"  # 返回不支持结果，继续重试
 
 
+@traced("decide_to_generate", kind="edge")
 def decide_to_generate(state):
     """
     决定是生成回答还是重新优化问题
@@ -85,6 +93,9 @@ def decide_to_generate(state):
     filtered_documents = state["documents"]  # 获取已过滤文档
     transform_count = state.get("transform_count", 0)
 
+    if budget_exhausted(state):
+        # 有相关文档时用预留的额度生成一次，否则直接结束
+        return "generate" if filtered_documents else "budget exhausted"
     if not filtered_documents:  # 如果没有相关文档
         if transform_count >= 2:
             log.info("---决策：所有文档都与问题无关,并且已经循环了2次，转为web查询问题---")
@@ -96,6 +107,7 @@ def decide_to_generate(state):
         log.info("---决策：生成最终回答---")
         return "generate"  # 返回回答生成节点
 
+@traced("decide_to_end", kind="edge")
 def decide_to_end(state):
     """
     评估是否正确回答问题
@@ -110,6 +122,8 @@ def decide_to_end(state):
     question = state["question"]  # 获取用户问题
     generation = state["generation"]  # 获取生成结果
 
+    if budget_exhausted(state):
+        return "useful"
     score = answer_grader_chain.invoke({"question": question, "generation": generation})
     grade = score.binary_score
     if grade == "yes":  # 如果正确回答问题
@@ -120,54 +134,25 @@ def decide_to_end(state):
         return "not useful"  # 返回无用结果
 
 
-def route_question(state):
-    """
-    路由问题到网络搜索或RAG流程
-    Args:
-        state (dict): 当前图状态，包含用户问题
-
-    Returns:
-        str: 下一节点的名称（web_search或vectorstore）
-    """
-    log.info("---ROUTE QUESTION---")  # 阶段标识
-    question = state["question"]  # 获取用户问题
-    chat_history = state.get("chat_history", [])  # 获取对话历史
-    # 格式化对话历史
-    formatted_history = "\n".join(["{msg['type']}: {msg['content']}" for msg in chat_history])
-
-    # 调用问题路由器，提供所有需要的变量
-    source = question_router_chain.invoke({
-        "question": question,
-        "history": formatted_history  # 提供 history 变量
-    })
-
-    # 根据路由结果决定下一个节点
-    if source.datasource == "web_search":
-        log.info("---路由到web搜索---")
-        return "web_search"
-    elif source.datasource == "vectorstore":
-        log.info("---路由到RAG系统---")
-        return "vectorstore"
-    elif source.datasource == "llm_direct":
-        log.info("---路由到LLM自答---")
-        return "llm_direct"
-
 # 初始化工作流图
 workflow = StateGraph(GraphState)
 
-# 定义各状态节点
-workflow.add_node("llm_direct", llm_direct)  # LLM 自答节点
-workflow.add_node("web_search", web_search)  # 网络搜索节点
-workflow.add_node("retrieve", retrieve)  # 文档检索节点
-workflow.add_node("grade_documents", grade_documents)  # 文档相关性评分节点
-workflow.add_node("generate", generate)  # 回答生成节点
-workflow.add_node("transform_query", transform_query)  # 查询优化节点
-workflow.add_node("failed", failed)
+# 定义各状态节点（traced 记录每个节点的耗时 span）
+workflow.add_node("route_question", traced("route_question")(route_question))  # 问题路由节点（可并行推测式检索）
+workflow.add_node("llm_direct", traced("llm_direct")(llm_direct))  # LLM 自答节点
+workflow.add_node("web_search", traced("web_search")(web_search))  # 网络搜索节点
+workflow.add_node("retrieve", traced("retrieve")(retrieve))  # 文档检索节点
+workflow.add_node("grade_documents", traced("grade_documents")(grade_documents))  # 文档相关性评分节点
+workflow.add_node("generate", traced("generate")(generate))  # 回答生成节点
+workflow.add_node("transform_query", traced("transform_query")(transform_query))  # 查询优化节点
+workflow.add_node("failed", traced("failed")(failed))
+workflow.add_node("budget_exceeded", traced("budget_exceeded")(budget_exceeded))  # 请求预算用尽时结束
 
 # 起始路由判断
+workflow.add_edge(START, "route_question")
 workflow.add_conditional_edges(
-    START,
-    route_question,
+    "route_question",
+    select_route,
     {
         "web_search": "web_search",
         "vectorstore": "retrieve",
@@ -179,6 +164,7 @@ workflow.add_conditional_edges(
 workflow.add_edge("web_search", "generate")  # 网络搜索后直接生成回答
 workflow.add_edge("retrieve", "grade_documents")
 workflow.add_edge("failed", END)# 检索后评估文档相关性
+workflow.add_edge("budget_exceeded", END)
 workflow.add_conditional_edges(
     "llm_direct",
     decide_to_end,
@@ -195,7 +181,8 @@ workflow.add_conditional_edges(
     {
         "web_search": "web_search",
         "transform_query": "transform_query",
-        "generate": "generate"
+        "generate": "generate",
+        "budget exhausted": "budget_exceeded"
     }
 )
 
@@ -208,7 +195,8 @@ workflow.add_conditional_edges(
         "useful": END,  # 生成符合要求时结束
         "not useful": "transform_query",  # 生成无用结果时优化查询
         "web_search": "web_search",  # 添加这行 - 生成无法解决时转向网络搜索
-        "cannot answer": "failed"
+        "cannot answer": "failed",
+        "budget exhausted": END  # 预算用尽，返回目前最好的一次生成
     },
 )
 
@@ -1,4 +1,4 @@
-from typing import TypedDict, List
+from typing import TypedDict, List, Optional
 
 from langchain_core.documents import Document
 
@@ -12,7 +12,12 @@ class GraphState(TypedDict):
         generation: 语言模型生成的回答文本
         transform_count: 传换查询的次数
         documents: 检索到的相关文档列表
-        chat_history: 存储历史记录
+        chat_history: 存储历史记录（最近几轮原文）
+        history_summary: 更早对话的滚动摘要
+        datasource: 路由结果（vectorstore / web_search / llm_direct）
+        speculative: 路由期间推测式检索的结果 {question, documents, relevant}，未使用或已消费时为 None
+        deadline: 请求的截止时间（time.time() 秒），超过后条件边不再循环
+        max_llm_calls: 请求允许的 LLM 调用次数上限
     """
 
     question: str  # 存储当前处理的用户问题
@@ -21,4 +26,9 @@ class GraphState(TypedDict):
     web_search_count: int  # 搜索尝试次数
     generation: str  # 存储LLM生成的回答内容
     documents: List[Document]  # 存储检索到的文档内容列表
-    chat_history: List[str]  # 存储历史记录
\ No newline at end of file
+    chat_history: List[str]  # 存储历史记录
+    history_summary: Optional[str]  # 更早对话的滚动摘要
+    datasource: str  # 路由结果
+    speculative: Optional[dict]  # 推测式检索结果
+    deadline: Optional[float]  # 请求预算：截止时间
+    max_llm_calls: Optional[int]  # 请求预算：LLM 调用次数上限
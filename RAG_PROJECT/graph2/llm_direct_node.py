@@ -2,7 +2,9 @@ from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
 
+from graph2.chat_history import history_for_prompt
 from llm_models.all_llm import llm
+from utils.tracing import chain_config
 from utils.log_utils import log
 
 
@@ -38,13 +40,13 @@ def llm_direct(state: dict) -> dict:
     )
 
     # 格式化对话历史
-    formatted_history = "\n".join(["{msg['type']}: {msg['content']}" for msg in chat_history])
+    formatted_history = history_for_prompt(state)  # 摘要 + 最近几轮，控制在 token 预算内
 
     llm_chain = (
             prompt |  # 第一步：使用提示模板
             llm |  # 第二步：调用语言模型
             StrOutputParser()  # 第三步：解析模型输出为字符串
-    )
+    ).with_config(**chain_config("llm_direct"))
 
     # RAG生成过程
     generation = llm_chain.invoke({"question": question, "chat_history": formatted_history})  # 调用llm链生成回答
@@ -3,6 +3,7 @@ from pydantic import BaseModel, Field
 from utils.log_utils import log
 from langchain_core.prompts import ChatPromptTemplate
 from llm_models.all_llm import llm
+from utils.tracing import chain_config
 from graph2.retriever_node import retrieve  # 向量召回
 from graph2.web_search_node import web_search
 
@@ -59,7 +60,7 @@ route_prompt = ChatPromptTemplate.from_messages([
     ("human", "历史对话：\n{history}\n\n当前问题：\n{question}")
 ])
 
-question_router_chain = route_prompt | structured_llm_router
+question_router_chain = (route_prompt | structured_llm_router).with_config(**chain_config("question_router"))
 
 
 # 测试路由器
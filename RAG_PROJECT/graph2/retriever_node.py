@@ -11,8 +11,13 @@ def retrieve(state):
     Returns:
         state (dict): 更新后的状态，新增包含检索结果的documents字段
     """
-    log.info("---去知识库中检索文档---")  # 打印当前阶段标识
     question = state["question"]  # 从状态中获取用户问题
+    # 路由阶段已经推测式地检索过同一问题，直接使用
+    speculative = state.get("speculative")
+    if speculative and speculative["question"] == question:
+        log.info("---使用推测式检索的文档---")
+        return {"documents": speculative["documents"], "question": question}
+    log.info("---去知识库中检索文档---")  # 打印当前阶段标识
     # 文档检索
     documents = retriever.invoke(question)  # 调用检索器获取相关文档
     return {"documents": documents, "question": question}  # 返回更新后的状态
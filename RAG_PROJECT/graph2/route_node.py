@@ -0,0 +1,95 @@
+import threading
+from concurrent.futures import Future
+from typing import Optional, Tuple
+
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+from graph2.chat_history import history_for_prompt
+from graph2.grade_documents_node import filter_relevant_documents
+from graph2.query_route_chain import question_router_chain
+from tools.retriever_tools import retriever
+from utils.env_utils import CHAT_WORKERS
+from utils.log_utils import log
+from utils.tracing import metrics
+
+SPECULATIVE_RETRIEVAL = True  # 路由 LLM 调用的同时推测式地检索向量库（大部分请求最终走 vectorstore）
+SPECULATIVE_GRADING = False  # 推测阶段是否连文档相关性评估一起做；路由到别处时会浪费评估的 LLM 调用
+# 每个对话线程同时最多一个推测任务；多留一倍给已丢弃但检索还没返回的任务，避免新的推测排在它们后面
+SPECULATIVE_WORKERS = CHAT_WORKERS * 2
+
+# 复制 contextvars 的线程池，推测任务里的 LLM 调用仍然挂在当前请求的 trace/callbacks 下
+_executor = ContextThreadPoolExecutor(max_workers=SPECULATIVE_WORKERS, thread_name_prefix="speculative")
+metrics.counter("rag_speculative_retrieval_total", "推测式检索结果：used 被使用，wasted 路由到别处被丢弃，error 推测失败")
+
+
+def _speculate(question: str, grade: bool, discarded: threading.Event) -> dict:
+    documents = retriever.invoke(question)
+    # 检索期间路由已经决定不走 vectorstore 时，跳过评估，不再为丢弃的结果花 LLM 调用
+    relevant = filter_relevant_documents(question, documents) if grade and not discarded.is_set() else None
+    return {"question": question, "documents": documents, "relevant": relevant}
+
+
+def _collect(speculation: Optional[Tuple[Future, threading.Event]], datasource: str) -> Optional[dict]:
+    """路由结果出来后处理推测任务：走 vectorstore 时等待并使用结果，否则丢弃"""
+    if speculation is None:
+        return None
+    future, discarded = speculation
+    if datasource != "vectorstore":
+        discarded.set()  # 已经在跑的任务检索完就返回，不再评估
+        future.cancel()  # 还没开始执行就直接取消
+        metrics.inc("rag_speculative_retrieval_total", outcome="wasted")
+        return None
+    try:
+        speculative = future.result()
+    except Exception as e:
+        # 推测失败不影响主流程，retrieve 节点会重新检索
+        log.warning(f"推测式检索失败，改为正常检索: {e!r}")
+        metrics.inc("rag_speculative_retrieval_total", outcome="error")
+        return None
+    metrics.inc("rag_speculative_retrieval_total", outcome="used")
+    return speculative
+
+
+def route_question(state):
+    """
+    路由问题到网络搜索、RAG流程或LLM自答。
+    开启 SPECULATIVE_RETRIEVAL 时，路由 LLM 调用期间并行检索向量库，vectorstore 路径上看不到路由的延迟
+    Args:
+        state (dict): 当前图状态，包含用户问题
+
+    Returns:
+        state (dict): 更新后的状态，datasource 为路由结果，speculative 为推测式检索结果
+    """
+    log.info("---ROUTE QUESTION---")  # 阶段标识
+    question = state["question"]  # 获取用户问题
+    # 格式化对话历史
+    formatted_history = history_for_prompt(state)  # 摘要 + 最近几轮，控制在 token 预算内
+
+    speculation = None
+    if SPECULATIVE_RETRIEVAL:
+        discarded = threading.Event()
+        speculation = (_executor.submit(_speculate, question, SPECULATIVE_GRADING, discarded), discarded)
+    try:
+        # 调用问题路由器，提供所有需要的变量
+        source = question_router_chain.invoke({
+            "question": question,
+            "history": formatted_history  # 提供 history 变量
+        })
+    except BaseException:
+        if speculation is not None:
+            speculation[1].set()
+            speculation[0].cancel()
+        raise
+
+    if source.datasource == "web_search":
+        log.info("---路由到web搜索---")
+    elif source.datasource == "vectorstore":
+        log.info("---路由到RAG系统---")
+    elif source.datasource == "llm_direct":
+        log.info("---路由到LLM自答---")
+    return {"datasource": source.datasource, "speculative": _collect(speculation, source.datasource)}
+
+
+def select_route(state):
+    """根据 route_question 节点写入的 datasource 决定下一个节点"""
+    return state["datasource"]
@@ -1,8 +1,10 @@
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 
+from graph2.chat_history import history_for_prompt
 from llm_models.all_llm import llm
 from utils.log_utils import log
+from utils.tracing import chain_config
 
 
 def transform_query(state):
@@ -51,10 +53,10 @@ def transform_query(state):
             re_write_prompt  # 使用优化提示模板
             | llm  # 调用语言模型
             | StrOutputParser()  # 将输出解析为字符串
-    )
+    ).with_config(**chain_config("query_rewriter"))
 
     # 格式化对话历史
-    formatted_history = "\n".join(["{msg['type']}: {msg['content']}" for msg in chat_history])
+    formatted_history = history_for_prompt(state)  # 摘要 + 最近几轮，控制在 token 预算内
     # 问题重写
     better_question = question_rewriter.invoke({
         "question": question,
@@ -1,10 +1,33 @@
+import hashlib
+import re
+
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+from graph2.chat_history import history_for_prompt
 from llm_models.all_llm import web_search_tool, llm
 from utils.log_utils import log
+from utils.tracing import chain_config
+from utils.ttl_cache import TTLCache
+
+# 两级缓存：(问题, 对话历史) -> 优化后的查询；优化后的查询 -> 搜索结果。ttl 设为 0 即关闭
+SEARCH_QUERY_CACHE_TTL = 30 * 60  # 查询改写只取决于问题和历史，可以缓存久一些
+SEARCH_RESULT_CACHE_TTL = 5 * 60  # 搜索结果有时效性（新闻、行情），保持较短的新鲜度窗口
+SEARCH_CACHE_MAX_ENTRIES = 2048
+
+search_query_cache = TTLCache("search_query_rewrite", SEARCH_QUERY_CACHE_TTL, SEARCH_CACHE_MAX_ENTRIES)
+search_result_cache = TTLCache("web_search_results", SEARCH_RESULT_CACHE_TTL, SEARCH_CACHE_MAX_ENTRIES)
+
+
+def _query_cache_key(question: str, formatted_history: str) -> str:
+    history_hash = hashlib.sha256(formatted_history.encode("utf-8")).hexdigest()
+    return f"{question.strip()}\x00{history_hash}"
+
+
+def _normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.strip().strip('"').lower())
 
 
 def web_search(state):
@@ -20,10 +43,9 @@ def web_search(state):
     log.info("---WEB SEARCH---")  # 阶段标识
     question = state["question"]  # 获取优化后的问题
     web_search_count = state.get("web_search_count", 0)
-    chat_history = state.get("chat_history", [])  # 获取对话历史
 
     # 格式化对话历史
-    formatted_history = "\n".join([f"{msg['type']}: {msg['content']}" for msg in chat_history])
+    formatted_history = history_for_prompt(state)  # 摘要 + 最近几轮，控制在 token 预算内
 
     # 使用LLM优化搜索查询，考虑对话历史
     search_prompt = PromptTemplate(
@@ -45,27 +67,28 @@ def web_search(state):
             search_prompt |
             llm |
             StrOutputParser()
+    ).with_config(**chain_config("search_query_rewriter"))
+
+    # 生成优化后的搜索查询（同样的问题和历史在缓存有效期内直接复用）
+    optimized_query = search_query_cache.get_or_set(
+        _query_cache_key(question, formatted_history),
+        lambda: search_query_chain.invoke({
+            "question": question,
+            "chat_history": formatted_history if formatted_history else "无对话历史"
+        })
     )
 
-    # 生成优化后的搜索查询
-    optimized_query = search_query_chain.invoke({
-        "question": question,
-        "chat_history": formatted_history if formatted_history else "无对话历史"
-    })
-
     log.info(f"原始查询: {question}")
     log.info(f"优化后查询: {optimized_query}")
 
-    # 执行网络搜索
-    docs = web_search_tool.invoke({"query": optimized_query})  # 调用网络搜索工具
+    # 执行网络搜索；只缓存非空的结果列表，空结果和搜索工具返回的错误信息（字符串）不缓存
+    docs = search_result_cache.get_or_set(
+        _normalize_query(optimized_query),
+        lambda: web_search_tool.invoke({"query": optimized_query}),  # 调用网络搜索工具
+        cache_if=lambda results: isinstance(results, list) and bool(results)
+    )
     web_results = "\n".join([d["content"] for d in docs])  # 合并搜索结果
     web_results = Document(page_content=web_results)  # 转换为文档格式
 
-    # 更新对话历史，添加网络搜索结果
-    updated_history = chat_history + [
-        {"type": "human", "content": question},
-        {"type": "ai", "content": f"通过网络搜索获取到以下信息:\n{web_results.page_content}"}
-    ]
-
-    return {"documents": web_results, "question": question, "web_search_count": web_search_count + 1,
-            "chat_history": updated_history}  # 返回更新状态
+    # 搜索结果只作为 documents 交给 generate，不再整段追加进对话历史（会撑大后续所有 prompt）
+    return {"documents": web_results, "question": question, "web_search_count": web_search_count + 1}  # 返回更新状态
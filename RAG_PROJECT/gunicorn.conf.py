@@ -0,0 +1,57 @@
+"""
+生产环境启动：gunicorn -c gunicorn.conf.py app:app
+
+preload_app 让主进程先导入 app 并加载 embedding 模型权重（app.preload_for_fork），再 fork 出各 worker，
+模型和 LangChain 对象占用的内存由所有 worker 写时复制共享，而不是每个 worker 各加载一份。
+fork 前后要注意的几件事：
+    - 主进程里 torch 只用 1 个线程，避免 fork 前创建 OpenMP 线程池（子进程里会卡死），worker 里再设回来
+    - gc.freeze() 把预加载的对象移出垃圾回收的扫描范围，否则 GC 改写对象头会让共享页被逐页复制
+    - 检查点的 SQLite 连接在 worker 里重新打开；Milvus 连接、工作线程、预热都在 worker 第一次处理请求时才创建
+每个 worker 初始化后打印自己的 RSS/PSS/USS；运行中用 python -m utils.memory_report <主进程 pid> 查看全部进程
+"""
+import gc
+import os
+
+from utils.env_utils import EMBEDDING_BACKEND
+
+bind = os.getenv("BIND", "0.0.0.0:8001")
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))  # /api/chat/message 的长轮询会占住一个线程
+timeout = 3000
+preload_app = True
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", max(1, (os.cpu_count() or 1) // workers)))
+
+
+def _set_torch_threads(n: int):
+    if EMBEDDING_BACKEND != "torch":
+        return
+    import torch
+    torch.set_num_threads(n)
+
+
+# 配置文件在预加载 app 之前执行
+_set_torch_threads(1)
+
+
+def when_ready(server):
+    # 在 fork 出第一个 worker 之前执行
+    import app
+    from utils.memory_report import process_memory
+    from utils.startup import startup_phase
+
+    with startup_phase("preload_for_fork"):
+        app.preload_for_fork()
+    gc.freeze()
+    server.log.info(f"主进程预加载完成，内存: {process_memory()}")
+
+
+def post_fork(server, worker):
+    _set_torch_threads(TORCH_THREADS_PER_WORKER)
+    import app
+    app.reset_after_fork()
+
+
+def post_worker_init(worker):
+    from utils.memory_report import process_memory
+    worker.log.info(f"worker {worker.pid} 初始化完成，内存: {process_memory()}")
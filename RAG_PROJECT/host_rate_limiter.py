@@ -0,0 +1,160 @@
+# host_rate_limiter.py
+# 下载器的按 host 自适应限流：令牌桶限制请求速率，AIMD 调整并发上限，
+# 正确处理 429/503 的 Retry-After，失败重试使用带抖动的指数退避
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+INITIAL_HOST_CONCURRENCY = 4.0
+MAX_HOST_CONCURRENCY = 16.0
+MIN_HOST_CONCURRENCY = 1.0
+INITIAL_HOST_RATE = 4.0  # 每秒请求数
+MAX_HOST_RATE = 20.0
+MIN_HOST_RATE = 0.2
+HOST_BURST = 4
+LATENCY_TARGET = 10.0  # 首字节延迟超过该秒数视为拥塞信号
+DEFAULT_THROTTLE_PAUSE = 30.0  # 429/503 没有 Retry-After 时暂停该 host 的秒数
+MAX_RETRY_AFTER = 600.0
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 60.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After 可以是秒数，也可以是 HTTP 日期"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return min(float(value), MAX_RETRY_AFTER)
+    try:
+        delay = parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+    return min(max(delay, 0.0), MAX_RETRY_AFTER)
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次失败后的等待时间：指数增长 + 抖动（equal jitter）"""
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostController:
+    """单个 host 的限流状态：AIMD 并发上限 + 令牌桶速率 + Retry-After 暂停"""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.limit = INITIAL_HOST_CONCURRENCY
+        self.bucket = TokenBucket(INITIAL_HOST_RATE, HOST_BURST)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.latency: Optional[float] = None
+        self.counts = {'ok': 0, 'throttled': 0, 'error': 0}
+        self._waiters: List[asyncio.Future] = []
+
+    def _wake(self):
+        # 被唤醒的协程会重新检查并发上限，多唤醒不会超发
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.pop(0)
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        loop = asyncio.get_running_loop()
+        while self.in_flight >= int(self.limit):
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+        try:
+            # 被 Retry-After 暂停的 host，到时间后再发请求
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self.bucket.acquire()
+            yield self
+        finally:
+            self.in_flight -= 1
+            self._wake()
+
+    def on_success(self, latency: float):
+        self.counts['ok'] += 1
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if latency > LATENCY_TARGET:
+            # 延迟变高，小幅收缩
+            self.limit = max(MIN_HOST_CONCURRENCY, self.limit * 0.9)
+            return
+        # 加性增：大约每个并发窗口的请求都成功后并发 +1
+        self.limit = min(MAX_HOST_CONCURRENCY, self.limit + 1 / self.limit)
+        self.bucket.rate = min(MAX_HOST_RATE, self.bucket.rate + 0.5 / self.limit)
+        self._wake()
+
+    def on_throttle(self, retry_after: Optional[float]):
+        """429/503：并发和速率都减半，并暂停该 host 直到 Retry-After 到期"""
+        self.counts['throttled'] += 1
+        self.limit = max(MIN_HOST_CONCURRENCY, self.limit / 2)
+        self.bucket.rate = max(MIN_HOST_RATE, self.bucket.rate / 2)
+        pause = retry_after if retry_after is not None else DEFAULT_THROTTLE_PAUSE
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+
+    def on_error(self):
+        """超时、连接错误、5xx：乘性减"""
+        self.counts['error'] += 1
+        self.limit = max(MIN_HOST_CONCURRENCY, self.limit * 0.7)
+
+    def report(self) -> str:
+        latency = f"{self.latency:.2f}s" if self.latency is not None else '-'
+        return (f"[限流] {self.host}: 并发上限={self.limit:.1f} 速率={self.bucket.rate:.1f}/s 首字节延迟={latency} "
+                f"成功={self.counts['ok']} 限流={self.counts['throttled']} 错误={self.counts['error']}")
+
+
+class HostRateLimiter:
+    """按 host 管理 HostController"""
+
+    def __init__(self):
+        self.hosts: Dict[str, HostController] = {}
+
+    def for_url(self, url: str) -> HostController:
+        host = urlsplit(url).hostname or ''
+        controller = self.hosts.get(host)
+        if controller is None:
+            controller = self.hosts[host] = HostController(host)
+        return controller
+
+    def report(self, top: int = 20) -> str:
+        controllers = sorted(self.hosts.values(), key=lambda c: -sum(c.counts.values()))
+        return "\n".join(c.report() for c in controllers[:top])
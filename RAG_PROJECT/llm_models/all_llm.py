@@ -1,16 +1,22 @@
 from langchain_community.tools import TavilySearchResults
-from langchain_openai import ChatOpenAI
 
-from utils.env_utils import LLM_API_KEY, TAVILY_API_KEY
+from llm_models.llm_gateway import GatewayChatOpenAI, pooled_http_client
+from tools.local_search_tool import LocalSearchTool
+from utils.env_utils import LLM_API_KEY, LOCAL_SEARCH_CORPUS, TAVILY_API_KEY, WEB_SEARCH_BACKEND
 
-llm = ChatOpenAI(
+# 经过网关的 LLM：共享连接池、并发排队、相同请求合并
+llm = GatewayChatOpenAI(
     temperature=0,
     model='claude-3-5-sonnet-20241022',  # 用不起sonnet...
     api_key=LLM_API_KEY,
-    base_url="https://www.chataiapi.com/v1"
+    base_url="https://www.chataiapi.com/v1",
+    http_client=pooled_http_client()
 )
 
-web_search_tool = TavilySearchResults(max_results=2, api_key=TAVILY_API_KEY)
+if WEB_SEARCH_BACKEND == 'local':
+    web_search_tool = LocalSearchTool.from_jsonl(LOCAL_SEARCH_CORPUS, max_results=2)
+else:
+    web_search_tool = TavilySearchResults(max_results=2, api_key=TAVILY_API_KEY)
 
 # llm = ChatOpenAI(
 #     temperature=0.5,
@@ -1,10 +1,58 @@
 import os
-from langchain_huggingface import HuggingFaceEmbeddings
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from llm_models.embedding_service import MicroBatchEmbeddings
+from utils.env_utils import EMBEDDING_BACKEND
+from utils.log_utils import log
+from utils.startup import LazyResource
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 model_name = os.path.join(current_dir, "bge-small-zh-v1.5")
 model_kwargs = {"device": "cpu"}
 encode_kwargs = {"normalize_embeddings": True}
-bge_embedding = HuggingFaceEmbeddings(
-    model_name=model_name, model_kwargs=model_kwargs, encode_kwargs=encode_kwargs
-)
\ No newline at end of file
+
+
+def _load_torch_bge() -> Embeddings:
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=model_name, model_kwargs=model_kwargs, encode_kwargs=encode_kwargs
+    )
+
+
+def _load_bge() -> Embeddings:
+    if EMBEDDING_BACKEND in ('onnx', 'onnx-int8'):
+        from llm_models.onnx_embeddings import OnnxBgeEmbeddings, verify_agreement
+        model = OnnxBgeEmbeddings(model_name, quantize=EMBEDDING_BACKEND == 'onnx-int8')
+        # 已有索引是 torch 向量，ONNX 模型和 torch 对比一致才启用，否则退回 torch
+        report = verify_agreement(model, _load_torch_bge)
+        if report["passed"]:
+            return model
+        log.error(f"EMBEDDING_BACKEND={EMBEDDING_BACKEND} 与 torch 向量不一致 {report}，退回 torch 后端")
+    return _load_torch_bge()
+
+
+# 加载和第一次推理分成两个资源：gunicorn 主进程 fork 前只加载权重，推理（会创建线程池）留给各 worker
+bge_model = LazyResource("bge_embedding", _load_bge)
+# 第一次推理要初始化算子，放在预热阶段而不是第一个请求里
+bge_first_inference = LazyResource("bge_first_inference", lambda: bge_model.get().embed_query("预热"))
+
+
+class LazyEmbeddings(Embeddings):
+    """导入时不加载模型，第一次 embed（或 warm_up）时才加载"""
+
+    def __init__(self, resource: LazyResource):
+        self.resource = resource
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.resource.get().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.resource.get().embed_query(text)
+
+
+bge_embedding = LazyEmbeddings(bge_model)
+
+# 在线查询用：并发请求的 embed_query 合并成微批次，由同一个线程执行（入库脚本仍直接用 bge_embedding）
+bge_query_embedding = MicroBatchEmbeddings(bge_embedding)
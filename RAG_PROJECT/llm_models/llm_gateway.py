@@ -0,0 +1,148 @@
+"""
+LLM 网关：所有 chain 共用的 ChatOpenAI 在这里加三层保护
+    1. 共享的长连接 httpx 连接池
+    2. 全局 + 按 chain 的并发上限，超出的调用排队等待
+    3. single-flight：完全相同的请求（消息、工具、参数都一致）同时在途时只发一次，其余调用共享结果
+
+chain 名来自 chain_config 设置的 "chain:" tag，和 /api/metrics 里的 chain 标签一致。
+只拦截同步的 _generate（工作流是同步执行的），异步调用直接透传。
+"""
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+import httpx
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai import ChatOpenAI
+
+from utils.tracing import chain_name_from_tags, metrics
+
+LLM_MAX_CONNECTIONS = 32
+LLM_MAX_KEEPALIVE = 16
+LLM_KEEPALIVE_EXPIRY = 60
+LLM_HTTP_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+LLM_MAX_CONCURRENCY = 16  # 全局同时在途的 LLM 调用数
+DEFAULT_CHAIN_CONCURRENCY = 8
+CHAIN_CONCURRENCY = {
+    "generate": 8,
+    "retrieval_grader": 6,  # 每个请求要评估多篇文档，限制它不把全局配额占满
+    "history_summarizer": 2,  # 后台任务，让给在线请求
+}
+LLM_QUEUE_TIMEOUT = 60.0  # 排队超过这么久仍拿不到配额则报错
+LLM_COALESCE = True  # 只在 temperature=0（输出确定）时才合并相同请求
+
+metrics.histogram("rag_llm_queue_seconds", "LLM 调用在网关排队等待并发配额的时间")
+metrics.counter("rag_llm_coalesced_total", "与在途的相同请求合并、未实际发出的 LLM 调用数")
+
+
+class LLMQueueTimeout(RuntimeError):
+    """排队等待并发配额超时"""
+
+
+def pooled_http_client() -> httpx.Client:
+    """所有 LLM 调用共用的连接池，复用 TCP/TLS 连接"""
+    limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                          max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                          keepalive_expiry=LLM_KEEPALIVE_EXPIRY)
+    return httpx.Client(limits=limits, timeout=LLM_HTTP_TIMEOUT)
+
+
+class _ConcurrencyLimiter:
+    """全局信号量 + 每个 chain 一个信号量；先拿 chain 的再拿全局的，避免某个 chain 排队时占着全局配额"""
+
+    def __init__(self, total: int = LLM_MAX_CONCURRENCY):
+        self._total = threading.BoundedSemaphore(total)
+        self._chains: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _chain_sem(self, chain: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._chains.get(chain)
+            if sem is None:
+                sem = self._chains[chain] = threading.BoundedSemaphore(
+                    CHAIN_CONCURRENCY.get(chain, DEFAULT_CHAIN_CONCURRENCY))
+            return sem
+
+    def acquire(self, chain: str, timeout: float = LLM_QUEUE_TIMEOUT):
+        start = time.perf_counter()
+        chain_sem = self._chain_sem(chain)
+        if not chain_sem.acquire(timeout=timeout):
+            raise LLMQueueTimeout(f"chain={chain} 排队超过 {timeout}s")
+        remaining = max(0.0, timeout - (time.perf_counter() - start))
+        if not self._total.acquire(timeout=remaining):
+            chain_sem.release()
+            raise LLMQueueTimeout(f"全局 LLM 并发已满，chain={chain} 排队超过 {timeout}s")
+        metrics.observe("rag_llm_queue_seconds", time.perf_counter() - start, chain=chain)
+
+    def release(self, chain: str):
+        self._total.release()
+        self._chain_sem(chain).release()
+
+
+_limiter = _ConcurrencyLimiter()
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def _request_key(model: ChatOpenAI, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]) -> str:
+    payload = {
+        "model": model.model_name,
+        "temperature": model.temperature,
+        "messages": [m.model_dump(exclude={"id"}) for m in messages],
+        "stop": stop,
+        "kwargs": kwargs,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def _shared_result(result: ChatResult) -> ChatResult:
+    """给合并的调用返回的结果：去掉 token 用量，避免同一次上游调用在 metrics 里被重复计数"""
+    generations = [
+        ChatGeneration(message=g.message.model_copy(update={"usage_metadata": None}), generation_info=g.generation_info)
+        for g in result.generations
+    ]
+    return ChatResult(generations=generations, llm_output={"coalesced": True})
+
+
+class GatewayChatOpenAI(ChatOpenAI):
+    """ChatOpenAI + 网关；with_structured_output/bind_tools 生成的绑定最终也走到 _generate，同样受保护"""
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        chain = chain_name_from_tags(run_manager.tags if run_manager else None,
+                                     run_manager.metadata if run_manager else None)
+        if not (LLM_COALESCE and not self.temperature):
+            return self._limited_generate(chain, messages, stop, run_manager, **kwargs)
+
+        key = _request_key(self, messages, stop, kwargs)
+        with _inflight_lock:
+            leader = _inflight.get(key)
+            if leader is None:
+                future = _inflight[key] = Future()
+        if leader is not None:
+            # 相同请求已经在途，等它的结果（它失败时这里也抛出同样的异常）
+            metrics.inc("rag_llm_coalesced_total", chain=chain)
+            return _shared_result(leader.result())
+
+        try:
+            result = self._limited_generate(chain, messages, stop, run_manager, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+
+    def _limited_generate(self, chain: str, messages, stop, run_manager, **kwargs) -> ChatResult:
+        _limiter.acquire(chain)
+        try:
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        finally:
+            _limiter.release(chain)
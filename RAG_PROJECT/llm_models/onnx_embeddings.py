@@ -0,0 +1,294 @@
+"""
+bge-small-zh 的 ONNX Runtime 后端：和 HuggingFaceEmbeddings 同样的模型、同样的分词和 CLS 池化 + L2 归一化，
+可选 INT8 动态量化。第一次使用时从本地模型目录导出 ONNX（需要 torch），之后直接加载导出的文件。
+
+基准：对比 torch / onnx / onnx-int8 的单条查询延迟、批量吞吐，以及和 torch 向量的余弦一致性、
+近邻检索的重合度（用来确认已有索引不用重建）。结果写到 logs/embedding_benchmark.json。
+
+已有索引是 torch 向量建的，所以 ONNX 模型第一次加载前要先和 torch 对比一致性（verify_agreement），
+低于阈值不启用，由调用方退回 torch。结果按模型文件缓存在 onnx/agreement.json，之后启动不再重复对比。
+
+    python -m llm_models.onnx_embeddings --texts 512
+"""
+import argparse
+import inspect
+import json
+import math
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from filelock import FileLock
+from langchain_core.embeddings import Embeddings
+
+from utils.log_utils import log, log_dir
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bge-small-zh-v1.5")
+ONNX_DIR = os.path.join(MODEL_DIR, "onnx")
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+ONNX_LOCK_FILE = ".export.lock"
+AGREEMENT_FILE = "agreement.json"
+ONNX_OPSET = 14
+MAX_SEQ_LENGTH = 512  # 和 sentence_bert_config.json 一致
+EMBED_BATCH_SIZE = 32
+ONNX_INTRA_OP_THREADS = 0  # 0 表示由 onnxruntime 按 CPU 核数决定
+RESULT_FILE = os.path.join(log_dir, "embedding_benchmark.json")
+# 和 torch 向量的一致性阈值：逐条余弦的最小值、检索 top10 重合率，任一不达标就不启用该 ONNX 模型
+MIN_COSINE = {"onnx": 0.999, "onnx-int8": 0.98}
+MIN_TOP10_OVERLAP = {"onnx": 0.98, "onnx-int8": 0.9}
+AGREEMENT_TEXTS = 128
+
+
+def _tmp_path(path: str) -> str:
+    """先写到同目录的临时文件，完成后 os.replace 原子替换，其他进程不会读到写了一半的模型"""
+    return f"{path}.tmp-{os.getpid()}"
+
+
+def export_onnx(model_dir: str = MODEL_DIR, output_path: Optional[str] = None) -> str:
+    """把 transformer + CLS 池化 + 归一化导出成一个 ONNX 图，输出即最终向量"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    output_path = output_path or os.path.join(ONNX_DIR, ONNX_FP32_FILE)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModel.from_pretrained(model_dir).eval()
+
+    class _SentenceEmbedding(torch.nn.Module):
+        def __init__(self, encoder):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            hidden = self.encoder(input_ids=input_ids, attention_mask=attention_mask,
+                                  token_type_ids=token_type_ids).last_hidden_state
+            return torch.nn.functional.normalize(hidden[:, 0], p=2, dim=1)
+
+    sample = tokenizer(["导出用的样例文本", "sample"], padding=True, return_tensors="pt")
+    dynamic = {0: "batch", 1: "sequence"}
+    export_kwargs = {}
+    # torch 2.5 起才有 dynamo 参数，2.9 起默认 True；这里用的是 dynamic_axes，要固定走 TorchScript 导出
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs["dynamo"] = False
+    tmp_path = _tmp_path(output_path)
+    with torch.no_grad():
+        torch.onnx.export(
+            _SentenceEmbedding(model),
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            tmp_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["sentence_embedding"],
+            dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "token_type_ids": dynamic,
+                          "sentence_embedding": {0: "batch"}},
+            opset_version=ONNX_OPSET,
+            **export_kwargs,
+        )
+    os.replace(tmp_path, output_path)
+    log.info(f"已导出 ONNX 模型: {output_path}")
+    return output_path
+
+
+def quantize_onnx(input_path: str, output_path: str) -> str:
+    """INT8 动态量化：权重离线量化，激活在推理时按批动态量化，不需要校准数据"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp_path = _tmp_path(output_path)
+    quantize_dynamic(input_path, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, output_path)
+    log.info(f"已生成 INT8 量化模型: {output_path}")
+    return output_path
+
+
+def ensure_onnx_model(quantize: bool = False, model_dir: str = MODEL_DIR) -> str:
+    """
+    返回 ONNX 模型路径，文件不存在时先导出/量化。
+    多个 gunicorn worker 冷启动时会同时走到这里，用文件锁保证只有一个进程导出，其他进程等它完成后直接加载
+    """
+    onnx_dir = os.path.join(model_dir, "onnx")
+    fp32_path = os.path.join(onnx_dir, ONNX_FP32_FILE)
+    int8_path = os.path.join(onnx_dir, ONNX_INT8_FILE)
+    path = int8_path if quantize else fp32_path
+    if os.path.exists(path):
+        return path
+    os.makedirs(onnx_dir, exist_ok=True)
+    with FileLock(os.path.join(onnx_dir, ONNX_LOCK_FILE)):
+        if not os.path.exists(fp32_path):
+            export_onnx(model_dir, fp32_path)
+        if quantize and not os.path.exists(int8_path):
+            quantize_onnx(fp32_path, int8_path)
+    return path
+
+
+class OnnxBgeEmbeddings(Embeddings):
+    """ONNX Runtime 上运行的 bge，接口和 HuggingFaceEmbeddings 相同，可以直接替换"""
+
+    def __init__(self, model_dir: str = MODEL_DIR, quantize: bool = False, batch_size: int = EMBED_BATCH_SIZE,
+                 intra_op_threads: int = ONNX_INTRA_OP_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_path = ensure_onnx_model(quantize, model_dir)
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self._lock = threading.Lock()  # 分词器（fast tokenizer）不保证线程安全
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH,
+                                    return_tensors="np")
+        inputs = {name: tokens[name].astype(np.int64) for name in self._input_names}
+        return self.session.run(["sentence_embedding"], inputs)[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        # 按长度排序再分批，减少同一批里的 padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            vectors.extend(zip(batch, self._encode([texts[i] for i in batch]).tolist()))
+        return [v for _, v in sorted(vectors, key=lambda x: x[0])]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+_ZH_PHRASES = (
+    "注意力机制", "检索增强生成", "大语言模型", "向量数据库", "预训练", "微调", "知识蒸馏", "强化学习",
+    "图神经网络", "多模态", "文本分类", "机器翻译", "问答系统", "长上下文", "推理加速", "量化",
+)
+_EN_WORDS = (
+    "model attention transformer layer token embedding retrieval generation training loss gradient "
+    "dataset benchmark neural network graph policy reward agent encoder decoder latency throughput"
+).split()
+
+
+def sample_texts(n: int, seed: int = 20240601) -> List[str]:
+    """中英混合的短查询和长段落各占一半，接近线上查询和入库的分块"""
+    rng = random.Random(seed)
+    texts = []
+    for i in range(n):
+        words = rng.randint(4, 10) if i % 2 == 0 else rng.randint(60, 160)
+        texts.append("".join(rng.choice(_ZH_PHRASES) if rng.random() < 0.5 else " " + rng.choice(_EN_WORDS)
+                             for _ in range(words)).strip())
+    return texts
+
+
+def _percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def benchmark_backend(embeddings: Embeddings, queries: List[str], documents: List[str]) -> Dict:
+    embeddings.embed_documents(documents[:EMBED_BATCH_SIZE])  # 预热
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        embeddings.embed_query(q)
+        latencies.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    doc_vectors = np.asarray(embeddings.embed_documents(documents), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+    query_vectors = np.asarray([embeddings.embed_query(q) for q in queries], dtype=np.float32)
+    return {
+        "query_p50_ms": round(_percentile(latencies, 50), 3),
+        "query_p95_ms": round(_percentile(latencies, 95), 3),
+        "docs_per_sec": round(len(documents) / elapsed, 1),
+        "_docs": doc_vectors,
+        "_queries": query_vectors,
+    }
+
+
+def agreement(reference: Dict, candidate: Dict, k: int = 10) -> Dict:
+    """和参考向量的逐条余弦，以及用同一批查询检索文档时 top-k 的重合率"""
+    doc_cos = np.sum(reference["_docs"] * candidate["_docs"], axis=1)
+    query_cos = np.sum(reference["_queries"] * candidate["_queries"], axis=1)
+    ref_top = np.argsort(-reference["_queries"] @ reference["_docs"].T, axis=1)[:, :k]
+    cand_top = np.argsort(-candidate["_queries"] @ reference["_docs"].T, axis=1)[:, :k]
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)]
+    return {
+        "cosine_mean": round(float(np.mean(np.concatenate([doc_cos, query_cos]))), 5),
+        "cosine_min": round(float(np.min(np.concatenate([doc_cos, query_cos]))), 5),
+        f"top{k}_overlap_vs_torch_index": round(float(np.mean(overlap)), 4),
+    }
+
+
+def check_agreement(backend: str, report: Dict) -> bool:
+    return (report["cosine_min"] >= MIN_COSINE[backend]
+            and report["top10_overlap_vs_torch_index"] >= MIN_TOP10_OVERLAP[backend])
+
+
+def _encode_all(embeddings: Embeddings, queries: List[str], documents: List[str]) -> Dict:
+    return {"_docs": np.asarray(embeddings.embed_documents(documents), dtype=np.float32),
+            "_queries": np.asarray([embeddings.embed_query(q) for q in queries], dtype=np.float32)}
+
+
+def verify_agreement(embeddings: OnnxBgeEmbeddings, reference_factory: Callable[[], Embeddings]) -> Dict:
+    """
+    确认 ONNX 模型和 torch 的向量一致，返回一致性报告（passed 字段表示是否达标）。
+    结果按模型文件（路径、大小、修改时间）缓存，模型重新导出后会重新对比；多个 worker 同时启动时只有一个去算
+    """
+    backend = "onnx-int8" if embeddings.model_path.endswith(ONNX_INT8_FILE) else "onnx"
+    onnx_dir = os.path.dirname(embeddings.model_path)
+    stat = os.stat(embeddings.model_path)
+    key = f"{os.path.basename(embeddings.model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+    cache_path = os.path.join(onnx_dir, AGREEMENT_FILE)
+    with FileLock(os.path.join(onnx_dir, ONNX_LOCK_FILE)):
+        cache = {}
+        if os.path.exists(cache_path):
+            with open(cache_path, encoding="utf-8") as f:
+                cache = json.load(f)
+        if key in cache:
+            return cache[key]
+        documents = sample_texts(AGREEMENT_TEXTS)
+        queries = sample_texts(AGREEMENT_TEXTS // 2, seed=7)[::2]
+        report = agreement(_encode_all(reference_factory(), queries, documents),
+                           _encode_all(embeddings, queries, documents))
+        report.update(backend=backend, min_cosine=MIN_COSINE[backend], passed=check_agreement(backend, report))
+        cache[key] = report
+        tmp_path = _tmp_path(cache_path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, cache_path)
+    log.info(f"{backend} 与 torch 一致性: {report}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="bge-small-zh：torch vs ONNX vs ONNX INT8")
+    parser.add_argument("--texts", type=int, default=512, help="文档条数，查询条数为其 1/4")
+    parser.add_argument("--threads", type=int, default=ONNX_INTRA_OP_THREADS)
+    args = parser.parse_args()
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    documents = sample_texts(args.texts)
+    queries = sample_texts(max(16, args.texts // 2), seed=7)[::2]  # 只取短文本当查询
+    backends = {
+        "torch": lambda: HuggingFaceEmbeddings(model_name=MODEL_DIR, model_kwargs={"device": "cpu"},
+                                               encode_kwargs={"normalize_embeddings": True}),
+        "onnx": lambda: OnnxBgeEmbeddings(quantize=False, intra_op_threads=args.threads),
+        "onnx-int8": lambda: OnnxBgeEmbeddings(quantize=True, intra_op_threads=args.threads),
+    }
+    results = {name: benchmark_backend(factory(), queries, documents) for name, factory in backends.items()}
+    report = {}
+    for name, r in results.items():
+        report[name] = {key: value for key, value in r.items() if not key.startswith("_")}
+        if name != "torch":
+            report[name].update(agreement(results["torch"], r))
+            report[name]["passed"] = check_agreement(name, report[name])
+        log.info(f"{name}: {report[name]}")
+    with open(RESULT_FILE, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    log.info(f"结果已写入 {RESULT_FILE}")
+    failed = [name for name, r in report.items() if name != "torch" and not r["passed"]]
+    if failed:
+        raise SystemExit(f"{failed} 与 torch 向量一致性低于阈值 {MIN_COSINE}，不能替换已有索引的向量")
@@ -0,0 +1,214 @@
+"""
+离线压测用的假后端：确定性的假 LLM（支持 with_structured_output）、假网络搜索、内存检索器、假 embedding。
+install() 把它们注册成 llm_models.all_llm / tools.retriever_tools / llm_models.embeddings_model，
+必须在导入 app / graph2 之前调用；导入 app 之后用 assert_no_real_resources() 确认没有加载真实的模型和连接。
+
+同一输入的输出和延迟都由输入内容的哈希决定，两次压测可以直接对比。
+"""
+import hashlib
+import json
+import random
+import sys
+import time
+import types
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForLLMRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableLambda
+
+from utils.tracing import chain_name_from_tags
+
+# 延迟分布：(中位数秒数, 对数正态的 sigma)，按 chain 名配置
+LLM_LATENCY: Dict[str, Tuple[float, float]] = {
+    "question_router": (0.6, 0.3),
+    "retrieval_grader": (0.4, 0.3),
+    "hallucination_grader": (0.5, 0.3),
+    "answer_grader": (0.5, 0.3),
+    "generate": (2.5, 0.4),
+    "llm_direct": (2.0, 0.4),
+    "query_rewriter": (0.8, 0.3),
+    "search_query_rewriter": (0.8, 0.3),
+    "history_summarizer": (1.5, 0.3),
+}
+DEFAULT_LLM_LATENCY = (0.8, 0.4)
+SEARCH_LATENCY = (1.2, 0.4)
+RETRIEVER_LATENCY = (0.15, 0.3)
+FAKE_EMBEDDING_DIM = 512  # 和 bge-small-zh 一致
+LATENCY_SCALE = 1.0  # 整体缩放，快速跑一遍时设小
+
+ROUTE_MIX = (("vectorstore", 0.7), ("web_search", 0.2), ("llm_direct", 0.1))  # 路由结果的比例
+GRADE_YES_RATE = 0.8  # 各评分器回答 yes 的比例
+
+_VOCAB = (
+    "model attention transformer layer token embedding retrieval generation training loss gradient "
+    "dataset benchmark neural network graph node edge policy reward agent language vision encoder "
+    "decoder query key value head residual normalization dropout optimizer learning rate batch"
+).split()
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+
+def _fraction(text: str, salt: str = "") -> float:
+    """把文本映射到 [0, 1) 的确定值"""
+    return _digest(salt + text) / 2 ** 64
+
+
+def sample_latency(spec: Tuple[float, float], key: str) -> float:
+    median, sigma = spec
+    rng = random.Random(_digest(key))
+    return median * rng.lognormvariate(0, sigma) * LATENCY_SCALE
+
+
+def _pick_route(text: str) -> str:
+    x = _fraction(text, "route")
+    for route, share in ROUTE_MIX:
+        if x < share:
+            return route
+        x -= share
+    return ROUTE_MIX[-1][0]
+
+
+def _structured_answer(schema_name: str, text: str) -> dict:
+    if schema_name == "RouteQuery":
+        return {"datasource": _pick_route(text)}
+    # GradeDocuments / GradeAnswer / GradeHallucinations 都只有 binary_score
+    return {"binary_score": "yes" if _fraction(text, schema_name) < GRADE_YES_RATE else "no"}
+
+
+class FakeChatModel(BaseChatModel):
+    """确定性的假 LLM：按 chain 名采样延迟；with_structured_output 返回对应 schema 的实例"""
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-loadtest"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        chain = chain_name_from_tags(run_manager.tags if run_manager else None,
+                                     run_manager.metadata if run_manager else None)
+        text = "\n".join(str(m.content) for m in messages)
+        time.sleep(sample_latency(LLM_LATENCY.get(chain, DEFAULT_LLM_LATENCY), chain + text))
+        schema_name = kwargs.get("schema_name")
+        if schema_name:
+            content = json.dumps(_structured_answer(schema_name, text))
+        else:
+            rng = random.Random(_digest(text))
+            content = " ".join(rng.choice(_VOCAB) for _ in range(rng.randint(40, 120)))
+        usage = {"input_tokens": len(text) // 2, "output_tokens": len(content) // 4,
+                 "total_tokens": len(text) // 2 + len(content) // 4}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))])
+
+    def with_structured_output(self, schema, **kwargs):
+        # 经过 _generate（有回调、有 trace），再把 JSON 解析成 schema 实例
+        return self.bind(schema_name=schema.__name__) | RunnableLambda(
+            lambda message: schema(**json.loads(message.content)))
+
+
+class FakeWebSearchTool:
+    """和 TavilySearchResults 一样 invoke({"query": ...}) 返回 [{"url", "content"}]"""
+
+    def __init__(self, max_results: int = 2):
+        self.max_results = max_results
+
+    def invoke(self, tool_input: dict, config=None) -> List[dict]:
+        query = tool_input["query"]
+        time.sleep(sample_latency(SEARCH_LATENCY, "search" + query))
+        rng = random.Random(_digest(query))
+        return [
+            {"url": f"https://example.com/{i}",
+             "content": " ".join(rng.choice(_VOCAB) for _ in range(rng.randint(80, 200)))}
+            for i in range(self.max_results)
+        ]
+
+
+def build_corpus(num_docs: int = 2000, seed: int = 20240601) -> List[Document]:
+    rng = random.Random(seed)
+    return [
+        Document(page_content=" ".join(rng.choice(_VOCAB) for _ in range(rng.randint(60, 200))),
+                 metadata={"source": f"paper_{i // 20:04d}.pdf", "category": "content"})
+        for i in range(num_docs)
+    ]
+
+
+class InMemoryRetriever(BaseRetriever):
+    """按词重叠打分的内存检索器，替代 Milvus；另外按 RETRIEVER_LATENCY 模拟网络往返"""
+
+    documents: List[Document]
+    k: int = 6
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        time.sleep(sample_latency(RETRIEVER_LATENCY, "retrieve" + query))
+        terms = set(query.lower().split())
+        scored = sorted(self.documents, key=lambda d: -len(terms.intersection(d.page_content.split())))
+        return scored[:self.k]
+
+
+class FakeEmbeddings(Embeddings):
+    """按文本哈希生成的确定性单位向量，不加载模型"""
+
+    def embed_query(self, text: str) -> List[float]:
+        rng = random.Random(_digest(text))
+        vector = [rng.gauss(0, 1) for _ in range(FAKE_EMBEDDING_DIM)]
+        norm = sum(x * x for x in vector) ** 0.5
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(t) for t in texts]
+
+
+class _ReadyResource:
+    """代替 LazyResource：不注册到 utils.startup，预热和 /readyz 不会去加载真实模型"""
+
+    def __init__(self, value):
+        self._value = value
+        self.ready = True
+
+    def get(self):
+        return self._value
+
+
+# install() 替换的模块；真实版本导入时会注册 bge / Milvus 的 LazyResource，预热时去加载模型、连接 Milvus
+_FAKE_MODULES = ("llm_models.all_llm", "tools.retriever_tools", "llm_models.embeddings_model")
+
+
+def install(num_docs: int = 2000):
+    """注册假后端，替换真实的 LLM / Tavily / Milvus / bge 模块"""
+    if "graph2.graph_2" in sys.modules:
+        raise RuntimeError("fakes.install() 必须在导入 app / graph2 之前调用")
+    loaded = [name for name in _FAKE_MODULES if name in sys.modules]
+    if loaded:
+        raise RuntimeError(f"fakes.install() 之前已经导入了真实模块 {loaded}")
+    all_llm = types.ModuleType("llm_models.all_llm")
+    all_llm.llm = FakeChatModel()
+    all_llm.web_search_tool = FakeWebSearchTool()
+    sys.modules["llm_models.all_llm"] = all_llm
+
+    retriever_tools = types.ModuleType("tools.retriever_tools")
+    retriever_tools.retriever = InMemoryRetriever(documents=build_corpus(num_docs))
+    sys.modules["tools.retriever_tools"] = retriever_tools
+
+    embeddings = FakeEmbeddings()
+    embeddings_model = types.ModuleType("llm_models.embeddings_model")
+    embeddings_model.bge_model = _ReadyResource(embeddings)
+    embeddings_model.bge_embedding = embeddings
+    embeddings_model.bge_query_embedding = embeddings
+    sys.modules["llm_models.embeddings_model"] = embeddings_model
+    for name in _FAKE_MODULES:
+        sys.modules[name].loadtest_fake = True
+
+
+def assert_no_real_resources():
+    """导入 app 之后调用：被替换的模块必须仍是假版本，且没有任何 LazyResource（模型、Milvus 连接）注册到预热列表"""
+    from utils.startup import _resources
+
+    real_modules = [name for name in _FAKE_MODULES if not getattr(sys.modules.get(name), "loadtest_fake", False)]
+    if real_modules or _resources:
+        raise RuntimeError(f"压测进程加载了真实后端：模块 {real_modules}，资源 {list(_resources)}")
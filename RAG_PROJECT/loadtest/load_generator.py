@@ -0,0 +1,198 @@
+"""
+离线端到端压测：假 LLM / 假搜索 / 内存检索器 + 进程内的 app.py HTTP 服务，
+按目标 RPS 开环提交 /api/chat/send 并轮询到完成，统计吞吐和各路由的 p50/p95/p99（含排队时间）。
+结果写到 logs/loadtest.json；指定 --max-p95 / --max-error-rate 时超限以非 0 退出，可以放进 CI。
+
+    python -m loadtest.load_generator --rps 5 --duration 60
+    python -m loadtest.load_generator --rps 20 --duration 30 --latency-scale 0.1 --max-p95 5
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from loadtest import fakes
+
+QUESTIONS = [
+    "transformer 的自注意力机制原理是什么？",
+    "RAG 检索增强生成和微调相比有什么优缺点？",
+    "BERT 的预训练任务有哪些？",
+    "今天的美元兑人民币汇率是多少？",
+    "用 Python 写一个快速排序",
+    "强化学习里的 policy gradient 是怎么推导的？",
+    "图神经网络的消息传递机制是什么？",
+    "LLaMA 和 GPT 的架构有哪些不同？",
+    "最近有什么关于大模型的新闻？",
+    "dropout 为什么能防止过拟合？",
+]
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    # nearest-rank
+    values = sorted(values)
+    index = max(0, math.ceil(p / 100 * len(values)) - 1)
+    return round(values[index], 4)
+
+
+def route_of(trace: Optional[dict]) -> str:
+    """从响应附带的 trace 里找路由结果：route_question 之后第一个执行的节点"""
+    if not trace:
+        return "unknown"
+    nodes = [s["name"] for s in trace.get("spans", []) if s["kind"] == "node"]
+    first = next((n for n in nodes if n != "route_question"), None)
+    return {"retrieve": "vectorstore", "web_search": "web_search", "llm_direct": "llm_direct"}.get(first, "unknown")
+
+
+def start_server(db_path: str, port: int = 0):
+    """在后台线程启动 app（已经装好假后端），返回 (server, base_url)"""
+    from werkzeug.serving import make_server
+
+    import app as app_module
+    from graph2.checkpointer import sqlite_checkpointer
+    from graph2.graph_2 import workflow
+    fakes.assert_no_real_resources()
+    app_module.DB_PATH = db_path
+    app_module.checkpointer = sqlite_checkpointer(os.path.join(os.path.dirname(db_path), "chat_checkpoints.db"))
+    app_module.graph = workflow.compile(checkpointer=app_module.checkpointer)
+    app_module.init_db()
+    app_module.ensure_chat_workers()
+    server = make_server("127.0.0.1", port, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="loadtest-server", daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    # 假后端没有需要预热的资源，/readyz 应该立即就绪；否则压测的是预热中的服务
+    try:
+        urllib.request.urlopen(f"{base_url}/readyz", timeout=10).close()
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f"/readyz 未就绪: {e.read()}") from e
+    return server, base_url
+
+
+def send(base_url: str, session_id: str, question: str, timeout: float) -> dict:
+    """提交一轮对话并长轮询到完成，延迟包含排队时间"""
+    body = json.dumps({"session_id": session_id, "question": question}).encode()
+    req = urllib.request.Request(f"{base_url}/api/chat/send", data=body,
+                                 headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            data = json.loads(resp.read())
+        while data["status"] not in ("done", "failed"):
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError(f"消息 {data['message_id']} 超过 {timeout}s 未完成")
+            with urllib.request.urlopen(f"{base_url}/api/chat/message/{data['message_id']}?wait=10&trace=1",
+                                        timeout=timeout) as resp:
+                data = json.loads(resp.read())
+        if data["status"] == "failed":
+            raise RuntimeError(f"消息 {data['message_id']} 执行失败")
+        return {"latency": time.perf_counter() - start, "route": route_of(data.get("trace")), "ok": True}
+    except Exception as e:
+        return {"latency": time.perf_counter() - start, "route": "error", "ok": False, "error": repr(e)}
+
+
+def run_load(base_url: str, rps: float, duration: float, sessions: int = 20, seed: int = 20240601,
+             max_workers: int = 256, timeout: float = 300) -> dict:
+    """开环压测：按固定间隔发请求，不等前面的请求返回，排队和超时都会反映在延迟里"""
+    rng = random.Random(seed)
+    total = int(rps * duration)
+    results: List[dict] = []
+    lock = threading.Lock()
+
+    def worker(session_id: str, question: str):
+        result = send(base_url, session_id, question, timeout)
+        with lock:
+            results.append(result)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i in range(total):
+            delay = start + i / rps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(worker, f"loadtest-{rng.randrange(sessions)}", rng.choice(QUESTIONS))
+    elapsed = time.perf_counter() - start
+    return summarize(results, elapsed, rps, duration)
+
+
+def summarize(results: List[dict], elapsed: float, rps: float, duration: float) -> dict:
+    by_route: Dict[str, List[float]] = {}
+    for r in results:
+        if r["ok"]:
+            by_route.setdefault(r["route"], []).append(r["latency"])
+    ok_latencies = [r["latency"] for r in results if r["ok"]]
+    errors = [r for r in results if not r["ok"]]
+
+    def stats(values: List[float]) -> dict:
+        return {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95),
+                "p99": percentile(values, 99), "max": round(max(values), 4) if values else None}
+
+    return {
+        "target_rps": rps,
+        "duration": duration,
+        "elapsed": round(elapsed, 2),
+        "requests": len(results),
+        "errors": len(errors),
+        "error_rate": round(len(errors) / len(results), 4) if results else 0,
+        "throughput_rps": round(len(ok_latencies) / elapsed, 3) if elapsed else None,
+        "overall": stats(ok_latencies),
+        "routes": {route: stats(values) for route, values in sorted(by_route.items())},
+        "sample_errors": [e["error"] for e in errors[:5]],
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [f"目标 {report['target_rps']} rps × {report['duration']}s，完成 {report['requests']} 个请求，"
+             f"吞吐 {report['throughput_rps']} rps，错误率 {report['error_rate']:.2%}",
+             f"{'route':<14}{'count':>8}{'p50(s)':>10}{'p95(s)':>10}{'p99(s)':>10}{'max(s)':>10}"]
+    for route, s in [("overall", report["overall"])] + list(report["routes"].items()):
+        lines.append(f"{route:<14}{s['count']:>8}{s['p50'] or 0:>10.2f}{s['p95'] or 0:>10.2f}"
+                     f"{s['p99'] or 0:>10.2f}{s['max'] or 0:>10.2f}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="app.py + graph2 离线压测")
+    parser.add_argument("--rps", type=float, default=5)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--sessions", type=int, default=20, help="模拟的会话数，同一会话的请求会累积对话历史")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="假后端延迟的整体缩放")
+    parser.add_argument("--seed", type=int, default=20240601)
+    parser.add_argument("--max-p95", type=float, default=None, help="整体 p95 超过该秒数时以非 0 退出")
+    parser.add_argument("--max-error-rate", type=float, default=None)
+    args = parser.parse_args()
+
+    fakes.LATENCY_SCALE = args.latency_scale
+    fakes.install()
+    from utils.log_utils import log, log_dir
+
+    db_file = os.path.join(tempfile.mkdtemp(prefix="loadtest_"), "chat_sessions.db")
+    server, url = start_server(db_file)
+    try:
+        result = run_load(url, args.rps, args.duration, args.sessions, args.seed)
+    finally:
+        server.shutdown()
+
+    result_file = os.path.join(log_dir, "loadtest.json")
+    with open(result_file, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    log.info("\n" + format_report(result))
+    log.info(f"压测结果已写入 {result_file}")
+
+    failed = []
+    if args.max_p95 is not None and (result["overall"]["p95"] or 0) > args.max_p95:
+        failed.append(f"p95 {result['overall']['p95']}s > {args.max_p95}s")
+    if args.max_error_rate is not None and result["error_rate"] > args.max_error_rate:
+        failed.append(f"错误率 {result['error_rate']} > {args.max_error_rate}")
+    if failed:
+        log.error("压测未达标：" + "；".join(failed))
+        sys.exit(1)
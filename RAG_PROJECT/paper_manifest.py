@@ -0,0 +1,235 @@
+# paper_manifest.py
+# 论文下载清单：SQLite 记录每篇论文的元数据、解析到的 PDF 链接、下载状态和每次尝试的历史，
+# 以及 DOI -> OA 链接的查询结果（包括查不到的），重跑时不再重复查询 Crossref/OA
+
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+STATUS_PENDING = 'pending'  # 已拿到 PDF 链接，等待下载
+STATUS_DOWNLOADED = 'downloaded'
+STATUS_FAILED = 'failed'  # 本轮多次尝试仍失败，冷却后由 requeue_failed 放回待下载
+STATUS_INVALID = 'invalid'  # 链接返回的不是 PDF，不再重试
+STATUS_DUPLICATE = 'duplicate'  # 与 arXiv 版本 DOI 相同的 Crossref 论文，不下载
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class PaperManifest:
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db = sqlite3.connect(db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.init_db()
+
+    def init_db(self):
+        c = self.db.cursor()
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS papers (
+            id TEXT PRIMARY KEY,
+            doi TEXT,
+            arxiv_id TEXT,
+            pdf_url TEXT,
+            status TEXT,
+            bytes INTEGER,
+            sha256 TEXT,
+            path TEXT,
+            attempts INTEGER DEFAULT 0,
+            created_at INTEGER,
+            updated_at INTEGER
+        )
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_papers_status ON papers(status)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_papers_doi ON papers(doi)')
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            paper_id TEXT,
+            status TEXT,
+            bytes INTEGER,
+            error TEXT,
+            created_at INTEGER,
+            FOREIGN KEY(paper_id) REFERENCES papers(id)
+        )
+        ''')
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS oa_lookups (
+            doi TEXT PRIMARY KEY,
+            pdf_url TEXT,
+            resolved_at INTEGER
+        )
+        ''')
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS harvest_cursors (
+            source TEXT,
+            query TEXT,
+            cursor TEXT,
+            fetched INTEGER,
+            done INTEGER,
+            updated_at INTEGER,
+            PRIMARY KEY (source, query)
+        )
+        ''')
+        self.db.commit()
+
+    def import_seen_ids(self, seen_ids_file: str, save_dir: str) -> int:
+        """把旧版 downloaded_ids.txt 里的记录导入为已下载，返回导入条数"""
+        if not os.path.exists(seen_ids_file):
+            return 0
+        now = int(time.time())
+        with open(seen_ids_file) as f:
+            pids = [line.strip() for line in f if line.strip()]
+        c = self.db.cursor()
+        for pid in pids:
+            path = os.path.join(save_dir, f"{pid}.pdf")
+            size = os.path.getsize(path) if os.path.exists(path) else None
+            c.execute(
+                'INSERT OR IGNORE INTO papers (id, status, bytes, path, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (pid, STATUS_DOWNLOADED, size, path, now, now)
+            )
+        self.db.commit()
+        return len(pids)
+
+    # ---------- 论文 ----------
+    def add_paper(self, paper: Dict):
+        """登记一篇待下载论文；已存在时只补全缺失字段，不改变下载状态"""
+        now = int(time.time())
+        self.db.execute('''
+            INSERT INTO papers (id, doi, arxiv_id, pdf_url, status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                doi = COALESCE(papers.doi, excluded.doi),
+                arxiv_id = COALESCE(papers.arxiv_id, excluded.arxiv_id),
+                pdf_url = COALESCE(papers.pdf_url, excluded.pdf_url)
+        ''', (paper['id'], paper.get('doi'), paper.get('arxiv_id'), paper['pdf_url'], STATUS_PENDING, now, now))
+        self.db.commit()
+
+    def has_paper(self, pid: str) -> bool:
+        return self.db.execute('SELECT 1 FROM papers WHERE id = ?', (pid,)).fetchone() is not None
+
+    def status_of(self, pid: str) -> Optional[str]:
+        row = self.db.execute('SELECT status FROM papers WHERE id = ?', (pid,)).fetchone()
+        return row['status'] if row else None
+
+    def pending_papers(self) -> List[Dict]:
+        rows = self.db.execute(
+            'SELECT id, doi, arxiv_id, pdf_url FROM papers WHERE status = ? ORDER BY created_at',
+            (STATUS_PENDING,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def requeue_failed(self, max_attempts: int, cooldown: int) -> int:
+        """
+        把可以再试的失败论文放回待下载：累计尝试次数少于 max_attempts，且最后一次尝试已过去 cooldown 秒。
+        每次运行开始时调用，返回放回的篇数
+        """
+        c = self.db.execute('''
+            UPDATE papers SET status = ?, updated_at = ?
+            WHERE status = ? AND attempts < ?
+              AND COALESCE((SELECT MAX(created_at) FROM attempts WHERE attempts.paper_id = papers.id), 0) <= ?
+        ''', (STATUS_PENDING, int(time.time()), STATUS_FAILED, max_attempts, int(time.time()) - cooldown))
+        self.db.commit()
+        return c.rowcount
+
+    def mark_doi_duplicates(self) -> int:
+        """同一 DOI 既有 arXiv 版本又有 Crossref 版本时，待下载的 Crossref 版本标记为重复，返回标记条数"""
+        c = self.db.execute('''
+            UPDATE papers SET status = ?, updated_at = ?
+            WHERE status = ? AND arxiv_id IS NULL AND doi IS NOT NULL
+              AND lower(doi) IN (SELECT lower(doi) FROM papers WHERE arxiv_id IS NOT NULL AND doi IS NOT NULL)
+        ''', (STATUS_DUPLICATE, int(time.time()), STATUS_PENDING))
+        self.db.commit()
+        return c.rowcount
+
+    def count(self, status: Optional[str] = None) -> int:
+        if status is None:
+            return self.db.execute('SELECT COUNT(*) FROM papers').fetchone()[0]
+        return self.db.execute('SELECT COUNT(*) FROM papers WHERE status = ?', (status,)).fetchone()[0]
+
+    def record_attempt(self, pid: str, status: str, size: Optional[int] = None, error: Optional[str] = None,
+                       counted: bool = True):
+        """记录一次尝试；counted=False（如被限流）只记历史，不计入 papers.attempts 的失败次数"""
+        now = int(time.time())
+        c = self.db.cursor()
+        c.execute(
+            'INSERT INTO attempts (paper_id, status, bytes, error, created_at) VALUES (?, ?, ?, ?, ?)',
+            (pid, status, size, error, now)
+        )
+        if counted:
+            c.execute('UPDATE papers SET attempts = attempts + 1, updated_at = ? WHERE id = ?', (now, pid))
+        self.db.commit()
+
+    def set_status(self, pid: str, status: str):
+        self.db.execute('UPDATE papers SET status = ?, updated_at = ? WHERE id = ?', (status, int(time.time()), pid))
+        self.db.commit()
+
+    def mark_downloaded(self, pid: str, path: str, sha256: str):
+        """sha256 由调用方计算（下载协程里放到线程中算，避免阻塞事件循环）"""
+        size = os.path.getsize(path)
+        self.db.execute(
+            'UPDATE papers SET status = ?, path = ?, bytes = ?, sha256 = ?, updated_at = ? WHERE id = ?',
+            (STATUS_DOWNLOADED, path, size, sha256, int(time.time()), pid)
+        )
+        self.db.commit()
+
+    # ---------- DOI -> OA 链接 ----------
+    def get_oa_lookup(self, doi: str, negative_ttl: Optional[int] = None) -> Tuple[bool, Optional[str]]:
+        """
+        返回 (是否查询过, PDF 链接)；查询过但没有 OA 版本时链接为 None。
+        negative_ttl 秒之前的“没查到”视为过期，需要重新查询
+        """
+        row = self.db.execute('SELECT pdf_url, resolved_at FROM oa_lookups WHERE doi = ?', (doi.lower(),)).fetchone()
+        if row is None:
+            return False, None
+        if row['pdf_url'] is None and negative_ttl is not None and row['resolved_at'] < time.time() - negative_ttl:
+            return False, None
+        return True, row['pdf_url']
+
+    def save_oa_lookup(self, doi: str, pdf_url: Optional[str]):
+        self.db.execute(
+            'INSERT OR REPLACE INTO oa_lookups (doi, pdf_url, resolved_at) VALUES (?, ?, ?)',
+            (doi.lower(), pdf_url, int(time.time()))
+        )
+        self.db.commit()
+
+    # ---------- 元数据检索进度 ----------
+    def get_harvest_cursor(self, source: str, query: str, max_age: Optional[int] = None) -> Optional[Tuple[str, int, bool]]:
+        """
+        返回上次中断时保存的 (cursor, 已获取条数, 是否已完成)，没有记录返回 None。
+        未完成且超过 max_age 秒的 cursor 视为已失效（Crossref 的 cursor 几分钟不用就会过期）
+        """
+        row = self.db.execute(
+            'SELECT cursor, fetched, done, updated_at FROM harvest_cursors WHERE source = ? AND query = ?',
+            (source, query)
+        ).fetchone()
+        if row is None:
+            return None
+        if not row['done'] and max_age is not None and row['updated_at'] < time.time() - max_age:
+            return None
+        return row['cursor'], row['fetched'], bool(row['done'])
+
+    def save_harvest_cursor(self, source: str, query: str, cursor: Optional[str], fetched: int, done: bool):
+        self.db.execute(
+            'INSERT OR REPLACE INTO harvest_cursors (source, query, cursor, fetched, done, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (source, query, cursor, fetched, int(done), int(time.time()))
+        )
+        self.db.commit()
+
+    def clear_harvest_cursors(self, source: str):
+        """一轮检索完整结束后清掉进度，下次检索从头开始"""
+        self.db.execute('DELETE FROM harvest_cursors WHERE source = ?', (source,))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
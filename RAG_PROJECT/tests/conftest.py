@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试直接导入 RAG_PROJECT 下的模块（和 python -m 运行时一样以项目目录为根）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
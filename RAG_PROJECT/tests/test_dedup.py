@@ -0,0 +1,50 @@
+import random
+
+from langchain_core.documents import Document
+
+from documents.dedup import NearDuplicateFilter, clear_dedup_index
+
+WORDS = ("attention transformer retrieval embedding gradient encoder decoder benchmark dataset policy reward "
+         "graph node edge token layer residual dropout optimizer latency").split()
+
+
+def _paper(seed: int, revised: bool = False):
+    """模拟 Unstructured 解析出的元素；revised 是同一论文的另一个版本（改了几个词）"""
+    rng = random.Random(seed)
+    paragraphs = [" ".join(rng.choice(WORDS) for _ in range(120)) for _ in range(12)]
+    if revised:
+        paragraphs[0] = paragraphs[0].replace("attention", "self-attention", 2)
+    return [Document(page_content=p) for p in paragraphs]
+
+
+def _ingest(dedup: NearDuplicateFilter, key: str, elements):
+    """和 PDFPageChunkParser.iter_pdf_documents 相同的去重流程，返回写入的 chunk 数，重复论文返回 None"""
+    head_text, elements = dedup.split_head(elements)
+    if dedup.is_duplicate_paper(key, head_text) is not None:
+        return None
+    return sum(not dedup.is_duplicate_chunk(e.page_content) for e in elements)
+
+
+def test_near_duplicate_paper_in_a_later_run_is_skipped(tmp_path):
+    db_path = str(tmp_path / "dedup_index.db")
+    first_run = NearDuplicateFilter(db_path=db_path)
+    assert _ingest(first_run, "v1.pdf", _paper(1)) == 12
+    assert _ingest(first_run, "other.pdf", _paper(2)) == 12
+    first_run.store.close()
+
+    # 另一次运行（新进程）：同一论文的修订版应该按已收录的签名跳过
+    second_run = NearDuplicateFilter(db_path=db_path)
+    assert _ingest(second_run, "v2.pdf", _paper(1, revised=True)) is None
+    assert second_run.skipped_papers == 1
+    # 已收录 chunk 的指纹也在：重复段落不再写入
+    assert second_run.is_duplicate_chunk(_paper(2)[5].page_content)
+
+
+def test_clear_dedup_index_forgets_previous_runs(tmp_path):
+    db_path = str(tmp_path / "dedup_index.db")
+    first_run = NearDuplicateFilter(db_path=db_path)
+    _ingest(first_run, "v1.pdf", _paper(1))
+    first_run.store.close()
+
+    clear_dedup_index(db_path)
+    assert _ingest(NearDuplicateFilter(db_path=db_path), "v1.pdf", _paper(1)) == 12
@@ -0,0 +1,44 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai import ChatOpenAI
+
+from graph2.budget import track_llm_calls
+from llm_models.llm_gateway import GatewayChatOpenAI
+
+
+def test_coalesced_call_is_not_charged_to_the_request_budget(monkeypatch):
+    upstream_calls = []
+
+    def slow_generate(self, messages, stop=None, run_manager=None, **kwargs):
+        upstream_calls.append(messages)
+        time.sleep(0.3)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="yes"))])
+
+    monkeypatch.setattr(ChatOpenAI, "_generate", slow_generate)
+    llm = GatewayChatOpenAI(model="test", api_key="test", temperature=0)
+    counters = {}
+
+    def request(name: str, delay: float):
+        time.sleep(delay)
+        # 每个请求在自己的线程里有自己的计数器，和 app 里执行一轮对话时一样
+        with track_llm_calls() as counter:
+            llm.invoke("同一个问题", config={"callbacks": [counter]})
+        counters[name] = counter
+
+    threads = [threading.Thread(target=request, args=("leader", 0)),
+               threading.Thread(target=request, args=("follower", 0.1))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(upstream_calls) == 1
+    assert (counters["leader"].calls, counters["leader"].coalesced) == (1, 0)
+    assert (counters["follower"].calls, counters["follower"].coalesced) == (0, 1)
@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# install() 会替换 sys.modules，放到子进程里跑，不影响其他测试
+CHECK = """
+from loadtest import fakes
+fakes.install(num_docs=10)
+import app
+from utils.startup import all_ready, warm_up
+fakes.assert_no_real_resources()
+assert warm_up() and all_ready()
+app.preload_for_fork()
+assert len(app.bge_model.get().embed_query("q")) == fakes.FAKE_EMBEDDING_DIM
+"""
+
+
+def test_fakes_register_no_real_resources(tmp_path):
+    result = subprocess.run([sys.executable, "-c", CHECK], cwd=tmp_path, capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=os.pathsep.join(
+                                [PROJECT_DIR, os.environ.get("PYTHONPATH", "")])), timeout=120)
+    assert result.returncode == 0, result.stderr[-2000:]
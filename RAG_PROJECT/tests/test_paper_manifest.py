@@ -0,0 +1,43 @@
+import time
+
+from paper_manifest import PaperManifest, STATUS_DOWNLOADED, STATUS_FAILED, STATUS_PENDING
+
+PAPER = {'id': 'crossref_10.1000_x', 'doi': '10.1000/x', 'pdf_url': 'https://example.org/x.pdf'}
+
+
+def _fail(manifest, pid, attempts, at):
+    for _ in range(attempts):
+        manifest.record_attempt(pid, 'error', error='boom')
+    manifest.db.execute('UPDATE attempts SET created_at = ? WHERE paper_id = ?', (at, pid))
+    manifest.set_status(pid, STATUS_FAILED)
+
+
+def test_failed_paper_is_picked_up_on_next_run(tmp_path):
+    manifest = PaperManifest(str(tmp_path / 'manifest.db'))
+    manifest.add_paper(PAPER)
+    _fail(manifest, PAPER['id'], attempts=3, at=int(time.time()) - 3600)
+    assert manifest.pending_papers() == []
+
+    # 下一次运行开始时：冷却期已过、累计次数未到上限，放回待下载
+    assert manifest.requeue_failed(max_attempts=12, cooldown=600) == 1
+    assert [p['id'] for p in manifest.pending_papers()] == [PAPER['id']]
+    # 再次登记（重新检索到同一篇）不改变状态
+    manifest.add_paper(PAPER)
+    assert manifest.status_of(PAPER['id']) == STATUS_PENDING
+
+
+def test_failed_paper_waits_for_cooldown_and_respects_cap(tmp_path):
+    manifest = PaperManifest(str(tmp_path / 'manifest.db'))
+    recent = dict(PAPER, id='recent')
+    exhausted = dict(PAPER, id='exhausted')
+    done = dict(PAPER, id='done')
+    for paper in (recent, exhausted, done):
+        manifest.add_paper(paper)
+    _fail(manifest, 'recent', attempts=3, at=int(time.time()))
+    _fail(manifest, 'exhausted', attempts=12, at=int(time.time()) - 86400)
+    manifest.set_status('done', STATUS_DOWNLOADED)
+
+    assert manifest.requeue_failed(max_attempts=12, cooldown=600) == 0
+    assert manifest.status_of('recent') == STATUS_FAILED
+    assert manifest.status_of('exhausted') == STATUS_FAILED
+    assert manifest.status_of('done') == STATUS_DOWNLOADED
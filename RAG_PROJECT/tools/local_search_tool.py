@@ -0,0 +1,52 @@
+"""
+本地替身搜索工具：接口和 TavilySearchResults 一致（invoke({"query": ...}) 返回 [{"url", "content"}]），
+从本地 JSONL 语料（每行 {"url": ..., "content": ...}）里按词重叠检索，不访问网络。
+用于离线调试、验证缓存命中等场景；设置 WEB_SEARCH_BACKEND=local 时 all_llm 使用它。
+
+    python -m tools.local_search_tool corpus.jsonl "transformer attention"
+"""
+import json
+import re
+import sys
+import threading
+from typing import List, Optional
+
+
+def _terms(text: str) -> set:
+    # 英文按单词，中文按单字
+    return set(re.findall(r"[a-z0-9]+|[一-鿿]", text.lower()))
+
+
+class LocalSearchTool:
+    def __init__(self, records: Optional[List[dict]] = None, max_results: int = 2):
+        self.records = records or []
+        self.max_results = max_results
+        self.calls = 0  # 实际执行的搜索次数，方便核对缓存是否生效
+        self._lock = threading.Lock()
+        self._record_terms = [_terms(r["content"]) for r in self.records]
+
+    @classmethod
+    def from_jsonl(cls, path: str, max_results: int = 2) -> "LocalSearchTool":
+        records = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+        return cls(records, max_results=max_results)
+
+    def invoke(self, tool_input: dict, config=None) -> List[dict]:
+        with self._lock:
+            self.calls += 1
+        query_terms = _terms(tool_input["query"])
+        scored = sorted(
+            ((len(query_terms & terms), i) for i, terms in enumerate(self._record_terms)),
+            key=lambda x: (-x[0], x[1])
+        )
+        return [{"url": self.records[i].get("url", f"local://{i}"), "content": self.records[i]["content"]}
+                for score, i in scored[:self.max_results] if score > 0]
+
+
+if __name__ == '__main__':
+    tool = LocalSearchTool.from_jsonl(sys.argv[1])
+    for result in tool.invoke({"query": " ".join(sys.argv[2:])}):
+        print(result["url"], result["content"][:200])
@@ -1,18 +1,42 @@
+from typing import List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from langchain_core.tools import create_retriever_tool
-from documents.milvus_db import MilvusVectorSave
-
-mv = MilvusVectorSave()
-mv.create_connection()
-retriever = mv.vector_store_saved.as_retriever(
-    search_type='similarity',  # 仅返回相似度超过阈值的文档
-    search_kwargs={
-        "k": 6,
-        "score_threshold": 0.2,
-        "ranker_type": "rrf",
-        "ranker_params": {"k": 60},
-        'filter': {"category": "content"}
-    }
-)
+
+from llm_models.embeddings_model import bge_query_embedding
+from utils.startup import LazyResource
+
+
+def _connect_milvus() -> BaseRetriever:
+    from documents.milvus_db import MilvusVectorSave
+
+    mv = MilvusVectorSave()
+    mv.create_connection(bge_query_embedding)  # 查询向量走微批量 embedding
+    return mv.vector_store_saved.as_retriever(
+        search_type='similarity',  # 仅返回相似度超过阈值的文档
+        search_kwargs={
+            "k": 6,
+            "score_threshold": 0.2,
+            "ranker_type": "rrf",
+            "ranker_params": {"k": 60},
+            'filter': {"category": "content"}
+        }
+    )
+
+
+milvus_retriever = LazyResource("milvus_retriever", _connect_milvus)
+
+
+class LazyRetriever(BaseRetriever):
+    """导入时不连接 Milvus，第一次检索（或 warm_up）时才连接；连接失败时下次检索会重试"""
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return milvus_retriever.get().invoke(query, config={"callbacks": run_manager.get_child()})
+
+
+retriever = LazyRetriever()
 
 
 retriever_tool = create_retriever_tool(
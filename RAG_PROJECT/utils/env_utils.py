@@ -6,7 +6,21 @@ load_dotenv(override=True)
 
 LLM_API_KEY = os.getenv('LLM_API_KEY')
 TAVILY_API_KEY = os.getenv('TAVILY_API_KEY')
+# 网络搜索后端：tavily，或 local（tools/local_search_tool.py，读 LOCAL_SEARCH_CORPUS 指向的 JSONL，不访问网络）
+WEB_SEARCH_BACKEND = os.getenv('WEB_SEARCH_BACKEND', 'tavily')
+LOCAL_SEARCH_CORPUS = os.getenv('LOCAL_SEARCH_CORPUS', 'local_search_corpus.jsonl')
+# bge 推理后端：torch（HuggingFaceEmbeddings）、onnx、onnx-int8（llm_models/onnx_embeddings.py）
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+# 每个进程同时执行工作流的线程数（app.py 的对话任务队列），推测式检索的线程池按它确定大小
+CHAT_WORKERS = int(os.getenv('CHAT_WORKERS', '4'))
 
 MILVUS_URI = 'http://150.158.55.76:19530'
 
 COLLECTION_NAME = 't_collection01'
+
+# Milvus 使用的对象存储（bulk import 需要把文件上传到 Milvus 能读到的 bucket）
+MINIO_ENDPOINT = os.getenv('MINIO_ENDPOINT', '150.158.55.76:9000')
+# 访问密钥不设默认值，只从环境变量 / .env 读取
+MINIO_ACCESS_KEY = os.getenv('MINIO_ACCESS_KEY')
+MINIO_SECRET_KEY = os.getenv('MINIO_SECRET_KEY')
+MINIO_BUCKET = os.getenv('MINIO_BUCKET', 'a-bucket')
@@ -0,0 +1,75 @@
+"""
+进程内存报告：RSS 会把和其他进程共享的页也算进去，多 worker 时要看 USS（独占）和 PSS（共享页按进程数均摊）
+才能判断写时复制共享是否生效、一个容器能放几个 worker。
+
+    python -m utils.memory_report <gunicorn 主进程 pid>             # 打印主进程和每个 worker 的内存
+    python -m utils.memory_report <pid> --interval 30              # 每 30 秒打印一次
+"""
+import argparse
+import os
+import time
+from typing import List, Optional
+
+import psutil
+
+from utils.log_utils import log
+
+MB = 1024 * 1024
+
+
+def process_memory(pid: Optional[int] = None) -> dict:
+    proc = psutil.Process(pid or os.getpid())
+    try:
+        info = proc.memory_full_info()  # Linux 上有 uss / pss，需要读 /proc/<pid>/smaps
+    except (psutil.AccessDenied, AttributeError):
+        info = proc.memory_info()
+    rss = info.rss
+    uss = getattr(info, "uss", None)
+    pss = getattr(info, "pss", None)
+    return {
+        "pid": proc.pid,
+        "rss_mb": round(rss / MB, 1),
+        "uss_mb": round(uss / MB, 1) if uss is not None else None,
+        "pss_mb": round(pss / MB, 1) if pss is not None else None,
+        "shared_mb": round((rss - uss) / MB, 1) if uss is not None else None,
+    }
+
+
+def gunicorn_memory(master_pid: int) -> dict:
+    """主进程和所有 worker 的内存；total_pss_mb 是这组进程实际占用的物理内存"""
+    master = psutil.Process(master_pid)
+    workers: List[dict] = []
+    for child in master.children():
+        try:
+            workers.append(process_memory(child.pid))
+        except psutil.NoSuchProcess:
+            continue
+    report = {"master": process_memory(master_pid), "workers": workers}
+    pss = [p["pss_mb"] for p in [report["master"]] + workers]
+    report["total_pss_mb"] = round(sum(pss), 1) if None not in pss else None
+    report["total_rss_mb"] = round(sum(p["rss_mb"] for p in [report["master"]] + workers), 1)
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{'process':<16}{'pid':>8}{'rss(MB)':>10}{'pss(MB)':>10}{'uss(MB)':>10}{'shared(MB)':>12}"]
+    def fmt(value) -> str:
+        return "-" if value is None else str(value)
+
+    for name, p in [("master", report["master"])] + [(f"worker-{i}", w) for i, w in enumerate(report["workers"])]:
+        lines.append(f"{name:<16}{p['pid']:>8}{p['rss_mb']:>10}{fmt(p['pss_mb']):>10}"
+                     f"{fmt(p['uss_mb']):>10}{fmt(p['shared_mb']):>12}")
+    lines.append(f"合计 RSS {report['total_rss_mb']} MB，实际占用(PSS) {report['total_pss_mb']} MB")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="gunicorn 主进程和各 worker 的内存")
+    parser.add_argument("master_pid", type=int)
+    parser.add_argument("--interval", type=float, default=0, help="大于 0 时按间隔持续打印")
+    args = parser.parse_args()
+    while True:
+        log.info("\n" + format_report(gunicorn_memory(args.master_pid)))
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import psutil
+from langchain_core.embeddings import Embeddings
+
+
+class _Frame:
+    __slots__ = ("key", "items", "wall_start", "cpu_start", "child_wall", "child_cpu")
+
+    def __init__(self, key: Tuple[str, str], items: int = 0):
+        self.key = key
+        self.items = items  # 可在阶段执行中途更新
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.child_wall = 0.0
+        self.child_cpu = 0.0
+
+
+class StageStats:
+    """某个阶段在某个文件上的累计数据，时间均为扣除嵌套子阶段后的独占时间"""
+
+    __slots__ = ("wall", "cpu", "items", "calls", "peak_rss")
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.items = 0
+        self.calls = 0
+        self.peak_rss = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "wall_seconds": round(self.wall, 4),
+            "cpu_seconds": round(self.cpu, 4),
+            "items": self.items,
+            "calls": self.calls,
+            "peak_rss_mb": round(self.peak_rss / 1024 / 1024, 1),
+            "items_per_sec": round(self.items / self.wall, 2) if self.wall > 0 else None,
+        }
+
+
+class StageProfiler:
+    """
+    入库流水线的分阶段性能记录：每个 (阶段, 文件) 记录 wall/CPU 时间、处理条数和阶段内的峰值 RSS。
+    阶段可以嵌套（例如 insert 内部调用 bge_embedding），外层阶段只统计自身独占的时间。
+    流式的生成器阶段用 iterate() 包装，对每次 next() 计时。
+    阶段栈不区分线程，一个 profiler 只在一个线程（入库的一个进程）里使用。
+    """
+
+    def __init__(self, name: str, sample_interval: float = 0.05):
+        self.name = name
+        self.stats: Dict[Tuple[str, str], StageStats] = {}
+        self._stack: List[_Frame] = []
+        self._lock = threading.Lock()
+        self._process = psutil.Process(os.getpid())
+        self._sample_interval = sample_interval
+        self._sampler: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self.started_at = time.perf_counter()
+
+    def _get(self, key: Tuple[str, str]) -> StageStats:
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = StageStats()
+        return stats
+
+    def _sample_rss(self):
+        while not self._stopped.wait(self._sample_interval):
+            rss = self._process.memory_info().rss
+            with self._lock:
+                if self._stack:
+                    stats = self._get(self._stack[-1].key)
+                    stats.peak_rss = max(stats.peak_rss, rss)
+
+    def _ensure_sampler(self):
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample_rss, name="rss-sampler", daemon=True)
+            self._sampler.start()
+
+    def _enter(self, key: Tuple[str, str], items: int = 0) -> _Frame:
+        self._ensure_sampler()
+        frame = _Frame(key, items)
+        rss = self._process.memory_info().rss
+        with self._lock:
+            self._stack.append(frame)
+            stats = self._get(key)
+            stats.peak_rss = max(stats.peak_rss, rss)
+        return frame
+
+    def _exit(self, frame: _Frame):
+        wall = time.perf_counter() - frame.wall_start
+        cpu = time.process_time() - frame.cpu_start
+        with self._lock:
+            self._stack.pop()
+            stats = self._get(frame.key)
+            stats.wall += wall - frame.child_wall
+            stats.cpu += cpu - frame.child_cpu
+            stats.items += frame.items
+            stats.calls += 1
+            if self._stack:
+                self._stack[-1].child_wall += wall
+                self._stack[-1].child_cpu += cpu
+
+    @contextmanager
+    def stage(self, stage: str, file: Optional[str] = None, items: int = 0):
+        """记录一段同步代码；处理条数可以进入时传 items，也可以在代码块里设置 frame.items"""
+        frame = self._enter((stage, file or "*"), items)
+        try:
+            yield frame
+        finally:
+            self._exit(frame)
+
+    def iterate(self, stage: str, iterable: Iterable, file: Optional[str] = None) -> Iterator:
+        """包装一个（可能是惰性的）迭代器，每产出一个元素计 1 条"""
+        iterator = iter(iterable)
+        key = (stage, file or "*")
+        while True:
+            frame = self._enter(key)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._exit(frame)
+                return
+            except BaseException:
+                self._exit(frame)
+                raise
+            frame.items = 1
+            self._exit(frame)
+            yield item
+
+    def wrap_embeddings(self, embeddings: Embeddings, stage: str) -> Embeddings:
+        return ProfiledEmbeddings(embeddings, self, stage)
+
+    def close(self):
+        self._stopped.set()
+
+    def totals(self) -> Dict[str, StageStats]:
+        """按阶段汇总所有文件"""
+        totals: Dict[str, StageStats] = {}
+        for (stage, _), stats in self.stats.items():
+            total = totals.setdefault(stage, StageStats())
+            total.wall += stats.wall
+            total.cpu += stats.cpu
+            total.items += stats.items
+            total.calls += stats.calls
+            total.peak_rss = max(total.peak_rss, stats.peak_rss)
+        return totals
+
+    def to_dict(self) -> dict:
+        per_file: Dict[str, Dict[str, dict]] = {}
+        for (stage, file), stats in self.stats.items():
+            per_file.setdefault(file, {})[stage] = stats.to_dict()
+        return {
+            "name": self.name,
+            "elapsed_seconds": round(time.perf_counter() - self.started_at, 4),
+            "stages": {stage: stats.to_dict() for stage, stats in self.totals().items()},
+            "files": per_file,
+        }
+
+    def summary(self) -> str:
+        lines = [f"[{self.name}] 分阶段耗时汇总",
+                 f"{'stage':<20}{'wall(s)':>10}{'cpu(s)':>10}{'items':>10}{'items/s':>10}{'peak RSS(MB)':>14}"]
+        for stage, stats in sorted(self.totals().items(), key=lambda kv: -kv[1].wall):
+            d = stats.to_dict()
+            lines.append(f"{stage:<20}{d['wall_seconds']:>10.2f}{d['cpu_seconds']:>10.2f}{d['items']:>10}"
+                         f"{d['items_per_sec'] or 0:>10.1f}{d['peak_rss_mb']:>14.1f}")
+        return "\n".join(lines)
+
+    def dump_json(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+class ProfiledEmbeddings(Embeddings):
+    """给 Embeddings 套一层计时，可以直接替换传给 Milvus/SemanticChunker 的 embedding 对象"""
+
+    def __init__(self, inner: Embeddings, profiler: StageProfiler, stage: str):
+        self.inner = inner
+        self.profiler = profiler
+        self.stage = stage
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.profiler.stage(self.stage, items=len(texts)):
+            return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self.profiler.stage(self.stage, items=1):
+            return self.inner.embed_query(text)
@@ -0,0 +1,113 @@
+"""
+启动过程：重量级资源（embedding 模型、Milvus 连接等）用 LazyResource 包装，导入模块时不再初始化，
+第一次使用或显式 warm_up() 时才创建；startup_phase 记录启动各阶段耗时。
+/readyz 用 startup_report() 展示每个资源是否就绪、初始化耗时和失败原因。
+
+    python -m utils.startup      # 打印导入 app 和预热各资源的耗时分解
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Generic, Iterator, List, Optional, Tuple, TypeVar
+
+from utils.log_utils import log
+
+T = TypeVar("T")
+
+_process_start = time.perf_counter()
+_phases: List[Tuple[str, float]] = []
+_resources: Dict[str, "LazyResource"] = {}
+
+
+@contextmanager
+def startup_phase(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, time.perf_counter() - start))
+
+
+class LazyResource(Generic[T]):
+    """
+    线程安全的延迟初始化：第一次 get() 时调用 factory，并发的调用等同一次初始化完成。
+    初始化失败不缓存，下次 get() 会重试（例如 Milvus 暂时连不上）
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self._factory = factory
+        self._value: Optional[T] = None
+        self._ready = False
+        self._lock = threading.Lock()
+        self.init_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        _resources[name] = self
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def get(self) -> T:
+        if self._ready:
+            return self._value
+        with self._lock:
+            if not self._ready:
+                start = time.perf_counter()
+                try:
+                    self._value = self._factory()
+                except Exception as e:
+                    self.error = repr(e)
+                    log.warning(f"资源 {self.name} 初始化失败: {e!r}")
+                    raise
+                self.init_seconds = time.perf_counter() - start
+                self.error = None
+                self._ready = True
+                log.info(f"资源 {self.name} 初始化完成，耗时 {self.init_seconds:.2f}s")
+        return self._value
+
+    def status(self) -> dict:
+        return {
+            "ready": self._ready,
+            "init_seconds": round(self.init_seconds, 3) if self.init_seconds is not None else None,
+            "error": self.error,
+        }
+
+
+def warm_up() -> bool:
+    """按注册顺序初始化所有资源，返回是否全部就绪；失败的资源记录原因，不抛异常"""
+    for resource in list(_resources.values()):
+        if resource.ready:
+            continue
+        try:
+            with startup_phase(f"warm_up:{resource.name}"):
+                resource.get()
+        except Exception:
+            pass
+    return all_ready()
+
+
+def all_ready() -> bool:
+    return all(r.ready for r in _resources.values())
+
+
+def startup_report() -> dict:
+    return {
+        "uptime_seconds": round(time.perf_counter() - _process_start, 3),
+        "phases": [{"name": name, "seconds": round(seconds, 3)} for name, seconds in _phases],
+        "resources": {name: r.status() for name, r in _resources.items()},
+    }
+
+
+if __name__ == '__main__':
+    # 以 -m 运行时本文件是 __main__，要用 app 导入的同一个 utils.startup 模块里的注册表
+    from utils import startup
+
+    with startup.startup_phase("import app"):
+        import app  # noqa: F401
+    startup.warm_up()
+    report = startup.startup_report()
+    for phase in report["phases"]:
+        log.info(f"{phase['name']:<40}{phase['seconds']:>8.2f}s")
+    for name, status in report["resources"].items():
+        log.info(f"{name:<40}{'就绪' if status['ready'] else '未就绪'} {status['error'] or ''}")
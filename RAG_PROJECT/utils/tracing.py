@@ -0,0 +1,277 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from utils.log_utils import log
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+LOOP_BUCKETS = (0, 1, 2, 3, 5)
+LOOP_COUNTERS = ("transform_count", "generate_retry_count", "web_search_count")
+CHAIN_TAG_PREFIX = "chain:"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Prometheus 风格的累计直方图，le 为各桶上界"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """进程内的计数器和直方图，render() 输出 Prometheus 文本格式，供 /api/metrics 抓取"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def counter(self, name: str, doc: str):
+        self._help[name] = ("counter", doc)
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, doc: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self._help[name] = ("histogram", doc)
+        self._histograms.setdefault(name, {})
+        self._buckets[name] = buckets
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms[name]
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(self._buckets[name])
+            hist.observe(value)
+
+    @staticmethod
+    def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(labels) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, doc) in self._help.items():
+                lines.append(f"# HELP {name} {doc}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for labels, value in self._counters[name].items():
+                        lines.append(f"{name}{self._fmt_labels(labels)} {value:g}")
+                    continue
+                for labels, hist in self._histograms[name].items():
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets + (float("inf"),), hist.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{name}_bucket{self._fmt_labels(labels, ('le', le))} {cumulative}")
+                    lines.append(f"{name}_sum{self._fmt_labels(labels)} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{self._fmt_labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.histogram("rag_request_seconds", "一次对话请求的总耗时")
+metrics.counter("rag_requests_total", "对话请求数")
+metrics.histogram("rag_node_seconds", "工作流节点/条件边的耗时")
+metrics.histogram("rag_llm_call_seconds", "单次 LLM 调用耗时，按所属 chain 区分")
+metrics.counter("rag_llm_tokens_total", "LLM 输入/输出 token 数")
+metrics.counter("rag_llm_errors_total", "LLM 调用失败次数")
+metrics.histogram("rag_loop_count", "每个请求结束时的重试/循环计数", LOOP_BUCKETS)
+
+
+class Span:
+    __slots__ = ("name", "kind", "start", "duration", "attrs")
+
+    def __init__(self, name: str, kind: str, start: float, duration: float, attrs: Optional[dict] = None):
+        self.name = name
+        self.kind = kind
+        self.start = start
+        self.duration = duration
+        self.attrs = attrs or {}
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "kind": self.kind, "start": round(self.start, 4),
+                "duration": round(self.duration, 4), **self.attrs}
+
+
+class RequestTrace:
+    """一次对话请求的全部 span（节点、条件边、LLM 调用）和循环计数；节点可能在线程池里执行，追加时加锁"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.spans: List[Span] = []
+        self.loop_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, kind: str, start: float, attrs: Optional[dict] = None):
+        span = Span(name, kind, start - self.started_at, time.perf_counter() - start, attrs)
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "elapsed": round(time.perf_counter() - self.started_at, 4),
+            "loop_counts": self.loop_counts,
+            "spans": [span.to_dict() for span in sorted(self.spans, key=lambda s: s.start)],
+        }
+
+    def summary(self) -> str:
+        parts = [f"{s.kind}:{s.name}={s.duration:.2f}s" for s in sorted(self.spans, key=lambda s: s.start)]
+        return f"[trace] {self.name} 总耗时={time.perf_counter() - self.started_at:.2f}s " + " ".join(parts)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("rag_current_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace(name: str = "chat") -> Iterator[RequestTrace]:
+    """在请求处理期间设置当前 trace，结束时把总耗时、循环计数记入 metrics 并打印分解"""
+    trace = RequestTrace(name)
+    token = _current_trace.set(trace)
+    status = "ok"
+    try:
+        yield trace
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _current_trace.reset(token)
+        metrics.observe("rag_request_seconds", time.perf_counter() - trace.started_at, status=status)
+        metrics.inc("rag_requests_total", status=status)
+        for counter in LOOP_COUNTERS:
+            metrics.observe("rag_loop_count", trace.loop_counts.get(counter, 0), counter=counter)
+        log.info(trace.summary())
+
+
+def traced(name: str, kind: str = "node"):
+    """
+    包装工作流的节点/条件边函数：记录耗时 span，节点返回的状态里有循环计数时顺便记下。
+    不在 trace 中（如命令行 run_chat）时只记 metrics
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(state, *args, **kwargs):
+            start = time.perf_counter()
+            error = None
+            result = None
+            try:
+                result = func(state, *args, **kwargs)
+                return result
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                metrics.observe("rag_node_seconds", time.perf_counter() - start, node=name, kind=kind)
+                trace = _current_trace.get()
+                if trace is not None:
+                    attrs = {"error": error} if error else {}
+                    if kind == "edge" and isinstance(result, str):
+                        attrs["decision"] = result
+                    trace.add_span(name, kind, start, attrs)
+                    if isinstance(result, dict):
+                        trace.loop_counts.update((k, result[k]) for k in LOOP_COUNTERS if k in result)
+
+        return wrapper
+
+    return decorator
+
+
+def chain_name_from_tags(tags: Optional[List[str]], metadata: Optional[Dict[str, Any]] = None) -> str:
+    """嵌套的 chain 会继承外层的 tag，取最后（最内层）的一个；没有 chain tag 时退回 LangGraph 节点名"""
+    for tag in reversed(tags or []):
+        if tag.startswith(CHAIN_TAG_PREFIX):
+            return tag[len(CHAIN_TAG_PREFIX):]
+    return (metadata or {}).get("langgraph_node") or "unknown"
+
+
+def chain_config(name: str) -> dict:
+    """给 chain.with_config(**chain_config(...)) 用，LLM 调用的 span 通过继承的 tag 知道自己属于哪个 chain"""
+    return {"run_name": name, "tags": [f"{CHAIN_TAG_PREFIX}{name}"]}
+
+
+class LLMTraceHandler(BaseCallbackHandler):
+    """
+    LangChain 回调：每次 LLM 调用记录一个 span（chain 名、输入/输出 token、耗时）。
+    放进 graph.stream 的 config["callbacks"]，节点内部 invoke 的 chain 会继承
+    """
+
+    def __init__(self, trace: Optional[RequestTrace] = None):
+        self.trace = trace
+        self._runs: Dict[UUID, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, tags, metadata):
+        with self._lock:
+            self._runs[run_id] = (chain_name_from_tags(tags, metadata), time.perf_counter())
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, tags=None, metadata=None, **kwargs):
+        self._start(run_id, tags, metadata)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, tags=None, metadata=None, **kwargs):
+        self._start(run_id, tags, metadata)
+
+    @staticmethod
+    def _usage(response: LLMResult) -> Tuple[int, int]:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        with self._lock:
+            chain, start = self._runs.pop(run_id, ("unknown", time.perf_counter()))
+        input_tokens, output_tokens = self._usage(response)
+        metrics.observe("rag_llm_call_seconds", time.perf_counter() - start, chain=chain)
+        metrics.inc("rag_llm_tokens_total", input_tokens, chain=chain, direction="input")
+        metrics.inc("rag_llm_tokens_total", output_tokens, chain=chain, direction="output")
+        if self.trace is not None:
+            self.trace.add_span(chain, "llm", start, {"input_tokens": input_tokens, "output_tokens": output_tokens})
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        with self._lock:
+            chain, start = self._runs.pop(run_id, ("unknown", time.perf_counter()))
+        metrics.observe("rag_llm_call_seconds", time.perf_counter() - start, chain=chain)
+        metrics.inc("rag_llm_errors_total", chain=chain, error=type(error).__name__)
+        if self.trace is not None:
+            self.trace.add_span(chain, "llm", start, {"error": type(error).__name__})
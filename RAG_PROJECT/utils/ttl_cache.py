@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from utils.tracing import metrics
+
+metrics.counter("rag_cache_requests_total", "进程内 TTL 缓存的查询次数，result=hit/miss")
+metrics.counter("rag_cache_evictions_total", "TTL 缓存因容量上限被淘汰的条目数")
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    线程安全的进程内缓存：每个条目在 ttl 秒后过期，超过 max_entries 时淘汰最久未使用的。
+    命中/未命中按 name 记到 rag_cache_requests_total；ttl <= 0 时相当于关闭缓存
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 1024):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                value = entry[1]
+            else:
+                if entry is not None:
+                    del self._data[key]
+                value = _MISSING
+        metrics.inc("rag_cache_requests_total", cache=self.name, result="miss" if value is _MISSING else "hit")
+        return default if value is _MISSING else value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        evicted = 0
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                evicted += 1
+        if evicted:
+            metrics.inc("rag_cache_evictions_total", evicted, cache=self.name)
+
+    def get_or_set(self, key: Hashable, compute: Callable[[], Any], cache_if: Callable[[Any], bool] = bool) -> Any:
+        """未命中时调用 compute 并写入缓存；cache_if 为假的结果（默认空结果）不缓存"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = compute()
+        if cache_if(value):
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)